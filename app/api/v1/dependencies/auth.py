@@ -1,32 +1,28 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from sqlalchemy.orm import Session
-from core.config import settings
-from db.session import get_db
+from jose import JWTError
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.session import get_async_db
 from models.user import User
-from schemas.auth import TokenData
 from schemas.user import UserRole
+from services.auth import decode_access_token, get_principal
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/auth/token')
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        role: str = payload.get("role")  # Extract the role
-        if username is None or role is None:
+        token_data = decode_access_token(token)
+        if token_data.username is None or token_data.role is None:
             raise credentials_exception
-        token_data = TokenData(username=username, role=role)
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.username == token_data.username).first()
+    user = await get_principal(db, token_data.username)
     if user is None:
         raise credentials_exception
     return user
@@ -1,134 +1,580 @@
-import os
-from typing import List
-from fastapi import APIRouter, Depends, Query, UploadFile, HTTPException
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
-from db.session import get_db
-from schemas.file import FileDeleteResponse, FileSchema, FileUpdate, FileShare, FileAnalytics
-from services.file import ( delete_file_service, get_file_analytics_service, get_file_service, list_all_files_service, 
-                           share_file_link_service, upload_file_service,
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, BackgroundTasks, Body, Depends, File, Query, Request, UploadFile, HTTPException, status
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.session import get_async_db
+from schemas.file import (BatchUploadResponse, BulkDeleteResponse, BulkRenameResponse, FileBulkRename, FileFilter,
+                          FileIds, FileDeleteResponse, FilePage, FileSchema, FileSortField, FileUpdate, FileShare,
+                          FileShareCreate, FileAnalytics, SearchMode, SharePermission, SortOrder)
+from schemas.upload_session import UploadSessionCreate, UploadSessionSchema
+from services.compression import get_encoded_variant, is_compressible, negotiate_variant
+from services.file import ( archive_files_service, bulk_delete_files_service, bulk_rename_files_service, get_files_service,
+                           delete_file_service, get_file_analytics_service, get_file_service, list_all_files_service, 
+                           revoke_share_service, share_file_link_service, upload_batch_service, upload_file_service, upload_stream_service,
                              list_user_files_service, download_file_service,
-                            update_file_service )
+                            update_file_service, file_etag )
+from services.rendition import (RENDITION_CACHE_CONTROL, describe_content_rendition, describe_rendition,
+                                get_rendition, schedule_renditions)
+from services.share import verify_share_token
+from services.storage import open_stored_file, presigned_download_url
+from services.upload_session import (abort_upload_session_service, complete_upload_session_service,
+                                     create_upload_session_service, get_upload_session_service,
+                                     upload_chunk_service)
 from ..dependencies.auth import get_current_active_admin, get_current_user
 from models.user import User
 from core.config import settings
+from utils.file_response import build_file_response, content_disposition, http_date, not_modified
+from utils.zip_stream import stream_zip
 
 __all__ = [
     "upload_file",
+    "upload_file_raw",
+    "upload_files",
+    "create_upload_session",
+    "get_upload_session",
+    "upload_chunk",
+    "complete_upload_session",
+    "abort_upload_session",
     "list_user_files",
     "list_all_files",
     "get_file_analytics",
+    "get_system_file_analytics",
+    "bulk_delete_files",
+    "bulk_rename_files",
+    "get_files",
+    "download_archive",
+    "download_shared_file",
+    "get_shared_thumbnail",
     "get_file",
     "update_file",
     "delete_file",
     "share_file_link",
-    "download_file"
+    "revoke_share_link",
+    "revoke_share_links",
+    "download_file",
+    "get_thumbnail"
 ]
 
 router = APIRouter()
 
 
+# The response for a download that is sent compressed, or None to send it as it is
+async def _encoded_file_response(
+    request: Request, location: str, filename: str, media_type: str, file_size: int, etag: str, last_modified: datetime
+) -> Optional[Response]:
+    variant = negotiate_variant(
+        request.headers.get("accept-encoding"), "range" in request.headers, media_type, file_size, etag
+    )
+    if variant is None:
+        return None
+    headers = {
+        "etag": variant.etag,
+        "last-modified": http_date(last_modified),
+        "cache-control": "private, no-cache",
+        "vary": "Accept-Encoding",
+    }
+    if not_modified(request, variant.etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    path = await get_encoded_variant(location, variant)
+    headers["content-encoding"] = variant.encoding
+    return FileResponse(path, filename=filename, media_type=media_type, headers=headers)
+
+
+def _vary_headers(media_type: str, file_size: int) -> Optional[dict]:
+    return {"vary": "Accept-Encoding"} if is_compressible(media_type, file_size) else None
+
+
 @router.post("/upload", response_model=FileSchema)
 async def upload_file(
+    background_tasks: BackgroundTasks,
     file: UploadFile = UploadFile(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ) -> FileSchema:
     """
     Upload a new file.
 
+    The file is returned as soon as it is stored. Its content is then checked in the
+    background: its processing_status turns to ready, or to quarantined when the content
+    is flagged or is not of an accepted type, and quarantined files cannot be downloaded.
+
     Parameters:
+    - background_tasks (BackgroundTasks): Renders thumbnails after the response when eager rendering is on.
     - file (UploadFile): The file to be uploaded.
-    - db (Session): A database session.
+    - db (AsyncSession): A database session.
+    - current_user (User): The current user making the request.
+
+    Returns:
+    - FileSchema: The uploaded file with its metadata.
+    """
+    db_file = await upload_file_service(current_user.id, file, db)
+    schedule_renditions(background_tasks, [db_file])
+    return db_file
+
+
+@router.put("/upload/{filename}", response_model=FileSchema)
+async def upload_file_raw(
+    filename: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> FileSchema:
+    """
+    Upload a new file from the raw request body, skipping multipart parsing.
+
+    Parameters:
+    - filename (str): The name to store the file under.
+    - request (Request): The incoming request; its body is the file content and
+      its Content-Type header is the file type. An optional X-Content-SHA256 header
+      lets content the server already stores complete without being written again.
+    - background_tasks (BackgroundTasks): Renders thumbnails after the response when eager rendering is on.
+    - db (AsyncSession): A database session.
+    - current_user (User): The current user making the request.
+
+    Returns:
+    - FileSchema: The uploaded file with its metadata.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    content_length = request.headers.get("content-length")
+    db_file = await upload_stream_service(
+        current_user.id,
+        filename,
+        content_type,
+        request.stream(),
+        db,
+        content_length=int(content_length) if content_length and content_length.isdigit() else None,
+        expected_digest=request.headers.get("x-content-sha256")
+    )
+    schedule_renditions(background_tasks, [db_file])
+    return db_file
+
+
+@router.post("/upload/batch", response_model=BatchUploadResponse)
+async def upload_files(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> BatchUploadResponse:
+    """
+    Upload several files in one multipart request.
+
+    Parameters:
+    - background_tasks (BackgroundTasks): Renders thumbnails after the response when eager rendering is on.
+    - files (List[UploadFile]): The files to be uploaded, as repeated "files" parts.
+    - db (AsyncSession): A database session.
+    - current_user (User): The current user making the request.
+
+    Returns:
+    - BatchUploadResponse: A result per file, in request order, with the stored file's
+      metadata or the status code and detail of why it was rejected.
+    """
+    batch = await upload_batch_service(current_user.id, files, db)
+    schedule_renditions(background_tasks, [result.file for result in batch.results if result.file is not None])
+    return batch
+
+
+@router.post("/uploads", response_model=UploadSessionSchema, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    session_create: UploadSessionCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> UploadSessionSchema:
+    """
+    Start a resumable upload session.
+
+    Parameters:
+    - session_create (UploadSessionCreate): The name, type and total size of the file,
+      and optionally the chunk size to use.
+    - db (AsyncSession): A database session.
+    - current_user (User): The current user making the request.
+
+    Returns:
+    - UploadSessionSchema: The new session, including its id and chunk layout.
+    """
+    return await create_upload_session_service(current_user.id, session_create, db)
+
+
+@router.get("/uploads/{session_id}", response_model=UploadSessionSchema)
+async def get_upload_session(
+    session_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> UploadSessionSchema:
+    """
+    Get the state of an upload session, including the chunks received so far.
+
+    Parameters:
+    - session_id (str): The ID of the upload session.
+    - db (AsyncSession): A database session.
+    - current_user (User): The current user making the request.
+
+    Returns:
+    - UploadSessionSchema: The session. Chunk `i` covers the bytes starting at
+      offset `i * chunk_size`.
+    """
+    return await get_upload_session_service(session_id, current_user.id, db)
+
+
+@router.put("/uploads/{session_id}/chunks/{chunk_index}", response_model=UploadSessionSchema)
+async def upload_chunk(
+    session_id: str,
+    chunk_index: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> UploadSessionSchema:
+    """
+    Upload one chunk of a session from the raw request body.
+
+    Chunks may be sent in any order and in parallel. Every chunk except the last
+    must be exactly `chunk_size` bytes long.
+
+    Parameters:
+    - session_id (str): The ID of the upload session.
+    - chunk_index (int): The zero-based index of the chunk.
+    - request (Request): The incoming request; its body is the chunk content.
+    - db (AsyncSession): A database session.
+    - current_user (User): The current user making the request.
+
+    Returns:
+    - UploadSessionSchema: The updated session.
+    """
+    return await upload_chunk_service(session_id, chunk_index, current_user.id, request.stream(), db)
+
+
+@router.post("/uploads/{session_id}/complete", response_model=FileSchema)
+async def complete_upload_session(
+    session_id: str,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> FileSchema:
+    """
+    Finish an upload session once every chunk has been received.
+
+    Parameters:
+    - session_id (str): The ID of the upload session.
+    - background_tasks (BackgroundTasks): Renders thumbnails after the response when eager rendering is on.
+    - db (AsyncSession): A database session.
     - current_user (User): The current user making the request.
 
     Returns:
     - FileSchema: The uploaded file with its metadata.
     """
-    db_file = upload_file_service(current_user.id, file, db)
+    db_file = await complete_upload_session_service(session_id, current_user.id, db)
+    schedule_renditions(background_tasks, [db_file])
     return db_file
 
 
-@router.get("/files", response_model=List[FileSchema])
+@router.delete("/uploads/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload_session(
+    session_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> None:
+    """
+    Abort an upload session and discard the chunks received so far.
+
+    Parameters:
+    - session_id (str): The ID of the upload session.
+    - db (AsyncSession): A database session.
+    - current_user (User): The current user making the request.
+    """
+    await abort_upload_session_service(session_id, current_user.id, db)
+
+
+@router.get("/files", response_model=FilePage)
 async def list_user_files(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user),
     limit: int = Query(10, ge=1, le=100),
-    offset: int = Query(0, ge=0),
-    search: str = Query(None, description="Search term to filter files by filename")
-) -> List[FileSchema]:
+    cursor: Optional[str] = Query(None, description="The next_cursor of the previous page"),
+    search: str = Query(None, description="Search term to filter files by filename"),
+    match: SearchMode = Query(SearchMode.substring, description="How the search term is matched against filenames"),
+    sort: FileSortField = Query(FileSortField.date, description="Sort files by upload date, size or name"),
+    order: SortOrder = Query(SortOrder.asc)
+) -> FilePage:
     """
     List all files belonging to the current user.
 
     Parameters:
-    - db (Session): A database session.
+    - db (AsyncSession): A database session.
     - current_user (User): The current user making the request.
     - limit (int): The maximum number of files to return.
-    - offset (int): The index of the first file to return.
+    - cursor (str): The `next_cursor` returned with the previous page, if any.
     - search (str): A search term to filter files by filename.
+    - match (SearchMode): `substring` matches the term anywhere in the name, `prefix`
+      at its start, and `tokens` matches names containing every word of the term, in
+      any order.
+    - sort (FileSortField): The field to sort files by.
+    - order (SortOrder): The sort direction.
 
     Returns:
-    - List[FileSchema]: A list of files belonging to the current user.
+    - FilePage: A page of files belonging to the current user, and the cursor of
+      the next page if there is one.
     """
-    files = list_user_files_service(current_user.id, db, limit=limit, offset=offset, search=search)
+    files = await list_user_files_service(
+        current_user.id, db, limit=limit, cursor=cursor, search=search, sort=sort, order=order, match=match
+    )
     return files
 
 
 # Admin-specific endpoint
-@router.get("/admin", response_model=List[FileSchema])
+@router.get("/admin", response_model=FilePage)
 async def list_all_files(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_admin: User = Depends(get_current_active_admin),
     limit: int = Query(10, ge=1, le=100),
-    offset: int = Query(0, ge=0),
-    search: str = Query(None, description="Search term to filter files by filename")
-) -> List[FileSchema]:
+    cursor: Optional[str] = Query(None, description="The next_cursor of the previous page"),
+    search: str = Query(None, description="Search term to filter files by filename"),
+    match: SearchMode = Query(SearchMode.substring, description="How the search term is matched against filenames"),
+    sort: FileSortField = Query(FileSortField.date, description="Sort files by upload date, size or name"),
+    order: SortOrder = Query(SortOrder.asc)
+) -> FilePage:
     """
     List all files in the system.
 
     Parameters:
-    - db (Session): A database session.
+    - db (AsyncSession): A database session.
     - current_admin (User): The current admin making the request.
     - limit (int): The maximum number of files to return.
-    - offset (int): The index of the first file to return.
+    - cursor (str): The `next_cursor` returned with the previous page, if any.
     - search (str): A search term to filter files by filename.
+    - match (SearchMode): `substring` matches the term anywhere in the name, `prefix`
+      at its start, and `tokens` matches names containing every word of the term, in
+      any order.
+    - sort (FileSortField): The field to sort files by.
+    - order (SortOrder): The sort direction.
 
     Returns:
-    - List[FileSchema]: A list of all files in the system.
+    - FilePage: A page of files in the system, and the cursor of the next page
+      if there is one.
     """
-    files = list_all_files_service(db, limit=limit, offset=offset, search=search)
+    files = await list_all_files_service(
+        db, limit=limit, cursor=cursor, search=search, sort=sort, order=order, match=match
+    )
     return files
 
 
 
 @router.get("/analytics", response_model=FileAnalytics)
 async def get_file_analytics(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ) -> FileAnalytics:
     """
     Get file analytics for the current user.
 
     Parameters:
-    - db (Session): A database session.
+    - db (AsyncSession): A database session.
     - current_user (User): The current user making the request.
 
     Returns:
-    - FileAnalytics: File analytics data for the current user.
+    - FileAnalytics: File analytics data for the current user, broken down by file
+      type, with daily upload counts for the last 30 days.
     """
-    analytics = get_file_analytics_service(current_user.id, db)
+    analytics = await get_file_analytics_service(current_user.id, db)
     return {
         "total_files": analytics.total_files,
         "total_size": analytics.total_size,
-        "size_unit": analytics.total_size_with_unit
+        "size_unit": analytics.total_size_with_unit,
+        "by_type": analytics.by_type,
+        "daily_uploads": analytics.daily_uploads
     }
 
 
+@router.get("/admin/analytics", response_model=FileAnalytics)
+async def get_system_file_analytics(
+    db: AsyncSession = Depends(get_async_db),
+    current_admin: User = Depends(get_current_active_admin)
+) -> FileAnalytics:
+    """
+    Get file analytics aggregated over all users.
+
+    Parameters:
+    - db (AsyncSession): A database session.
+    - current_admin (User): The current admin making the request.
+
+    Returns:
+    - FileAnalytics: File analytics data for the whole system, broken down by file
+      type, with daily upload counts for the last 30 days.
+    """
+    analytics = await get_file_analytics_service(None, db)
+    return {
+        "total_files": analytics.total_files,
+        "total_size": analytics.total_size,
+        "size_unit": analytics.total_size_with_unit,
+        "by_type": analytics.by_type,
+        "daily_uploads": analytics.daily_uploads
+    }
+
+
+
+@router.post("/bulk/delete", response_model=BulkDeleteResponse)
+async def bulk_delete_files(
+    file_filter: FileFilter,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> BulkDeleteResponse:
+    """
+    Delete every file of the current user matching a filter.
+
+    Parameters:
+    - file_filter (FileFilter): Ids, file type, upload date range and name pattern; all
+      given criteria must match, and at least one is required.
+    - background_tasks (BackgroundTasks): Stored content is removed after the response.
+    - db (AsyncSession): A database session.
+    - current_user (User): The current user making the request.
+
+    Returns:
+    - BulkDeleteResponse: The number of files deleted.
+    """
+    return await bulk_delete_files_service(current_user.id, file_filter, db, background_tasks)
+
+
+@router.post("/bulk/rename", response_model=BulkRenameResponse)
+async def bulk_rename_files(
+    bulk_rename: FileBulkRename,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> BulkRenameResponse:
+    """
+    Rename every file of the current user matching a filter by replacing text in its name.
+
+    Parameters:
+    - bulk_rename (FileBulkRename): The filter, the text to find (case-sensitive) and its replacement.
+    - db (AsyncSession): A database session.
+    - current_user (User): The current user making the request.
+
+    Returns:
+    - BulkRenameResponse: The number of files renamed.
+    """
+    return await bulk_rename_files_service(current_user.id, bulk_rename, db)
+
+
+@router.post("/bulk/metadata", response_model=List[FileSchema])
+async def get_files(
+    file_ids: FileIds,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> List[FileSchema]:
+    """
+    Retrieve the metadata of several files by their IDs.
+
+    Parameters:
+    - file_ids (FileIds): The IDs of the files, at most 1000.
+    - db (AsyncSession): A database session.
+    - current_user (User): The current user making the request.
+
+    Returns:
+    - List[FileSchema]: The files the current user owns among the IDs, in ID order.
+    """
+    return await get_files_service(file_ids.ids, current_user.id, db)
+
+
+@router.get("/archive")
+async def download_archive(
+    ids: Optional[List[int]] = Query(None, description="Files to include; all of the user's files when omitted"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> StreamingResponse:
+    """
+    Download several files, or all of the current user's files, as one ZIP archive.
+
+    The archive is built while it is sent, without a temporary copy, so the download
+    starts at once. Formats that are compressed already (images, video, PDF, Office
+    Open XML) are stored as they are; everything else is deflated.
+
+    Parameters:
+    - ids (List[int], optional): The IDs of the files to include, as repeated "ids" parameters.
+    - db (AsyncSession): A database session.
+    - current_user (User): The current user making the request.
+
+    Returns:
+    - StreamingResponse: The ZIP archive.
+    """
+    entries = await archive_files_service(current_user.id, ids, db)
+    return StreamingResponse(
+        stream_zip(entries, open_stored_file),
+        media_type="application/zip",
+        headers={"content-disposition": content_disposition("files.zip")}
+    )
+
+
+@router.get("/public/{token}")
+async def download_shared_file(token: str, request: Request) -> Response:
+    """
+    Download a file through a share link, without authentication.
+
+    The link is checked on its own (signature, expiry, permission and revocation), without
+    a database query. Supports the same conditional requests, byte ranges and compression
+    as the owner's download, and redirects (307) to object storage in the same way.
+
+    Parameters:
+    - token (str): The signed token of the share link.
+    - request (Request): The incoming request, for its conditional and range headers.
+
+    Returns:
+    - Response: The file data, a part of it (206), a redirect to it (307), or 304 if the
+      client's copy is current.
+    """
+    share = verify_share_token(token, SharePermission.download)
+    encoded = await _encoded_file_response(
+        request, share.key, share.filename, share.media_type, share.file_size, share.etag, share.last_modified
+    )
+    if encoded is not None:
+        return encoded
+    url = presigned_download_url(share.key, share.filename, share.media_type)
+    if url is not None:
+        if not_modified(request, share.etag, share.last_modified):
+            return Response(status_code=304, headers={"etag": share.etag})
+        return RedirectResponse(url, status_code=307, headers={"cache-control": "no-store"})
+    return build_file_response(
+        request,
+        path=share.key,
+        filename=share.filename,
+        media_type=share.media_type,
+        etag=share.etag,
+        last_modified=share.last_modified,
+        extra_headers=_vary_headers(share.media_type, share.file_size)
+    )
+
+
+@router.get("/public/{token}/thumbnail")
+async def get_shared_thumbnail(
+    token: str,
+    request: Request,
+    size: int = Query(256, description="Longest side in pixels; one of the configured thumbnail sizes")
+) -> Response:
+    """
+    Download a thumbnail of an image through a share link that allows it, without
+    authentication or a database query.
+
+    Parameters:
+    - token (str): The signed token of the share link.
+    - request (Request): The incoming request, for its conditional headers.
+    - size (int): The longest side of the thumbnail in pixels.
+
+    Returns:
+    - Response: The thumbnail, or 304 if the client's copy is current.
+    """
+    share = verify_share_token(token, SharePermission.thumbnail)
+    rendition = describe_content_rendition(share.media_type, share.etag, size)
+    headers = {"etag": rendition.etag, "cache-control": RENDITION_CACHE_CONTROL}
+    if not_modified(request, rendition.etag, share.last_modified):
+        return Response(status_code=304, headers=headers)
+    path = await get_rendition(share.key, rendition)
+    return FileResponse(path, media_type=rendition.media_type, headers=headers)
+
 
 @router.get("/{file_id}", response_model=FileSchema)
 async def get_file(
     file_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ) -> FileSchema:
     """
@@ -136,13 +582,13 @@ async def get_file(
 
     Parameters:
     - file_id (int): The ID of the file to retrieve.
-    - db (Session): A database session.
+    - db (AsyncSession): A database session.
     - current_user (User): The current user making the request.
 
     Returns:
     - FileSchema: The specific file with its metadata.
     """
-    file = get_file_service(file_id, current_user.id, db)
+    file = await get_file_service(file_id, current_user.id, db)
     return file
 
 
@@ -151,7 +597,7 @@ async def get_file(
 async def update_file(
     file_id: int,
     file_update: FileUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ) -> FileSchema:
     """
@@ -160,13 +606,13 @@ async def update_file(
     Parameters:
     - file_id (int): The ID of the file to update.
     - file_update (FileUpdate): The updated metadata for the file.
-    - db (Session): A database session.
+    - db (AsyncSession): A database session.
     - current_user (User): The current user making the request.
 
     Returns:
     - FileSchema: The updated file with its metadata.
     """
-    updated_file = update_file_service(file_id, current_user.id, file_update, db)
+    updated_file = await update_file_service(file_id, current_user.id, file_update, db)
     return updated_file
 
 
@@ -174,7 +620,7 @@ async def update_file(
 @router.delete("/{file_id}", response_model=FileDeleteResponse)
 async def delete_file(
     file_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ) -> FileDeleteResponse:
     """
@@ -182,13 +628,13 @@ async def delete_file(
 
     Parameters:
     - file_id (int): The ID of the file to delete.
-    - db (Session): A database session.
+    - db (AsyncSession): A database session.
     - current_user (User): The current user making the request.
 
     Returns:
     - FileDeleteResponse: A message confirming the deletion of the file.
     """
-    deleted_file = delete_file_service(file_id, current_user.id, db)
+    deleted_file = await delete_file_service(file_id, current_user.id, db)
     return {
         "message": f"File '{deleted_file.filename}' has been successfully deleted.",
         "file": deleted_file
@@ -199,48 +645,150 @@ async def delete_file(
 @router.post("/{file_id}/share", response_model=FileShare)
 async def share_file_link(
     file_id: int,
-    db: Session = Depends(get_db),
+    share_create: FileShareCreate = Body(FileShareCreate()),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ) -> FileShare:
     """
     Generate a shareable link for a specific file by its ID.
 
+    Anyone with the link can use it without signing in, for what its permissions allow,
+    until it expires or is revoked. Deleting the file revokes its links.
+
     Parameters:
     - file_id (int): The ID of the file to generate a shareable link for.
-    - db (Session): A database session.
+    - share_create (FileShareCreate, optional): When the link expires and what it allows.
+    - db (AsyncSession): A database session.
     - current_user (User): The current user making the request.
 
     Returns:
-    - FileShare: A dictionary containing the shareable link and the file metadata.
+    - FileShare: The shareable link, its ID, expiry and permissions.
     """
     # Use the base URL from your settings or environment
     base_url = settings.BASE_URL  
-    share_link = share_file_link_service(file_id, current_user.id, db, base_url)
+    share_link = await share_file_link_service(file_id, current_user.id, db, base_url, share_create)
     return share_link
 
 
+@router.delete("/{file_id}/share/{share_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_share_link(
+    file_id: int,
+    share_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> None:
+    """
+    Revoke one share link of a file.
+
+    Parameters:
+    - file_id (int): The ID of the shared file.
+    - share_id (str): The ID of the link, as returned when it was created.
+    - db (AsyncSession): A database session.
+    - current_user (User): The current user making the request.
+    """
+    await revoke_share_service(file_id, current_user.id, share_id, db)
+
+
+@router.delete("/{file_id}/share", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_share_links(
+    file_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> None:
+    """
+    Revoke every share link of a file created so far.
+
+    Parameters:
+    - file_id (int): The ID of the shared file.
+    - db (AsyncSession): A database session.
+    - current_user (User): The current user making the request.
+    """
+    await revoke_share_service(file_id, current_user.id, None, db)
+
+
 
 @router.get("/shared/{file_id}")
 async def download_file(
     file_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)  # Enforce authentication
-) -> FileResponse:
+) -> Response:
     """
     Download a specific file by its ID.
 
+    Supports conditional requests (If-None-Match, If-Modified-Since) and byte
+    ranges (Range, If-Range), including multiple ranges in one request. When files
+    are kept in object storage, the response redirects (307) to a short-lived
+    presigned URL there, which serves the content and byte ranges itself.
+
+    Text and other compressible files are sent compressed when the client accepts it
+    (Accept-Encoding: gzip, or br and zstd where the server supports them). Requests
+    for byte ranges get the file as it is.
+
     Parameters:
     - file_id (int): The ID of the file to download.
-    - db (Session): A database session.
+    - request (Request): The incoming request, for its conditional and range headers.
+    - db (AsyncSession): A database session.
     - current_user (User): The current user making the request.
 
     Returns:
-    - FileResponse: A response containing the file data.
+    - Response: The file data, a part of it (206), a redirect to it (307), or 304 if the
+      client's copy is current.
+    """
+    file = await download_file_service(file_id, db, current_user.id)
+    encoded = await _encoded_file_response(
+        request, file.file_path, file.filename, file.file_type, file.file_size, file_etag(file), file.upload_date
+    )
+    if encoded is not None:
+        return encoded
+    url = presigned_download_url(file.file_path, file.filename, file.file_type)
+    if url is not None:
+        etag = file_etag(file)
+        if not_modified(request, etag, file.upload_date):
+            return Response(status_code=304, headers={"etag": etag})
+        # The URL expires, so the redirect must not be cached
+        return RedirectResponse(url, status_code=307, headers={"cache-control": "no-store"})
+    return build_file_response(
+        request,
+        path=file.file_path,
+        filename=file.filename,
+        media_type=file.file_type,
+        etag=file_etag(file),
+        last_modified=file.upload_date,
+        extra_headers=_vary_headers(file.file_type, file.file_size)
+    )
+
+
+@router.get("/{file_id}/thumbnail")
+async def get_thumbnail(
+    file_id: int,
+    request: Request,
+    size: int = Query(256, description="Longest side in pixels; one of the configured thumbnail sizes"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+) -> Response:
     """
-    file = download_file_service(file_id, db)
-    file_path = file.file_path
+    Download a scaled-down copy of an image (JPEG, PNG or the first frame of a GIF).
 
-    if not file_path or not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
+    Thumbnails are rendered on first request, or right after upload when eager rendering
+    is on, and cached on the server. They can be cached by the client for a day and are
+    revalidated with If-None-Match.
 
-    return FileResponse(path=file_path, filename=file.filename)
\ No newline at end of file
+    Parameters:
+    - file_id (int): The ID of the image file.
+    - request (Request): The incoming request, for its conditional headers.
+    - size (int): The longest side of the thumbnail in pixels.
+    - db (AsyncSession): A database session.
+    - current_user (User): The current user making the request.
+
+    Returns:
+    - Response: The thumbnail, or 304 if the client's copy is current.
+    """
+    file = await download_file_service(file_id, db, current_user.id)
+    rendition = describe_rendition(file, size)
+    headers = {"etag": rendition.etag, "cache-control": RENDITION_CACHE_CONTROL}
+    if not_modified(request, rendition.etag, file.upload_date):
+        return Response(status_code=304, headers=headers)
+    path = await get_rendition(file.file_path, rendition)
+    return FileResponse(path, media_type=rendition.media_type, headers=headers)
@@ -1,12 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from db.session import get_db
-from schemas.user import UserIn, UserUpdate, UserDeleteResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.session import get_async_db
+from schemas.user import UserIn, UserPage, UserUpdate, UserDeleteResponse
 from models.user import User
 from app.api.v1.dependencies.auth import get_current_user
 from services.user import update_user, delete_user_by_id, fetch_user, fetch_all_users
 from schemas.user import UserRole
-from typing import List, Optional
+from typing import Optional
 
 __all__ = ["users_router"]
 
@@ -34,14 +34,14 @@ def admin_only(current_user: User = Depends(get_current_user)):
 @router.get("/profile/", response_model=UserIn)
 async def read_user_profile(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Route to get the profile of the current user.
 
     Args:
         current_user (User): The current user object.
-        db (Session): The database session.
+        db (AsyncSession): The database session.
 
     Returns:
         UserIn: The profile of the current user.
@@ -53,7 +53,7 @@ async def read_user_profile(
 async def update_user_profile(
     user_update: UserUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Route to update the profile of the current user.
@@ -61,21 +61,21 @@ async def update_user_profile(
     Args:
         user_update (UserUpdate): The updated user data.
         current_user (User): The current user object.
-        db (Session): The database session.
+        db (AsyncSession): The database session.
 
     Returns:
         UserIn: The updated profile of the current user.
     """
-    updated_user = update_user(db, current_user, user_update)
+    updated_user = await update_user(db, current_user, user_update)
     return updated_user
 
 # Route to get all users (admin only) with pagination and search
-@router.get("/admin/users/", response_model=List[UserIn])
+@router.get("/admin/users/", response_model=UserPage)
 async def get_all_users(
     current_user: User = Depends(admin_only),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     limit: int = Query(10, ge=1, le=100),
-    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="The next_cursor of the previous page"),
     search: Optional[str] = Query(None, description="Search term to filter users by username or email")
 ):
     """
@@ -83,15 +83,16 @@ async def get_all_users(
 
     Args:
         current_user (User): The current user object.
-        db (Session): The database session.
+        db (AsyncSession): The database session.
         limit (int): The maximum number of users to return.
-        offset (int): The starting index for the users to return.
+        cursor (Optional[str]): The `next_cursor` returned with the previous page, if any.
         search (Optional[str]): The search term to filter users by username or email.
 
     Returns:
-        List[UserIn]: A list of user profiles matching the search criteria.
+        UserPage: A page of user profiles matching the search criteria, and the cursor
+        of the next page if there is one.
     """
-    users = fetch_all_users(db, limit=limit, offset=offset, search=search)
+    users = await fetch_all_users(db, limit=limit, cursor=cursor, search=search)
     return users
 
 # Route to get a user by ID (admin only)
@@ -99,7 +100,7 @@ async def get_all_users(
 async def get_user(
     user_id: int,
     current_user: User = Depends(admin_only),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Route to get a user by ID (admin only).
@@ -107,12 +108,12 @@ async def get_user(
     Args:
         user_id (int): The ID of the user to retrieve.
         current_user (User): The current user object.
-        db (Session): The database session.
+        db (AsyncSession): The database session.
 
     Returns:
         UserIn: The profile of the user with the given ID.
     """
-    user = fetch_user(db, user_id)
+    user = await fetch_user(db, user_id)
     return user
 
 # Route to delete a user by ID (admin only)
@@ -120,7 +121,7 @@ async def get_user(
 async def delete_user(
     user_id: int,
     current_user: User = Depends(admin_only),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Route to delete a user by ID (admin only).
@@ -128,12 +129,12 @@ async def delete_user(
     Args:
         user_id (int): The ID of the user to delete.
         current_user (User): The current user object.
-        db (Session): The database session.
+        db (AsyncSession): The database session.
 
     Returns:
         UserDeleteResponse: A dictionary containing the deleted user and a message.
     """
-    user = delete_user_by_id(db, user_id)
+    user = await delete_user_by_id(db, user_id)
     return {
         "user": user,
         "message": f"User with id {user_id} has been deleted"
@@ -1,11 +1,23 @@
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from core.config import settings
+from core.metrics import REGISTRY, run_snapshot_writer
 from db.init_db import init_db
-from db.session import SessionLocal, engine
+from db.session import SessionLocal, async_engine, engine
 from app.api.v1.router import auth, user, file
 from middlewares.logging_middleware import LoggingMiddleware
 from middlewares.auth_middleware import AuthMiddleware
 from middlewares.cors_middleware import add_cors_middleware
 from middlewares.error_handling_middleware import ErrorHandlingMiddleware
+from middlewares.metrics_middleware import MetricsMiddleware
+from services.file import PROCESS_FILE_JOB
+from services.jobs import run_job_workers, shutdown_jobs
+from services.processing import process_file_job
+from services.rendition import shutdown_renditions
+from services.share import run_share_denylist_sync
+from services.upload_session import run_upload_session_gc
 
 from fastapi import FastAPI
 
@@ -20,6 +32,18 @@ async def home():
     return {"message": "Welcome to the File Uploader API. Please go to /docs for documentation."}
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    if settings.METRICS_MULTIPROC_DIR:
+        # Any worker may answer the scrape, so it reports the totals of all of them
+        body = await run_in_threadpool(
+            REGISTRY.render_multiprocess, settings.METRICS_MULTIPROC_DIR, 3 * settings.METRICS_FLUSH_INTERVAL_SECONDS
+        )
+    else:
+        body = REGISTRY.render()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
 
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
@@ -29,9 +53,11 @@ app.include_router(file.router, prefix="/file", tags=["file"])
 
 # middlewares
 app.add_middleware(LoggingMiddleware)
-app.add_middleware(AuthMiddleware, excluded_paths=["/", "/docs", "/openapi.json", "/auth/token", "/auth/register/"])
+app.add_middleware(AuthMiddleware, excluded_paths=["/", "/docs", "/openapi.json", "/auth/token", "/auth/register/",
+                                                   "/file/public/"])
 add_cors_middleware(app)
 app.add_middleware(ErrorHandlingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 
 
@@ -42,3 +68,33 @@ def on_startup():
     db = SessionLocal()
     init_db(db)
     db.close()
+
+
+background_tasks = set()
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    background_tasks.add(asyncio.create_task(run_upload_session_gc()))
+    background_tasks.add(asyncio.create_task(run_share_denylist_sync()))
+    background_tasks.add(asyncio.create_task(run_job_workers({PROCESS_FILE_JOB: process_file_job})))
+    if settings.METRICS_MULTIPROC_DIR:
+        background_tasks.add(asyncio.create_task(
+            run_snapshot_writer(settings.METRICS_MULTIPROC_DIR, settings.METRICS_FLUSH_INTERVAL_SECONDS)
+        ))
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    if settings.METRICS_MULTIPROC_DIR:
+        # Counters of a finished worker still count towards the totals
+        REGISTRY.write_snapshot(settings.METRICS_MULTIPROC_DIR, final=True)
+    shutdown_renditions()
+    shutdown_jobs()
+
+
+@app.on_event("shutdown")
+async def close_database():
+    await async_engine.dispose()
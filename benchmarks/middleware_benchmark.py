@@ -0,0 +1,161 @@
+"""
+Request throughput and download time-to-first-byte through the application's middleware
+stack, the pure ASGI middleware against the BaseHTTPMiddleware versions they replaced.
+
+    python -m benchmarks.middleware_benchmark --requests 2000 --concurrency 1 16 --file-size 52428800
+
+Requests are driven straight through the ASGI interface, without a server or sockets, so
+the difference between the two stacks is the middleware overhead alone. Every stack wraps
+the same small app with a JSON route and a FileResponse download route.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from fastapi import FastAPI, HTTPException, Request
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import FileResponse, JSONResponse
+from middlewares.auth_middleware import AuthMiddleware
+from middlewares.cors_middleware import add_cors_middleware
+from middlewares.error_handling_middleware import ErrorHandlingMiddleware
+from middlewares.logging_middleware import LoggingMiddleware
+from logger.logger import logger
+
+EXCLUDED_PATHS = ["/docs", "/openapi.json", "/auth/token", "/auth/register/"]
+
+
+# The BaseHTTPMiddleware stack as it was, kept here for comparison
+class LegacyLoggingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        start_time = datetime.now()
+        logger.info(f"{start_time} - Starting request")
+        response = await call_next(request)
+        process_time = datetime.now() - start_time
+        logger.info(f"{start_time} - Request processed successfully in {process_time.total_seconds()} seconds")
+        return response
+
+
+class LegacyAuthMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, excluded_paths: list = None):
+        super().__init__(app)
+        self.excluded_paths = excluded_paths or []
+
+    async def dispatch(self, request: Request, call_next):
+        if any(request.url.path.startswith(path) for path in self.excluded_paths):
+            return await call_next(request)
+        if not request.headers.get("Authorization"):
+            raise HTTPException(status_code=401, detail="Authorization required")
+        return await call_next(request)
+
+
+class LegacyErrorHandlingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        try:
+            return await call_next(request)
+        except HTTPException as exc:
+            return JSONResponse({"detail": exc.detail}, status_code=exc.status_code)
+        except Exception:
+            return JSONResponse({"detail": "Internal server error"}, status_code=500)
+
+
+def build_app(path: str, legacy: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"message": "pong"}
+
+    @app.get("/download")
+    async def download():
+        return FileResponse(path, filename="download.bin", media_type="application/octet-stream")
+
+    # Same order as app/main.py; the last one added is the outermost
+    if legacy:
+        app.add_middleware(LegacyLoggingMiddleware)
+        app.add_middleware(LegacyAuthMiddleware, excluded_paths=EXCLUDED_PATHS)
+        add_cors_middleware(app)
+        app.add_middleware(LegacyErrorHandlingMiddleware)
+    else:
+        app.add_middleware(LoggingMiddleware)
+        app.add_middleware(AuthMiddleware, excluded_paths=EXCLUDED_PATHS)
+        add_cors_middleware(app)
+        app.add_middleware(ErrorHandlingMiddleware)
+    return app
+
+
+# Sends one GET and returns (seconds to the first body byte, seconds to the last)
+async def request(app, path: str):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"bench"), (b"authorization", b"Bearer bench")],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    disconnect = asyncio.Event()
+
+    async def receive():
+        if not disconnect.is_set():
+            disconnect.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    first_byte = None
+    started = time.perf_counter()
+
+    async def send(message):
+        nonlocal first_byte
+        if message["type"] == "http.response.body" and message.get("body") and first_byte is None:
+            first_byte = time.perf_counter() - started
+
+    await app(scope, receive, send)
+    return first_byte, time.perf_counter() - started
+
+
+async def throughput(app, path: str, total: int, concurrency: int) -> float:
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            await request(app, path)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - started)
+
+
+async def measure(args, path: str) -> None:
+    for label, legacy in (("BaseHTTPMiddleware", True), ("pure ASGI", False)):
+        app = build_app(path, legacy)
+        await request(app, "/ping")  # warm up route and middleware stack construction
+        for concurrency in args.concurrency:
+            rps = await throughput(app, "/ping", args.requests, concurrency)
+            print(f"{label:>18}  json      c={concurrency:<3} {rps:10.0f} req/s")
+        for concurrency in args.concurrency:
+            rps = await throughput(app, "/download", max(args.requests // 10, 1), concurrency)
+            print(f"{label:>18}  download  c={concurrency:<3} {rps:10.0f} req/s")
+        timings = [await request(app, "/download") for _ in range(args.downloads)]
+        ttfb = statistics.median(first for first, _ in timings) * 1000
+        total = statistics.median(last for _, last in timings) * 1000
+        print(f"{label:>18}  download  ttfb {ttfb:8.3f} ms   complete {total:8.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--downloads", type=int, default=50, help="Downloads timed for time-to-first-byte")
+    parser.add_argument("--file-size", type=int, default=10 * 1024 * 1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "download.bin")
+        with open(path, "wb") as target:
+            target.write(os.urandom(args.file_size))
+        asyncio.run(measure(args, path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+End-to-end benchmarks of the file service hot paths, run against the ASGI app in-process.
+
+    python -m benchmarks.suite --output baseline.json
+    python -m benchmarks.suite --baseline baseline.json --output current.json
+    python -m benchmarks.suite --only upload download --upload-sizes 4096 1048576
+
+Requests go through httpx's ASGI transport, with SQLite and a temporary upload directory
+standing in for MySQL and the server's disk. The suite covers uploads and downloads by
+file size, listing, paging and search at increasing table sizes, and analytics.
+
+Listing and search cases run cold, with the file cache invalidated before each request,
+and again warm, answered by the cache, as `<case>.cached.<table size>`.
+
+Results are written as JSON. With --baseline, every case is compared with the saved run
+and the command exits with status 1 when a case got slower by more than --threshold.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+GROUPS = ("upload", "download", "listing", "analytics")
+WORDS = ["report", "invoice", "draft", "final", "summary", "budget", "photo", "holiday", "scan",
+         "contract", "notes", "meeting", "design", "backup", "export", "q1", "q2", "q3", "q4"]
+EXTENSIONS = [".pdf", ".txt", ".csv", ".png"]
+CREDENTIALS = {"username": "bench", "email": "bench@example.com", "password": "Bench-passw0rd!"}
+
+
+def _summary(timings, payload_bytes: int = 0) -> dict:
+    timings = sorted(timings)
+    result = {
+        "runs": len(timings),
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": timings[min(int(len(timings) * 0.95), len(timings) - 1)] * 1000,
+        "mean_ms": statistics.fmean(timings) * 1000,
+        "ops_per_s": len(timings) / sum(timings),
+    }
+    if payload_bytes:
+        result["mb_per_s"] = payload_bytes * len(timings) / sum(timings) / (1024 * 1024)
+    return result
+
+
+async def _timed(request, repeat: int, before=None):
+    timings = []
+    for _ in range(repeat):
+        if before is not None:
+            await before()  # not timed
+        started = time.perf_counter()
+        response = await request()
+        timings.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.request.method} {response.request.url} -> {response.status_code}: {response.text}")
+    return timings
+
+
+def _payload(size: int, serial: int) -> bytes:
+    # Distinct content for every upload, so deduplication never skips the write
+    base = os.urandom(size)
+    return serial.to_bytes(8, "big") + base[8:] if size >= 8 else base
+
+
+async def bench_upload(client, args, results: dict, uploaded: dict) -> None:
+    serial = 0
+    for size in args.upload_sizes:
+        repeat = max(3, min(args.repeat, (64 * 1024 * 1024) // max(size, 1)))
+        payloads = []
+        for _ in range(repeat):
+            serial += 1
+            payloads.append(_payload(size, serial))
+        remaining = iter(payloads)
+
+        def multipart():
+            content = next(remaining)
+            return client.post("/file/upload", files={"file": (f"upload-{size}.txt", content, "text/plain")})
+
+        results[f"upload.multipart.{size}"] = _summary(await _timed(multipart, repeat), size)
+
+        payloads = [_payload(size, serial + i + 1) for i in range(repeat)]
+        serial += repeat
+        remaining = iter(payloads)
+
+        def raw():
+            return client.put(f"/file/upload/raw-{size}.txt", content=next(remaining),
+                              headers={"content-type": "text/plain"})
+
+        responses = []
+
+        async def raw_and_keep():
+            response = await raw()
+            responses.append(response)
+            return response
+
+        results[f"upload.raw.{size}"] = _summary(await _timed(raw_and_keep, repeat), size)
+        uploaded[size] = responses[-1].json()["id"]
+
+
+async def bench_download(client, args, results: dict, uploaded: dict) -> None:
+    for size in args.upload_sizes:
+        if size not in uploaded:
+            response = await client.put(f"/file/upload/download-{size}.txt", content=_payload(size, size),
+                                        headers={"content-type": "text/plain"})
+            uploaded[size] = response.json()["id"]
+        repeat = max(3, min(args.repeat, (256 * 1024 * 1024) // max(size, 1)))
+        file_id = uploaded[size]
+        results[f"download.full.{size}"] = _summary(
+            await _timed(lambda: client.get(f"/file/shared/{file_id}"), repeat), size
+        )
+        if size > 1024:
+            results[f"download.range.{size}"] = _summary(
+                await _timed(lambda: client.get(f"/file/shared/{file_id}", headers={"range": "bytes=0-1023"}), repeat),
+                1024
+            )
+
+
+def _seed_files(user_id: int, start: int, count: int) -> None:
+    from sqlalchemy import insert
+    from db.session import SessionLocal
+    from models.file import File
+    from models.search import FileNameGram
+    from services.analytics import rebuild_usage_summaries
+    from services.search import index_grams
+
+    rng = random.Random(start)
+    first_day = datetime(2024, 1, 1)
+    with SessionLocal() as db:
+        for offset in range(start, start + count, 5000):
+            files, grams = [], []
+            for serial in range(offset, min(offset + 5000, start + count)):
+                name = f"{'_'.join(rng.sample(WORDS, rng.randint(1, 3)))}_{serial:07d}{rng.choice(EXTENSIONS)}"
+                files.append({"filename": name, "file_path": "-", "file_size": rng.randint(1, 10 ** 7),
+                              "file_type": "text/plain", "user_id": user_id,
+                              "upload_date": first_day + timedelta(seconds=serial)})
+            db.execute(insert(File), files)
+            db.flush()
+            for file in db.query(File.id, File.filename).filter(File.file_path == "-", File.user_id == user_id).filter(
+                File.filename.in_([row["filename"] for row in files])
+            ):
+                grams.extend({"gram": gram, "user_id": user_id, "file_id": file.id} for gram in index_grams(file.filename))
+            db.execute(insert(FileNameGram), grams)
+        db.commit()
+        rebuild_usage_summaries(db, user_id)
+
+
+async def bench_listing(client, args, results: dict, user_id: int, size: int) -> None:
+    from services.file_cache import invalidate_user_files
+
+    # Listings are cached per user. Cold runs each start from a fresh version, so they all
+    # reach the database; cached runs then repeat the same requests.
+    async def measure(case: str, request) -> None:
+        results[f"{case}.{size}"] = _summary(
+            await _timed(request, args.repeat, before=lambda: invalidate_user_files(user_id))
+        )
+        results[f"{case}.cached.{size}"] = _summary(await _timed(request, args.repeat))
+
+    def page(**params):
+        return lambda: client.get("/file/files", params={"limit": 20, **params})
+
+    await measure("listing.first_page", page())
+    await measure("listing.by_name", page(sort="name", order="desc"))
+
+    # Walks several pages with cursors, as a client scrolling through the list would
+    async def walk():
+        cursor = None
+        for _ in range(args.pages):
+            params = {"limit": 20, "sort": "size"}
+            if cursor:
+                params["cursor"] = cursor
+            response = await client.get("/file/files", params=params)
+            cursor = response.json()["next_cursor"]
+            if cursor is None:
+                break
+        return response
+
+    await measure(f"listing.walk_{args.pages}_pages", walk)
+
+    for term, match in (("inv", "substring"), ("holiday", "prefix"), ("budget final", "tokens"),
+                        ("0000042", "substring")):
+        await measure(f"search.{match}.{term.replace(' ', '_')}", page(search=term, match=match))
+
+
+async def bench_analytics(client, args, results: dict, size: int) -> None:
+    results[f"analytics.user.{size}"] = _summary(await _timed(lambda: client.get("/file/analytics"), args.repeat))
+    results[f"analytics.system.{size}"] = _summary(
+        await _timed(lambda: client.get("/file/admin/analytics"), args.repeat)
+    )
+
+
+async def run(args) -> dict:
+    # Imported late: settings are read in main(), after the environment is prepared
+    import httpx
+    from app.main import app
+    from db.init_db import init_db
+    from db.session import SessionLocal, async_engine
+    from services.file_cache import invalidate_user_files
+
+    with SessionLocal() as db:
+        init_db(db)
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            response = await client.post("/auth/register/", json={**CREDENTIALS, "role": "admin"})
+            response.raise_for_status()
+            user_id = response.json()["id"]
+            response = await client.post("/auth/token", data=CREDENTIALS)
+            response.raise_for_status()
+            client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+            uploaded = {}
+            if "upload" in args.only:
+                await bench_upload(client, args, results, uploaded)
+            if "download" in args.only:
+                await bench_download(client, args, results, uploaded)
+            # The table grows between sizes; cases at each size see every row seeded so far
+            seeded = 0
+            for size in args.table_sizes if {"listing", "analytics"} & set(args.only) else ():
+                await asyncio.to_thread(_seed_files, user_id, seeded, size - seeded)
+                # Written behind the service's back, so pages cached at the previous size are stale
+                await invalidate_user_files(user_id)
+                seeded = size
+                if "listing" in args.only:
+                    await bench_listing(client, args, results, user_id, size)
+                if "analytics" in args.only:
+                    await bench_analytics(client, args, results, size)
+    finally:
+        await async_engine.dispose()
+    return results
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    regressed = False
+    print(f"{'case':<44} {'baseline ms':>12} {'current ms':>12} {'change':>9}")
+    for case, result in current["results"].items():
+        before = baseline["results"].get(case)
+        if before is None:
+            print(f"{case:<44} {'-':>12} {result['median_ms']:12.3f} {'new':>9}")
+            continue
+        change = result["median_ms"] / before["median_ms"] - 1 if before["median_ms"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  SLOWER"
+            regressed = True
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{case:<44} {before['median_ms']:12.3f} {result['median_ms']:12.3f} {change:+8.1%}{flag}")
+    for case in baseline["results"].keys() - current["results"].keys():
+        print(f"{case:<44} {baseline['results'][case]['median_ms']:12.3f} {'-':>12} {'missing':>9}")
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=list(GROUPS))
+    parser.add_argument("--upload-sizes", type=int, nargs="+", default=[4 * 1024, 1024 * 1024, 16 * 1024 * 1024])
+    parser.add_argument("--table-sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per case")
+    parser.add_argument("--pages", type=int, default=5, help="Pages walked in the paging case")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with the results saved in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Slowdown of the median that fails the run")
+    args = parser.parse_args()
+    args.table_sizes = sorted(set(args.table_sizes))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        output = os.path.abspath(args.output) if args.output else None
+        baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        os.environ.setdefault("PASSWORD_HASH_ROUNDS", "4")
+        os.environ["MAX_FILE_SIZE"] = str(max(args.upload_sizes + [50 * 1024 * 1024]))
+        # Uploads are stored relative to the working directory; keep the repo importable, and
+        # read the settings while .env is still found in the current directory
+        sys.path.insert(0, os.getcwd())
+        from core.config import settings  # noqa: F401
+        os.chdir(workdir)
+        os.makedirs("uploads")
+
+        started = datetime.now(timezone.utc)
+        results = asyncio.run(run(args))
+        report = {
+            "meta": {
+                "started": started.isoformat(),
+                "revision": _git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "args": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+            },
+            "results": results,
+        }
+
+    for case, result in results.items():
+        throughput = f"{result['mb_per_s']:9.1f} MB/s" if "mb_per_s" in result else f"{result['ops_per_s']:9.1f} op/s"
+        print(f"{case:<44} median {result['median_ms']:10.3f} ms   p95 {result['p95_ms']:10.3f} ms   {throughput}")
+    if output:
+        with open(output, "w") as target:
+            json.dump(report, target, indent=2)
+    if baseline_path:
+        with open(baseline_path) as source:
+            baseline = json.load(source)
+        print()
+        if compare(baseline, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
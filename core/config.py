@@ -1,3 +1,4 @@
+from typing import List, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -13,7 +14,56 @@ class Settings(BaseSettings):
     BASE_URL: str
     MYSQL_ROOT_PASSWORD: str
     TESTING: bool
-
+    DATABASE_URL: Optional[str] = None  # overrides the MySQL settings, e.g. sqlite:///./file_manager.db
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 60 * 60  # below MySQL's wait_timeout, so idle connections are never stale
+    DB_POOL_PRE_PING: bool = True
+    METRICS_MULTIPROC_DIR: Optional[str] = None  # shared by all workers when running several; emptied on start
+    METRICS_FLUSH_INTERVAL_SECONDS: int = 15
+    LOG_LEVEL: str = "INFO"
+    LOG_QUEUE_SIZE: int = 10_000
+    LOG_SHUTDOWN_TIMEOUT_SECONDS: float = 5.0  # how long exit waits for queued records to be written
+    LOG_SAMPLE_RATE: float = 1.0  # share of successful requests logged; errors are always logged
+    MAX_FILE_SIZE: int = 50 * 1024 * 1024  # 50 MB
+    STORAGE_BACKEND_URL: Optional[str] = None  # e.g. s3://bucket/prefix; local disk when unset
+    S3_ENDPOINT_URL: Optional[str] = None  # for S3-compatible servers, e.g. http://localhost:9000 for MinIO
+    S3_REGION: Optional[str] = None
+    S3_MULTIPART_THRESHOLD: int = 8 * 1024 * 1024  # files from this size are uploaded in parts
+    S3_MULTIPART_CHUNK_SIZE: int = 8 * 1024 * 1024
+    S3_MAX_CONCURRENCY: int = 8  # parts uploaded at the same time per file
+    STORAGE_PRESIGNED_URL_TTL_SECONDS: int = 5 * 60  # downloads redirect to object storage with these URLs
+    COMPRESSION_MIN_SIZE: int = 1024  # smaller text downloads are sent uncompressed
+    COMPRESSION_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024  # 1 GB
+    SHARE_LINK_TTL_SECONDS: int = 7 * 24 * 60 * 60
+    SHARE_LINK_MAX_TTL_SECONDS: int = 30 * 24 * 60 * 60
+    SHARE_DENYLIST_REFRESH_SECONDS: float = 10  # revoking reaches other server processes within this
+    BATCH_UPLOAD_MAX_FILES: int = 100
+    BATCH_UPLOAD_CONCURRENCY: int = 8  # parts of a batch staged to storage at the same time
+    THUMBNAIL_SIZES: List[int] = [128, 256, 512]  # JSON in the environment, e.g. [200, 400]
+    THUMBNAIL_EAGER: bool = False  # render every size right after upload instead of on first request
+    RENDITION_WORKERS: int = 2
+    RENDITION_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024  # 1 GB
+    JOB_WORKERS: int = 2  # background jobs run at the same time in each server process
+    JOB_EXECUTOR: str = "thread"  # or "process", for CPU-bound analysis
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BASE_SECONDS: float = 10  # doubled after every failed attempt
+    JOB_RETRY_MAX_SECONDS: float = 60 * 60
+    JOB_POLL_INTERVAL_SECONDS: float = 5
+    JOB_LEASE_SECONDS: int = 10 * 60  # after which a job whose worker died is run again
+    UPLOAD_SESSION_TTL_SECONDS: int = 24 * 60 * 60
+    UPLOAD_SESSION_GC_INTERVAL_SECONDS: int = 10 * 60
+    CACHE_BACKEND_URL: Optional[str] = None  # e.g. redis://localhost:6379/0, shared between workers
+    AUTH_CACHE_TTL_SECONDS: int = 30
+    AUTH_CACHE_SHARED_TTL_SECONDS: int = 5 * 60
+    AUTH_CACHE_MAX_ENTRIES: int = 10_000
+    FILE_CACHE_TTL_SECONDS: int = 10  # how stale other workers' metadata can be without CACHE_BACKEND_URL
+    FILE_CACHE_SHARED_TTL_SECONDS: int = 5 * 60
+    FILE_CACHE_MAX_ENTRIES: int = 50_000
+    PASSWORD_HASH_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 32
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,316 @@
+import asyncio
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from starlette.concurrency import run_in_threadpool
+
+# Minimal in-process metrics in the Prometheus text exposition format. Updates take a
+# lock and touch a dict, so they are cheap enough for per-request and per-checkout use.
+#
+# With several worker processes each one periodically writes a snapshot of its metrics
+# to a shared directory, and a scrape of any worker merges every snapshot: counters and
+# histograms are summed over all processes that ever wrote one, gauges over live ones.
+# Snapshots are named after a random id drawn by each process, as process ids get reused,
+# and a process counts as live while it keeps rewriting its snapshot. The directory
+# holds one server run: `python -m core.metrics --clear` empties it before the workers
+# start.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _render_family(
+    name: str, kind: str, documentation: str, labelnames: Sequence[str], values: dict, buckets: Sequence[float] = ()
+) -> str:
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for key, value in values.items():
+        if kind != "histogram":
+            lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+            continue
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip(tuple(buckets) + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(labelnames, key, f'le="{_format_value(bound)}"')
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = _format_labels(labelnames, key)
+        lines.append(f"{name}_count{labels} {cumulative}")
+        lines.append(f"{name}_sum{labels} {_format_value(total)}")
+    return "\n".join(lines)
+
+
+class Metric:
+    kind = "untyped"
+    buckets: Tuple[float, ...] = ()
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    # Current values by label values
+    def collect(self) -> dict:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return _render_family(self.name, self.kind, self.documentation, self.labelnames, self.collect(), self.buckets)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    # The value is read from `function` whenever the metric is collected
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def value(self, **labels: str) -> float:
+        key = self._key(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key, 0)
+
+    def collect(self) -> dict:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        values.update({key: function() for key, function in functions.items()})
+        return values
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: a count per bucket (the last one is +Inf), then the sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def collect(self) -> dict:
+        with self._lock:
+            return {key: (list(counts), total[0]) for key, (counts, total) in self._values.items()}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+        self._instance: Optional[Tuple[int, str]] = None  # (pid, id) of the process writing snapshots
+
+    # Drawn again in a forked child, which inherits its parent's
+    def _instance_id(self) -> str:
+        pid = os.getpid()
+        if self._instance is None or self._instance[0] != pid:
+            self._instance = (pid, uuid.uuid4().hex)
+        return self._instance[1]
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def _metrics_list(self) -> List[Metric]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics_list()) + "\n"
+
+    def snapshot(self, final: bool = False) -> dict:
+        return {
+            "pid": os.getpid(),
+            "written_at": time.time(),
+            "final": final,  # written on shutdown: the process no longer counts as live
+            "metrics": {
+                metric.name: {
+                    "kind": metric.kind,
+                    "documentation": metric.documentation,
+                    "labelnames": list(metric.labelnames),
+                    "buckets": list(metric.buckets),
+                    "values": [[list(key), value] for key, value in metric.collect().items()],
+                }
+                for metric in self._metrics_list()
+            },
+        }
+
+    def write_snapshot(self, directory: str, final: bool = False) -> None:
+        os.makedirs(directory, exist_ok=True)
+        location = os.path.join(directory, f"metrics-{self._instance_id()}.json")
+        temp_location = f"{location}.tmp"
+        with open(temp_location, "w") as target:
+            json.dump(self.snapshot(final), target)
+        os.replace(temp_location, location)
+
+    # Writes this process's snapshot, then merges every snapshot in `directory`. Gauges
+    # only come from processes that wrote theirs within `live_within` seconds.
+    def render_multiprocess(self, directory: str, live_within: float) -> str:
+        self.write_snapshot(directory)
+        families: Dict[str, dict] = {}
+        now = time.time()
+        for location in sorted(glob.glob(os.path.join(directory, "metrics-*.json"))):
+            try:
+                with open(location) as source:
+                    snapshot = json.load(source)
+            except (OSError, ValueError):
+                continue  # being replaced, or left half-written by a crash
+            alive = not snapshot.get("final") and now - snapshot.get("written_at", 0) <= live_within
+            for name, family in snapshot["metrics"].items():
+                if family["kind"] == "gauge" and not alive:
+                    continue
+                merged = families.setdefault(name, {**family, "values": {}})
+                for key, value in family["values"]:
+                    key = tuple(key)
+                    current = merged["values"].get(key)
+                    if family["kind"] == "histogram":
+                        if current is not None:
+                            value = ([a + b for a, b in zip(current[0], value[0])], current[1] + value[1])
+                    elif current is not None:
+                        value = current + value
+                    merged["values"][key] = value
+        return "\n".join(
+            _render_family(name, family["kind"], family["documentation"], family["labelnames"], family["values"],
+                           family["buckets"])
+            for name, family in families.items()
+        ) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(
+    name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Statements executed during the current request, counted by the engines' event hooks.
+# The metrics middleware sets a fresh tally per request; it is None outside requests.
+request_queries: ContextVar[Optional[List[int]]] = ContextVar("request_queries", default=None)
+
+
+def record_query() -> None:
+    tally = request_queries.get()
+    if tally is not None:
+        tally[0] += 1
+
+
+async def run_snapshot_writer(directory: str, interval: float) -> None:
+    while True:
+        await run_in_threadpool(REGISTRY.write_snapshot, directory)
+        await asyncio.sleep(interval)
+
+
+# Removes the snapshots of a previous server run
+def clear_snapshots(directory: str) -> None:
+    for location in glob.glob(os.path.join(directory, "metrics-*.json*")):
+        try:
+            os.remove(location)
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == "__main__":
+    import argparse
+    from core.config import settings
+
+    parser = argparse.ArgumentParser(description="Manage the metrics snapshots of worker processes")
+    parser.add_argument("--clear", action="store_true", required=True,
+                        help="Remove the snapshots left in METRICS_MULTIPROC_DIR by a previous run")
+    parser.parse_args()
+    if settings.METRICS_MULTIPROC_DIR:
+        clear_snapshots(settings.METRICS_MULTIPROC_DIR)
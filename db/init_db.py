@@ -3,6 +3,12 @@ from db.session import SessionLocal, engine
 from db.base import Base  # Import Base correctly
 from models.user import User
 from models.file import File  # Ensure models are imported to register with SQLAlchemy
+from models.blob import Blob
+from models.upload_session import UploadSession, UploadSessionChunk
+from models.search import FileNameGram, UserSearchGram
+from models.usage import UserStorageUsage, UserDailyUploads
+from models.job import Job
+from models.share import ShareRevocation
 
 def init_db(db: Session) -> None:
     # Create tables
@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from sqlalchemy import select
+from db.session import SessionLocal
+from db.init_db import init_db
+from logger.logger import logger
+from models.blob import Blob
+from models.file import File
+from services.file_cache import invalidate_user_files
+from services.storage import (adopt_legacy_file, blob_path, discard_staged_file, hash_file, relocate_blob,
+                              stage_local_file, store_staged_file, stored_file_exists)
+
+# Moves stored files into the fan-out layout of the storage backend: blobs still in the
+# flat upload directory, and files saved under their own name before content-addressed
+# storage, which become blobs. Both are read from local disk.
+# Files are moved in parallel, each in its own transaction. Old paths are only removed once
+# the database points to the new ones, so the server can keep running and the migration
+# can be interrupted and run again. Moves run on a thread pool; the event loop invalidates
+# the owners' cached metadata once each is committed.
+
+
+# Users whose cached file metadata points to an old path. Invalidating it reaches the
+# server through the shared cache tier; without one, its entries expire on their own.
+def _owners(db, *conditions) -> List[int]:
+    return db.scalars(select(File.user_id).where(*conditions).distinct()).all()
+
+
+# Both return the old path to remove, if any, and the owners of the files moved
+def _relocate_blob(blob_id: int) -> Tuple[Optional[str], List[int]]:
+    db = SessionLocal()
+    try:
+        old_location = relocate_blob(db, blob_id)
+        owners = _owners(db, File.blob_id == blob_id)
+        db.commit()
+    finally:
+        db.close()
+    return old_location, owners
+
+
+def _adopt_legacy_file(location: str) -> Tuple[Optional[str], List[int]]:
+    # Hashed and stored from a staged copy before any row is locked
+    temp_location = stage_local_file(location)
+    try:
+        digest = hash_file(temp_location)
+        file_size = os.path.getsize(temp_location)
+        store_staged_file(temp_location, digest)
+    finally:
+        discard_staged_file(temp_location)
+    db = SessionLocal()
+    try:
+        owners = _owners(db, File.file_path == location, File.blob_id.is_(None))
+        old_location = adopt_legacy_file(db, location, digest, file_size)
+        # Removed by the cleanup of a tombstone with the same digest before the reference was taken
+        if not stored_file_exists(blob_path(digest)):
+            raise RuntimeError(f"The content of {location} was removed while moving it, run again")
+        db.commit()
+    finally:
+        db.close()
+    return old_location, owners
+
+
+def _remove(location: str) -> None:
+    try:
+        os.remove(location)
+    except FileNotFoundError:
+        pass
+
+
+async def _migrate(executor: Executor, function, key) -> bool:
+    loop = asyncio.get_running_loop()
+    try:
+        old_location, owners = await loop.run_in_executor(executor, function, key)
+    except FileNotFoundError:
+        logger.warning(f"Skipped {key}: the stored file is missing")
+        return False
+    except Exception:
+        logger.exception(f"Failed to migrate {key}")
+        return False
+    for user_id in owners:
+        await invalidate_user_files(user_id)
+    if old_location is not None:
+        await loop.run_in_executor(executor, _remove, old_location)
+    return True
+
+
+async def _migrate_all(blob_ids: List[int], legacy_locations: List[str], workers: int) -> int:
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        moved = sum(await asyncio.gather(*(_migrate(executor, _relocate_blob, blob_id) for blob_id in blob_ids)))
+        moved += sum(await asyncio.gather(
+            *(_migrate(executor, _adopt_legacy_file, location) for location in legacy_locations)
+        ))
+    return moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move stored files into the fan-out storage layout")
+    parser.add_argument("--workers", type=int, default=8, help="Files moved at the same time")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the files to move")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    init_db(db)
+    blob_ids = [row.id for row in db.execute(select(Blob.id, Blob.digest, Blob.file_path).where(Blob.ref_count > 0))
+                if row.file_path != blob_path(row.digest)]
+    legacy_locations = db.scalars(select(File.file_path).where(File.blob_id.is_(None)).distinct()).all()
+    db.close()
+
+    print(f"{len(blob_ids)} blob(s) and {len(legacy_locations)} file(s) stored by name to move")
+    if not args.dry_run:
+        moved = asyncio.run(_migrate_all(blob_ids, legacy_locations, args.workers))
+        failed = len(blob_ids) + len(legacy_locations) - moved
+        print(f"Moved {moved}, {failed} failed or missing" if failed else f"Moved {moved}")
+        if failed:
+            raise SystemExit(1)
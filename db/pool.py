@@ -0,0 +1,90 @@
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from core.metrics import counter, gauge, histogram, record_query
+
+# Connection pool instrumentation. Every engine is labelled ("sync" for scripts and
+# worker threads, "async" for request handlers) so both pools show up separately.
+POOL_CHECKED_OUT = gauge("db_pool_checked_out_connections", "Connections currently checked out of the pool", ["engine"])
+POOL_IDLE = gauge("db_pool_idle_connections", "Open connections waiting in the pool", ["engine"])
+POOL_OVERFLOW = gauge("db_pool_overflow_connections", "Open connections beyond the pool size", ["engine"])
+POOL_CAPACITY = gauge("db_pool_capacity_connections", "Pool size plus max overflow", ["engine"])
+POOL_WAIT = histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent getting a connection from the pool, including opening a new one",
+    ["engine"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+)
+POOL_OVERFLOW_EVENTS = counter("db_pool_overflow_total", "Connections opened beyond the pool size", ["engine"])
+POOL_TIMEOUTS = counter("db_pool_timeouts_total", "Checkouts that gave up after the pool timeout", ["engine"])
+POOL_INVALIDATIONS = counter(
+    "db_pool_invalidations_total", "Connections discarded as broken, including failed pre-pings", ["engine"]
+)
+CONNECTION_LIFETIME = histogram(
+    "db_connection_lifetime_seconds",
+    "Age of database connections when they are closed",
+    ["engine"],
+    buckets=(1, 10, 60, 300, 900, 1800, 3600, 7200, 14400, 28800)
+)
+
+
+class _InstrumentedPool:
+    metrics_label = "unknown"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            POOL_TIMEOUTS.inc(engine=self.metrics_label)
+            raise
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - started, engine=self.metrics_label)
+
+    # Engine.dispose() replaces the pool with a fresh one of the same class
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics_label = self.metrics_label
+        return pool
+
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument_engine(engine: Engine, label: str) -> None:
+    if isinstance(engine.pool, _InstrumentedPool):
+        engine.pool.metrics_label = label
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        connection_record.info["connected_at"] = time.monotonic()
+        if isinstance(engine.pool, QueuePool) and engine.pool.overflow() > 0:
+            POOL_OVERFLOW_EVENTS.inc(engine=label)
+
+    @event.listens_for(engine, "close")
+    def on_close(dbapi_connection, connection_record):
+        connected_at = connection_record.info.pop("connected_at", None)
+        if connected_at is not None:
+            CONNECTION_LIFETIME.observe(time.monotonic() - connected_at, engine=label)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        record_query()
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        POOL_INVALIDATIONS.inc(engine=label)
+
+    if isinstance(engine.pool, QueuePool):
+        # Read through the engine, which keeps pointing at the live pool after dispose()
+        POOL_CHECKED_OUT.set_function(lambda: engine.pool.checkedout(), engine=label)
+        POOL_IDLE.set_function(lambda: engine.pool.checkedin(), engine=label)
+        POOL_OVERFLOW.set_function(lambda: max(engine.pool.overflow(), 0), engine=label)
+        POOL_CAPACITY.set_function(lambda: engine.pool.size() + engine.pool._max_overflow, engine=label)
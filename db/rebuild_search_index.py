@@ -0,0 +1,11 @@
+from db.session import SessionLocal
+from db.init_db import init_db
+from services.search import rebuild_search_index
+
+# Rebuilds the filename and user search indexes from the files and users tables,
+# e.g. after loading data that bypassed the services.
+if __name__ == "__main__":
+    db = SessionLocal()
+    init_db(db)
+    rebuild_search_index(db)
+    db.close()
@@ -0,0 +1,16 @@
+import argparse
+from db.session import SessionLocal
+from db.init_db import init_db
+from services.analytics import rebuild_usage_summaries
+
+# Recomputes the per-user storage summaries from the files table, to repair them or to
+# backfill them for files uploaded before they were maintained.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild per-user storage summaries")
+    parser.add_argument("--user-id", type=int, help="Only rebuild the summaries of this user")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    init_db(db)
+    rebuild_usage_summaries(db, user_id=args.user_id)
+    db.close()
@@ -1,13 +1,99 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import queue
 import sys
-from datetime import datetime
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+from core.config import settings
+from core.metrics import counter
+
+# Records are queued by the emitting thread or event loop and written to stdout by a
+# listener thread, so a slow stdout never holds up a request. The queue is bounded:
+# when it is full, records are dropped and counted instead of blocking the caller.
+
+# Set by LoggingMiddleware for the duration of a request and attached to every record
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+LOG_RECORDS_DROPPED = counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRIBUTES})
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        elif record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id.get()
+        return True
 
-logger = logging.getLogger("myapp")
-formatter = logging.Formatter(fmt='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+    # Keeps the record structured for the JSON formatter: only the message arguments
+    # and the traceback, which may not survive the trip to another thread, are rendered.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    # The listener frees a slot as it writes, so the sentinel waits for one rather than
+    # failing on a full queue. If stdout is stuck and none frees up in time, the records
+    # still queued are given up: the thread is a daemon and ends with the process.
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(self._sentinel, timeout=settings.LOG_SHUTDOWN_TIMEOUT_SECONDS)
+        except queue.Full:
+            return
+        self._thread.join()
+        self._thread = None
+
+
+log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
 
 stream_handler = logging.StreamHandler(sys.stdout)
-stream_handler.setFormatter(formatter)
+stream_handler.setFormatter(JsonFormatter())
 
-logger.handlers = [stream_handler]
-logger.setLevel(logging.INFO)
+queue_handler = DroppingQueueHandler(log_queue)
+queue_handler.addFilter(RequestIdFilter())
 
+listener = DrainingQueueListener(log_queue, stream_handler)
+listener.start()
+atexit.register(listener.stop)
+
+logger = logging.getLogger("myapp")
+logger.handlers = [queue_handler]
+logger.setLevel(settings.LOG_LEVEL)
+logger.propagate = False
@@ -1,21 +1,22 @@
 # middlewares/auth_middleware.py
 
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
 from starlette.types import ASGIApp, Scope, Receive, Send
-from fastapi import Request, HTTPException
 
-class AuthMiddleware(BaseHTTPMiddleware):
+class AuthMiddleware:
     def __init__(self, app: ASGIApp, excluded_paths: list = None):
-        super().__init__(app)
+        self.app = app
         self.excluded_paths = excluded_paths if excluded_paths else []
 
-    async def dispatch(self, request: Request, call_next):
-        if any(request.url.path.startswith(path) for path in self.excluded_paths):
-            return await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or any(scope["path"].startswith(path) for path in self.excluded_paths):
+            await self.app(scope, receive, send)
+            return
 
-        access_token = request.headers.get("Authorization")
-        if not access_token:
-            raise HTTPException(status_code=401, detail="Authorization required")
-        
-        response = await call_next(request)
-        return response
+        headers = dict(scope["headers"])
+        if not headers.get(b"authorization"):
+            response = JSONResponse({"detail": "Authorization required"}, status_code=401)
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
@@ -1,13 +1,32 @@
-from fastapi import Request, HTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import HTTPException
 from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+class ErrorHandlingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
 
-class ErrorHandlingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
         try:
-            response = await call_next(request)
-            return response
-        except HTTPException as exc:
-            return JSONResponse({"detail": exc.detail}, status_code=exc.status_code)
+            await self.app(scope, receive, send_wrapper)
         except Exception as exc:
-            return JSONResponse({"detail": "Internal server error"}, status_code=500)
+            # Once the status line is out the client can only see the connection drop
+            if response_started:
+                raise
+            if isinstance(exc, HTTPException):
+                response = JSONResponse({"detail": exc.detail}, status_code=exc.status_code)
+            else:
+                response = JSONResponse({"detail": "Internal server error"}, status_code=500)
+            await response(scope, receive, send)
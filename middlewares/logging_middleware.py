@@ -1,21 +1,66 @@
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
-from starlette.types import ASGIApp
-from logger.logger import logger  # Importing the logger from the logger module
-from datetime import datetime
+import random
+import time
+import uuid
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from core.config import settings
+from logger.logger import logger, request_id  # Importing the logger from the logger module
+from middlewares.metrics_middleware import route_template
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app: ASGIApp):
-        super().__init__(app)
+class LoggingMiddleware:
+    def __init__(self, app: ASGIApp, sample_rate: float = None):
+        self.app = app
+        self.sample_rate = settings.LOG_SAMPLE_RATE if sample_rate is None else sample_rate
 
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
-        start_time = datetime.now()
-        logger.info(f"{start_time} - Starting request")
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        # A request id sent by a proxy is kept so records can be correlated across services
+        incoming_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        current_id = incoming_id[:64] or uuid.uuid4().hex
+        token = request_id.set(current_id)
+        status = 500
+        received = 0
+        sent = 0
+
+        async def receive_wrapper() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", current_id.encode("latin-1"))]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        failed = False
         try:
-            response = await call_next(request)
-            process_time = datetime.now() - start_time
-            logger.info(f"{start_time} - Request processed successfully in {process_time.total_seconds()} seconds")
-            return response
-        except Exception as e:
-            logger.exception(f"{start_time} - An error occurred while processing the request")
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except Exception:
+            failed = True
             raise
+        finally:
+            # Successful requests may be sampled; errors are always logged
+            if failed or status >= 400 or self.sample_rate >= 1 or random.random() < self.sample_rate:
+                fields = {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route_template(scope),
+                    "status": status,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                    "request_bytes": received,
+                    "response_bytes": sent,
+                }
+                if failed:
+                    logger.exception("Request failed", extra=fields)
+                else:
+                    logger.info("Request completed", extra=fields)
+            request_id.reset(token)
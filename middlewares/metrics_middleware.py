@@ -0,0 +1,81 @@
+import time
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from core.metrics import counter, gauge, histogram, request_queries
+
+REQUESTS = counter("http_requests_total", "HTTP requests by method, route and status", ["method", "route", "status"])
+REQUEST_DURATION = histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+REQUESTS_IN_FLIGHT = gauge("http_requests_in_flight", "Requests currently being handled")
+REQUEST_BYTES = counter("http_request_body_bytes_total", "Request body bytes received, e.g. uploads", ["route"])
+RESPONSE_BYTES = counter("http_response_body_bytes_total", "Response body bytes sent, e.g. downloads", ["route"])
+REQUEST_QUERIES = histogram(
+    "http_request_db_queries",
+    "Database statements executed per request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+
+
+def route_template(scope: Scope) -> str:
+    # FastAPI records the matched route in the scope; using its path template keeps
+    # label values bounded however many distinct URLs are requested
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        received = 0
+        sent = 0
+        content_length = 0
+        queries = [0]
+        queries_token = request_queries.set(queries)
+        REQUESTS_IN_FLIGHT.inc()
+
+        async def receive_wrapper() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, sent, content_length
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name == b"content-length":
+                        content_length = int(value)
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            elif message["type"] == "http.response.pathsend":
+                sent += content_length  # the server sends the file itself
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            request_queries.reset(queries_token)
+            REQUESTS_IN_FLIGHT.dec()
+            route = route_template(scope)
+            method = scope["method"]
+            REQUESTS.inc(method=method, route=route, status=str(status))
+            REQUEST_DURATION.observe(time.perf_counter() - started, method=method, route=route)
+            if received:
+                REQUEST_BYTES.inc(received, route=route)
+            if sent:
+                RESPONSE_BYTES.inc(sent, route=route)
+            REQUEST_QUERIES.observe(queries[0], route=route)
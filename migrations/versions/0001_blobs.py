@@ -0,0 +1,49 @@
+"""Content-addressed blobs referenced by files
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 09:00:00
+
+Files uploaded before this keep blob_id NULL until db/migrate_storage_layout.py makes
+blobs of them. Each step is skipped when create_all got there first.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('blobs'):
+        op.create_table(
+            'blobs',
+            sa.Column('id', sa.Integer, primary_key=True, index=True),
+            sa.Column('digest', sa.String(64), unique=True, nullable=False),
+            sa.Column('file_path', sa.String(255), nullable=False),
+            sa.Column('file_size', sa.Integer, nullable=False),
+            sa.Column('ref_count', sa.Integer, nullable=False),
+            sa.Column('created_date', sa.DateTime, nullable=False),
+        )
+    # A new database gets the files table from create_all, complete
+    if inspector.has_table('files') and 'blob_id' not in {column['name'] for column in inspector.get_columns('files')}:
+        with op.batch_alter_table('files') as batch:
+            batch.add_column(sa.Column('blob_id', sa.Integer, nullable=True))
+            batch.create_foreign_key('fk_files_blob_id_blobs', 'blobs', ['blob_id'], ['id'])
+
+
+def downgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    with op.batch_alter_table('files') as batch:
+        for foreign_key in inspector.get_foreign_keys('files'):
+            if foreign_key['referred_table'] == 'blobs':
+                batch.drop_constraint(foreign_key['name'], type_='foreignkey')
+        batch.drop_column('blob_id')
+    op.drop_table('blobs')
@@ -0,0 +1,43 @@
+"""Keyset pagination indexes on files
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 09:10:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# One per sort order, per user and system-wide, as in models/file.py
+INDEXES = {
+    'ix_files_user_id_upload_date_id': ['user_id', 'upload_date', 'id'],
+    'ix_files_user_id_file_size_id': ['user_id', 'file_size', 'id'],
+    'ix_files_user_id_filename_id': ['user_id', 'filename', 'id'],
+    'ix_files_upload_date_id': ['upload_date', 'id'],
+    'ix_files_file_size_id': ['file_size', 'id'],
+    'ix_files_filename_id': ['filename', 'id'],
+}
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('files'):
+        return
+    existing = {index['name'] for index in inspector.get_indexes('files')}
+    for name, columns in INDEXES.items():
+        if name not in existing:
+            op.create_index(name, 'files', columns)
+
+
+def downgrade() -> None:
+    for name in INDEXES:
+        op.drop_index(name, table_name='files')
@@ -0,0 +1,46 @@
+"""Background processing results on files
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 09:20:00
+
+Files uploaded before this keep processing_status NULL: they were never queued.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = [
+    sa.Column(
+        'processing_status',
+        sa.Enum('pending', 'processing', 'ready', 'quarantined', 'failed', name='processingstatus'),
+        nullable=True
+    ),
+    sa.Column('detected_type', sa.String(255), nullable=True),
+    sa.Column('file_metadata', sa.JSON, nullable=True),
+]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('files'):
+        return
+    existing = {column['name'] for column in inspector.get_columns('files')}
+    with op.batch_alter_table('files') as batch:
+        for column in COLUMNS:
+            if column.name not in existing:
+                batch.add_column(column)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('files') as batch:
+        for column in reversed(COLUMNS):
+            batch.drop_column(column.name)
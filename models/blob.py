@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.orm import relationship
+from datetime import datetime
+from db.base import Base
+
+class Blob(Base):
+    __tablename__ = 'blobs'
+    id = Column(Integer, primary_key=True, index=True)
+    digest = Column(String(64), unique=True, nullable=False)
+    file_path = Column(String(255), nullable=False)
+    file_size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_date = Column(DateTime, nullable=False, default=datetime.now)
+
+    files = relationship('File', back_populates='blob')
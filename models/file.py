@@ -1,10 +1,20 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, Index, JSON
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from db.base import Base
+from schemas.file import ProcessingStatus
 
 class File(Base):
     __tablename__ = 'files'
+    # Keyset pagination indexes: one per sort order, per user and system-wide
+    __table_args__ = (
+        Index('ix_files_user_id_upload_date_id', 'user_id', 'upload_date', 'id'),
+        Index('ix_files_user_id_file_size_id', 'user_id', 'file_size', 'id'),
+        Index('ix_files_user_id_filename_id', 'user_id', 'filename', 'id'),
+        Index('ix_files_upload_date_id', 'upload_date', 'id'),
+        Index('ix_files_file_size_id', 'file_size', 'id'),
+        Index('ix_files_filename_id', 'filename', 'id'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String(255), nullable=False)
     file_path = Column(String(255), nullable=False)
@@ -12,5 +22,11 @@ class File(Base):
     file_size = Column(Integer, nullable=False)
     file_type = Column(String(255), nullable=False)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    blob_id = Column(Integer, ForeignKey('blobs.id'), nullable=True)
+    # Set by background processing after upload; NULL for files that were never queued
+    processing_status = Column(Enum(ProcessingStatus), nullable=True)
+    detected_type = Column(String(255), nullable=True)
+    file_metadata = Column(JSON, nullable=True)
     
     user = relationship('User', back_populates='files')
+    blob = relationship('Blob', back_populates='files')
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, Index, Text
+from datetime import datetime
+from db.base import Base
+from schemas.job import JobStatus
+
+class Job(Base):
+    __tablename__ = 'jobs'
+    # Workers look for due jobs by status and time
+    __table_args__ = (
+        Index('ix_jobs_status_run_after', 'status', 'run_after'),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    file_id = Column(Integer, ForeignKey('files.id', ondelete='CASCADE'), nullable=True, index=True)
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.pending)
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, nullable=False, default=datetime.now)
+    locked_until = Column(DateTime, nullable=True)  # lease of the worker running it
+    last_error = Column(Text, nullable=True)
+    created_date = Column(DateTime, nullable=False, default=datetime.now)
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy.dialects import mysql
+from db.base import Base
+
+# Grams are compared byte for byte; MySQL's default collations would fold case and accents
+GramString = String(3).with_variant(mysql.VARCHAR(3, collation='utf8mb4_bin'), 'mysql')
+
+class FileNameGram(Base):
+    __tablename__ = 'file_name_grams'
+    gram = Column(GramString, primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    file_id = Column(Integer, ForeignKey('files.id', ondelete='CASCADE'), primary_key=True, index=True)
+
+
+class UserSearchGram(Base):
+    __tablename__ = 'user_search_grams'
+    gram = Column(GramString, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True, index=True)
@@ -0,0 +1,13 @@
+from sqlalchemy import BigInteger, Column, DateTime, Integer, String
+from db.base import Base
+
+# Revoked share links. Servers keep these in memory to check links against, so a row is
+# only needed until the links it blocks have expired.
+
+class ShareRevocation(Base):
+    __tablename__ = 'share_revocations'
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(Integer, nullable=False)  # no foreign key: revocations outlive deleted files
+    share_id = Column(String(32), nullable=True)  # NULL revokes every link to the file issued before revoked_at
+    revoked_at = Column(BigInteger, nullable=False)  # milliseconds since the epoch, as in the links
+    expires_date = Column(DateTime, nullable=False, index=True)
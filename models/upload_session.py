@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.orm import relationship
+from datetime import datetime
+from db.base import Base
+
+class UploadSession(Base):
+    __tablename__ = 'upload_sessions'
+    id = Column(String(32), primary_key=True)
+    filename = Column(String(255), nullable=False)
+    file_size = Column(Integer, nullable=False)
+    file_type = Column(String(255), nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    created_date = Column(DateTime, nullable=False, default=datetime.now)
+    updated_date = Column(DateTime, nullable=False, default=datetime.now, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+
+    chunks = relationship('UploadSessionChunk', cascade='all, delete-orphan', passive_deletes=True)
+
+
+class UploadSessionChunk(Base):
+    __tablename__ = 'upload_session_chunks'
+    session_id = Column(String(32), ForeignKey('upload_sessions.id', ondelete='CASCADE'), primary_key=True)
+    chunk_index = Column(Integer, primary_key=True)
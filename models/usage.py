@@ -0,0 +1,20 @@
+from sqlalchemy import BigInteger, Column, Date, Integer, String, ForeignKey
+from db.base import Base
+
+# Per-user storage summaries, maintained by the file services in the same transaction
+# as the change they describe, so analytics never have to scan the files table.
+
+class UserStorageUsage(Base):
+    __tablename__ = 'user_storage_usage'
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    file_type = Column(String(255), primary_key=True)
+    file_count = Column(Integer, nullable=False, default=0)
+    total_size = Column(BigInteger, nullable=False, default=0)
+
+
+class UserDailyUploads(Base):
+    __tablename__ = 'user_daily_uploads'
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    file_count = Column(Integer, nullable=False, default=0)
+    total_size = Column(BigInteger, nullable=False, default=0)
@@ -1,6 +1,28 @@
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import date, datetime
+from enum import Enum
+
+class FileSortField(str, Enum):
+    date = "date"
+    size = "size"
+    name = "name"
+
+class SearchMode(str, Enum):
+    substring = "substring"
+    prefix = "prefix"
+    tokens = "tokens"
+
+class ProcessingStatus(str, Enum):
+    pending = "pending"
+    processing = "processing"
+    ready = "ready"
+    quarantined = "quarantined"  # flagged by the scanner, or content of a type we do not accept
+    failed = "failed"
+
+class SortOrder(str, Enum):
+    asc = "asc"
+    desc = "desc"
 
 class FileBase(BaseModel):
     filename: str
@@ -15,26 +37,88 @@ class FileCreate(FileBase):
 class FileSchema(FileBase):
     id: int
     user_id: int
+    processing_status: Optional[ProcessingStatus] = None
+    detected_type: Optional[str] = None
+    file_metadata: Optional[dict] = None
 
     class Config:
         orm_mode = True
 
+class BatchUploadResult(BaseModel):
+    filename: Optional[str] = None
+    status_code: int
+    file: Optional[FileSchema] = None
+    detail: Optional[str] = None
+
+class BatchUploadResponse(BaseModel):
+    uploaded: int
+    failed: int
+    results: List[BatchUploadResult]
+
+class FilePage(BaseModel):
+    items: List[FileSchema]
+    next_cursor: Optional[str] = None
+
 class FileUpdate(BaseModel):
     filename: Optional[str] = None
 
+class FileFilter(BaseModel):
+    ids: Optional[List[int]] = None
+    file_type: Optional[str] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+    name_pattern: Optional[str] = None  # shell-style, e.g. "*.tmp" or "scan_??.pdf"
+
+class FileBulkRename(BaseModel):
+    filter: FileFilter
+    find: str
+    replace: str
+
+class FileIds(BaseModel):
+    ids: List[int]
+
+class BulkDeleteResponse(BaseModel):
+    deleted: int
+
+class BulkRenameResponse(BaseModel):
+    renamed: int
+
 class FileDeleteResponse(BaseModel):
     message: str
     file: FileSchema
 
 
+class SharePermission(str, Enum):
+    download = "download"
+    thumbnail = "thumbnail"
+
+class FileShareCreate(BaseModel):
+    expires_in: Optional[int] = None  # seconds; the server's default when not given
+    permissions: List[SharePermission] = [SharePermission.download]
+
 class FileShare(BaseModel):
     file_id: int
     share_link: str
+    share_id: str
+    expires_at: datetime
+    permissions: List[SharePermission]
+
+class FileTypeUsage(BaseModel):
+    file_type: str
+    file_count: int
+    total_size: int
+
+class DailyUploads(BaseModel):
+    day: date
+    file_count: int
+    total_size: int
 
 class FileAnalytics(BaseModel):
     total_files: int
     total_size: int
     size_unit: str
+    by_type: List[FileTypeUsage] = []
+    daily_uploads: List[DailyUploads] = []
 
     @property
     def total_size_with_unit(self):
@@ -0,0 +1,6 @@
+from enum import Enum
+
+class JobStatus(str, Enum):
+    pending = "pending"
+    running = "running"
+    failed = "failed"
@@ -0,0 +1,20 @@
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from datetime import datetime
+
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(..., max_length=255)
+    file_type: str
+    file_size: int = Field(..., ge=0)
+    chunk_size: Optional[int] = None
+
+class UploadSessionSchema(BaseModel):
+    id: str
+    filename: str
+    file_type: str
+    file_size: int
+    chunk_size: int
+    total_chunks: int
+    received_chunks: List[int]
+    created_date: datetime
+    expires_at: datetime
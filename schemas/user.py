@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field, validator
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 import re
 from enum import Enum
@@ -41,6 +41,10 @@ class UserIn(UserBase):
     class Config:
         orm_mode = True
 
+class UserPage(BaseModel):
+    items: List[UserIn]
+    next_cursor: Optional[str] = None
+
 class UserDeleteResponse(BaseModel):
     user: UserIn
     message: str
\ No newline at end of file
@@ -0,0 +1,128 @@
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models.file import File
+from models.usage import UserDailyUploads, UserStorageUsage
+from schemas.file import DailyUploads, FileTypeUsage
+
+DAILY_UPLOADS_WINDOW_DAYS = 30
+
+
+# Adds the deltas to the summary row identified by `keys`, creating it on first use.
+# Runs inside the caller's transaction.
+def _apply_delta(db: Session, model, keys: dict, file_count: int, total_size: int) -> None:
+    statement = update(model).where(*(getattr(model, column) == value for column, value in keys.items())).values(
+        file_count=model.file_count + file_count,
+        total_size=model.total_size + total_size
+    )
+    if db.execute(statement).rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.execute(insert(model).values(**keys, file_count=file_count, total_size=total_size))
+    except IntegrityError:
+        # Another transaction created the row first
+        db.execute(statement)
+
+
+def record_file_added(db: Session, file: File) -> None:
+    _apply_delta(db, UserStorageUsage, {"user_id": file.user_id, "file_type": file.file_type}, 1, file.file_size)
+    _apply_delta(db, UserDailyUploads, {"user_id": file.user_id, "day": file.upload_date.date()}, 1, file.file_size)
+
+
+# Same as record_file_added for many files, with one update per summary row touched.
+def record_files_added(db: Session, files: Iterable[File]) -> None:
+    by_type: Dict[Tuple, List[int]] = {}
+    by_day: Dict[Tuple, List[int]] = {}
+    for file in files:
+        for totals, key in ((by_type, (file.user_id, file.file_type)), (by_day, (file.user_id, file.upload_date.date()))):
+            entry = totals.setdefault(key, [0, 0])
+            entry[0] += 1
+            entry[1] += file.file_size
+    for (user_id, file_type), (file_count, total_size) in by_type.items():
+        _apply_delta(db, UserStorageUsage, {"user_id": user_id, "file_type": file_type}, file_count, total_size)
+    for (user_id, day), (file_count, total_size) in by_day.items():
+        _apply_delta(db, UserDailyUploads, {"user_id": user_id, "day": day}, file_count, total_size)
+
+
+# Daily upload rollups record upload activity, so they are left as they are on delete.
+def record_file_removed(db: Session, file: File) -> None:
+    _apply_delta(db, UserStorageUsage, {"user_id": file.user_id, "file_type": file.file_type}, -1, -file.file_size)
+
+
+# Moves the file from the summary of `old_type` to the one of its current type
+def record_file_type_changed(db: Session, file: File, old_type: str) -> None:
+    _apply_delta(db, UserStorageUsage, {"user_id": file.user_id, "file_type": old_type}, -1, -file.file_size)
+    _apply_delta(db, UserStorageUsage, {"user_id": file.user_id, "file_type": file.file_type}, 1, file.file_size)
+
+
+# Same as record_file_removed for every file in `file_ids`, before they are deleted.
+def record_files_removed(db: Session, file_ids: List[int]) -> None:
+    totals = db.execute(
+        select(File.user_id, File.file_type, func.count().label("file_count"), func.sum(File.file_size).label("total_size"))
+        .where(File.id.in_(file_ids)).group_by(File.user_id, File.file_type)
+    ).all()
+    for row in totals:
+        _apply_delta(db, UserStorageUsage, {"user_id": row.user_id, "file_type": row.file_type},
+                     -row.file_count, -row.total_size)
+
+
+def usage_by_type(db: Session, user_id: Optional[int] = None) -> List[FileTypeUsage]:
+    query = select(
+        UserStorageUsage.file_type,
+        func.sum(UserStorageUsage.file_count).label("file_count"),
+        func.sum(UserStorageUsage.total_size).label("total_size")
+    ).group_by(UserStorageUsage.file_type).order_by(UserStorageUsage.file_type)
+    if user_id is not None:
+        query = query.where(UserStorageUsage.user_id == user_id)
+    return [
+        FileTypeUsage(file_type=row.file_type, file_count=row.file_count, total_size=row.total_size)
+        for row in db.execute(query) if row.file_count
+    ]
+
+
+def daily_uploads(db: Session, user_id: Optional[int] = None, days: int = DAILY_UPLOADS_WINDOW_DAYS) -> List[DailyUploads]:
+    query = select(
+        UserDailyUploads.day,
+        func.sum(UserDailyUploads.file_count).label("file_count"),
+        func.sum(UserDailyUploads.total_size).label("total_size")
+    ).where(UserDailyUploads.day > date.today() - timedelta(days=days)).group_by(UserDailyUploads.day).order_by(
+        UserDailyUploads.day
+    )
+    if user_id is not None:
+        query = query.where(UserDailyUploads.user_id == user_id)
+    return [
+        DailyUploads(day=row.day, file_count=row.file_count, total_size=row.total_size)
+        for row in db.execute(query)
+    ]
+
+
+# Recomputes the summaries from the files table, for one user or for everyone. Daily
+# rollups can only be rebuilt from the files that still exist.
+def rebuild_usage_summaries(db: Session, user_id: Optional[int] = None) -> None:
+    scope = [File.user_id == user_id] if user_id is not None else []
+    usage_scope = [UserStorageUsage.user_id == user_id] if user_id is not None else []
+    daily_scope = [UserDailyUploads.user_id == user_id] if user_id is not None else []
+    db.execute(delete(UserStorageUsage).where(*usage_scope))
+    db.execute(delete(UserDailyUploads).where(*daily_scope))
+
+    by_type = db.execute(
+        select(File.user_id, File.file_type, func.count().label("file_count"), func.sum(File.file_size).label("total_size"))
+        .where(*scope).group_by(File.user_id, File.file_type)
+    ).all()
+    if by_type:
+        db.execute(insert(UserStorageUsage), [row._asdict() for row in by_type])
+
+    upload_day = func.date(File.upload_date)
+    by_day = db.execute(
+        select(File.user_id, upload_day.label("day"), func.count().label("file_count"),
+               func.sum(File.file_size).label("total_size"))
+        .where(*scope).group_by(File.user_id, upload_day)
+    ).all()
+    if by_day:
+        db.execute(insert(UserDailyUploads), [
+            {**row._asdict(), "day": date.fromisoformat(str(row.day)[:10])} for row in by_day
+        ])
+    db.commit()
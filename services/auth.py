@@ -1,7 +1,27 @@
+import json
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from core.config import settings
+from models.user import User
+from schemas.auth import TokenData
+from schemas.user import UserRole
+from utils.cache import TTLCache, create_cache_backend
+from utils.password_utils import verify_and_update_password
+
+# Decoded tokens and the users they resolve to are cached so that authenticated requests
+# do not query the users table. Principals live in a short-lived per-process tier and,
+# when CACHE_BACKEND_URL is set, in a shared tier; the services invalidate both whenever
+# a user changes. Other workers' local entries expire within AUTH_CACHE_TTL_SECONDS.
+PRINCIPAL_FIELDS = ("id", "username", "email", "joined_date", "role")
+
+token_cache = TTLCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS)
+principal_cache = TTLCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS)
+shared_principal_cache = create_cache_backend(settings.CACHE_BACKEND_URL)
 
 
 
@@ -14,3 +34,81 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
+
+
+# Raises JWTError for invalid or expired tokens. Returns TokenData with missing fields
+# left as None, for the caller to reject.
+def decode_access_token(token: str) -> TokenData:
+    token_data = token_cache.get(token)
+    if token_data is not None:
+        return token_data
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    token_data = TokenData(username=payload.get("sub"), role=payload.get("role"))
+    expires_in = payload.get("exp", 0) - time.time()
+    if expires_in > 0:
+        token_cache.set(token, token_data, ttl=expires_in)
+    return token_data
+
+
+def _principal_key(username: str) -> str:
+    return f"principal:{username}"
+
+
+async def _cache_principal(user: User) -> None:
+    fields = {field: getattr(user, field) for field in PRINCIPAL_FIELDS}
+    principal_cache.set(user.username, fields)
+    if shared_principal_cache is not None:
+        await shared_principal_cache.set(_principal_key(user.username), json.dumps({
+            **fields, "joined_date": user.joined_date.isoformat(), "role": user.role.value
+        }).encode(), settings.AUTH_CACHE_SHARED_TTL_SECONDS)
+
+
+async def _cached_principal(username: str) -> Optional[dict]:
+    fields = principal_cache.get(username)
+    if fields is not None or shared_principal_cache is None:
+        return fields
+    cached = await shared_principal_cache.get(_principal_key(username))
+    if cached is None:
+        return None
+    fields = json.loads(cached)
+    fields["joined_date"] = datetime.fromisoformat(fields["joined_date"])
+    fields["role"] = UserRole(fields["role"])
+    principal_cache.set(username, fields)
+    return fields
+
+
+# Resolves a username to a User attached to `db`. A cached principal is attached without
+# a query, with the columns that are not cached (the password hash) unloaded. An
+# AsyncSession cannot load them lazily, so code that reads them reloads the user first,
+# with `await db.refresh(user, ["password"])`; assigning them needs no reload.
+async def get_principal(db: AsyncSession, username: str) -> Optional[User]:
+    fields = await _cached_principal(username)
+    if fields is None:
+        user = await db.scalar(select(User).where(User.username == username))
+        if user is not None:
+            await _cache_principal(user)
+        return user
+    user = User(**fields)
+    make_transient_to_detached(user)
+    return await db.merge(user, load=False)
+
+
+async def invalidate_principal(username: str) -> None:
+    principal_cache.delete(username)
+    if shared_principal_cache is not None:
+        await shared_principal_cache.delete(_principal_key(username))
+
+
+# Checks credentials on the hashing executor. A hash made at another cost than the
+# configured one is replaced while the plain password is at hand.
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
+    user = await db.scalar(select(User).where(User.username == username))
+    if user is None:
+        return None
+    verified, new_hash = await verify_and_update_password(password, user.password)
+    if not verified:
+        return None
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
+    return user
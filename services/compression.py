@@ -0,0 +1,97 @@
+import asyncio
+import os
+import time
+from typing import Dict, NamedTuple, Optional
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from core.config import settings
+from core.metrics import counter, histogram
+from services.file import ALLOWED_FILE_TYPES, PRECOMPRESSED_FILE_TYPES
+from services.storage import UPLOAD_DIRECTORY, local_copy
+from utils.cache import DiskLRUCache
+from utils.compression import ENCODERS, compress_file, negotiate_encoding
+
+# Compressed copies of text and other compressible downloads, made on first request in
+# each coding a client asks for and kept in a size-bounded cache directory. Like
+# renditions they are named after the content, so they never go stale and files with the
+# same content share them.
+ENCODED_DIRECTORY = os.path.join(UPLOAD_DIRECTORY, ".encoded")
+COMPRESSIBLE_FILE_TYPES = ALLOWED_FILE_TYPES - PRECOMPRESSED_FILE_TYPES
+
+ENCODED_REQUESTS = counter(
+    "encoded_download_requests_total", "Compressed download lookups by coding and cache result", ["encoding", "result"]
+)
+COMPRESS_SECONDS = histogram("download_compress_seconds", "Time to compress a file for download", ["encoding"])
+
+
+class EncodedVariant(NamedTuple):
+    name: str  # file name in the cache
+    encoding: str
+    etag: str
+
+
+_cache: Optional[DiskLRUCache] = None
+_compressing: Dict[str, asyncio.Task] = {}
+
+
+def _get_cache() -> DiskLRUCache:
+    global _cache
+    if _cache is None:
+        _cache = DiskLRUCache(ENCODED_DIRECTORY, settings.COMPRESSION_CACHE_MAX_BYTES)
+    return _cache
+
+
+def is_compressible(file_type: str, file_size: int) -> bool:
+    return file_type in COMPRESSIBLE_FILE_TYPES and file_size >= settings.COMPRESSION_MIN_SIZE
+
+
+# The compressed variant to send for a download of content identified by `etag`, or None
+# to send it as it is. Byte ranges are only served on the content as it is.
+def negotiate_variant(
+    accept_encoding: Optional[str], has_range: bool, file_type: str, file_size: int, etag: str
+) -> Optional[EncodedVariant]:
+    if has_range or not is_compressible(file_type, file_size):
+        return None
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding is None:
+        return None
+    content = etag.strip('"')
+    return EncodedVariant(f"{content}.{ENCODERS[encoding].extension}", encoding, f'"{content}-{encoding}"')
+
+
+async def _compress(source: str, variant: EncodedVariant) -> str:
+    cache = _get_cache()
+    temp_location = cache.temp_path(variant.name)
+    started = time.perf_counter()
+    try:
+        async with local_copy(source) as path:
+            await run_in_threadpool(compress_file, path, temp_location, variant.encoding)
+        return await run_in_threadpool(cache.add, variant.name, temp_location)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found on disk")
+    finally:
+        COMPRESS_SECONDS.observe(time.perf_counter() - started, encoding=variant.encoding)
+        await run_in_threadpool(_discard, temp_location)  # left behind when anything failed
+
+
+def _discard(location: str) -> None:
+    if os.path.exists(location):
+        os.remove(location)
+
+
+# Returns the path of the compressed variant, compressing on a cache miss. Concurrent
+# requests for the same variant wait for one compression.
+async def get_encoded_variant(source: str, variant: EncodedVariant) -> str:
+    path = await run_in_threadpool(_get_cache().get, variant.name)
+    if path is not None:
+        ENCODED_REQUESTS.inc(encoding=variant.encoding, result="hit")
+        return path
+    task = _compressing.get(variant.name)
+    if task is None:
+        ENCODED_REQUESTS.inc(encoding=variant.encoding, result="miss")
+        task = asyncio.ensure_future(_compress(source, variant))
+        _compressing[variant.name] = task
+        task.add_done_callback(lambda _: _compressing.pop(variant.name, None))
+    else:
+        ENCODED_REQUESTS.inc(encoding=variant.encoding, result="coalesced")
+    return await asyncio.shield(task)
@@ -1,13 +1,32 @@
+import asyncio
 import os
-from datetime import datetime
-from typing import List
-from fastapi import UploadFile, HTTPException, Query
-from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple, Union
+from fastapi import BackgroundTasks, UploadFile, HTTPException
+from sqlalchemy import Select, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+from starlette.concurrency import run_in_threadpool
+from core.config import settings
 from models.file import File
 from models.user import User
-from schemas.file import FileUpdate, FileShare, FileAnalytics
+from schemas.file import (BatchUploadResponse, BatchUploadResult, BulkDeleteResponse, BulkRenameResponse, FileBulkRename,
+                          FileFilter, FilePage, FileSortField, FileUpdate, FileShare, FileShareCreate, FileAnalytics,
+                          ProcessingStatus, SearchMode, SortOrder)
+from services.analytics import (daily_uploads, record_file_added, record_file_removed, record_files_added,
+                                record_files_removed, usage_by_type)
+from services.file_cache import (cache_file, cache_page, get_cached_file, get_cached_page, invalidate_user_files,
+                                 user_version)
+from services.jobs import enqueue_jobs, notify_job_workers
+from services.search import (filter_files_by_name, glob_to_like, index_file, index_new_files, reindex_files,
+                             unindex_file, unindex_files)
+from services.share import remember_revocations, revoke_shares, sign_share_token
+from services.storage import (acquire_blob, check_stored_contents, discard_staged_file, find_live_blob, release_blob,
+                              release_blobs, remove_stored_file, remove_stored_files, remove_unused_blobs,
+                              stage_upload_stream, store_new_content, store_new_contents, stored_file_exists)
+from utils.pagination import decode_cursor, encode_cursor, keyset_condition
+from utils.zip_stream import ZipEntry
 
-UPLOAD_DIRECTORY = "uploads"
 ALLOWED_FILE_TYPES = {
     "image/jpeg", "image/png", "video/mp4", "application/pdf",
     "image/gif", "video/x-msvideo", "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
@@ -15,145 +34,603 @@ ALLOWED_FILE_TYPES = {
     "application/vnd.ms-excel", "application/vnd.openxmlformats-officedocument.presentationml.presentation",
     "application/vnd.ms-powerpoint", "text/plain", "text/csv"
 }
-MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
-
-
-def save_upload_file(upload_file: UploadFile, destination: str) -> None:
-    with open(destination, "wb") as buffer:
-        buffer.write(upload_file.file.read())
-
-
-def upload_file_service(user_id, file: UploadFile, db: Session):
-    if file.content_type not in ALLOWED_FILE_TYPES:
+# Formats that are compressed already; archives store them as they are
+PRECOMPRESSED_FILE_TYPES = {
+    "image/jpeg", "image/png", "image/gif", "video/mp4", "video/x-msvideo", "application/pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+}
+MAX_FILE_SIZE = settings.MAX_FILE_SIZE
+BATCH_UPLOAD_MAX_FILES = settings.BATCH_UPLOAD_MAX_FILES
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+BULK_BATCH_SIZE = 1000  # ids per set-based statement in bulk operations
+BULK_FETCH_MAX_IDS = 1000
+PROCESS_FILE_JOB = "process_file"  # content checks after upload, see services.processing
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    name = os.path.basename(filename or "")
+    if name in ("", ".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid file name")
+    return name
+
+
+async def iter_upload_file(upload_file: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+
+async def upload_stream_service(
+    user_id: int,
+    filename: Optional[str],
+    content_type: Optional[str],
+    chunks: AsyncIterator[bytes],
+    db: AsyncSession,
+    content_length: Optional[int] = None,
+    expected_digest: Optional[str] = None
+) -> File:
+    if content_type not in ALLOWED_FILE_TYPES:
         raise HTTPException(status_code=400, detail="Invalid file type")
-
-    file_location = os.path.join(UPLOAD_DIRECTORY, file.filename)
-
-    content = file.file.read()
-    if len(content) > MAX_FILE_SIZE:
+    if content_length is not None and content_length > MAX_FILE_SIZE:
         raise HTTPException(status_code=400, detail="File size exceeds the limit")
 
-    file.file.seek(0)
-
-    save_upload_file(file, file_location)
+    filename = safe_filename(filename)
 
-    file_size = os.path.getsize(file_location)
-
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
+    # A client that announces the digest of content we already hold only needs hashing.
+    known_blob = expected_digest is not None and await db.run_sync(find_live_blob, expected_digest.lower()) is not None
+    # The body may take a while to arrive; its connection goes back to the pool meanwhile
+    await db.commit()
+    temp_location, file_size, digest = await stage_upload_stream(chunks, MAX_FILE_SIZE, write=not known_blob)
+    if expected_digest is not None and digest != expected_digest.lower():
+        discard_staged_file(temp_location)
+        raise HTTPException(status_code=400, detail="Content digest mismatch")
+
+    return await store_upload(db, user_id, filename, content_type, file_size, digest, temp_location)
+
+
+# Records a fully staged upload as a File of `user_id`, deduplicating its content.
+async def store_upload(
+    db: AsyncSession,
+    user_id: int,
+    filename: str,
+    content_type: str,
+    file_size: int,
+    digest: str,
+    temp_location: Optional[str]
+) -> File:
+    try:
+        stored = await store_new_content(db, digest, temp_location)
+        blob = await db.run_sync(acquire_blob, digest, file_size, stored)
+        if stored:
+            await check_stored_contents([blob.file_path])
+    except BaseException:
+        await db.rollback()
+        discard_staged_file(temp_location)
+        raise
+
     db_file = File(
-        filename=file.filename,
-        file_path=file_location,
+        filename=filename,
+        file_path=blob.file_path,
         upload_date=datetime.now(),
         file_size=file_size,
-        file_type=file.content_type,
-        user_id=user_id
+        file_type=content_type,
+        user_id=user_id,
+        blob_id=blob.id,
+        processing_status=ProcessingStatus.pending
     )
 
     db.add(db_file)
-    db.commit()
-    db.refresh(db_file)
+    await db.flush()
+    await db.run_sync(index_file, db_file)
+    await db.run_sync(record_file_added, db_file)
+    await db.run_sync(enqueue_jobs, PROCESS_FILE_JOB, [db_file.id])
+    await db.commit()
+    await invalidate_user_files(user_id)
+    notify_job_workers()
+    await db.refresh(db_file)
 
     return db_file
 
 
-def list_user_files_service(user_id: int, db: Session, limit: int = 10, offset: int = 0, search: str = None) -> List[File]:
-    query = db.query(File).filter(File.user_id == user_id)
-    if search:
-        query = query.filter(File.filename.ilike(f"%{search}%"))
-    files = query.offset(offset).limit(limit).all()
-    return files
+async def upload_file_service(user_id: int, file: UploadFile, db: AsyncSession) -> File:
+    return await upload_stream_service(
+        user_id, file.filename, file.content_type, iter_upload_file(file), db, content_length=file.size
+    )
+
+
+StagedUpload = Tuple[int, str, str, Tuple[Optional[str], int, str]]  # index, name, type, staging result
+
+
+async def _stage_batch_part(file: UploadFile, slots: asyncio.Semaphore) -> Tuple[Optional[str], int, str]:
+    if file.content_type not in ALLOWED_FILE_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid file type")
+    if file.size is not None and file.size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=400, detail="File size exceeds the limit")
+    safe_filename(file.filename)
+    async with slots:
+        return await stage_upload_stream(iter_upload_file(file), MAX_FILE_SIZE)
+
+
+# Records every staged part in the caller's transaction: a blob reference each, then the
+# File rows in a single flush, their search grams in one INSERT and the usage summaries
+# with one update per row touched. `stored` holds the digests of the contents stored for
+# this batch. A part whose blob cannot be acquired is left out.
+def _record_batch(
+    db: Session, user_id: int, staged: List[StagedUpload], stored: Set[str]
+) -> Dict[int, Union[File, HTTPException]]:
+    outcomes: Dict[int, Union[File, HTTPException]] = {}
+    upload_date = datetime.now()
+    for index, filename, content_type, (_, file_size, digest) in staged:
+        try:
+            blob = acquire_blob(db, digest, file_size, digest in stored)
+        except HTTPException as e:
+            outcomes[index] = e
+            continue
+        outcomes[index] = File(
+            filename=filename,
+            file_path=blob.file_path,
+            upload_date=upload_date,
+            file_size=file_size,
+            file_type=content_type,
+            user_id=user_id,
+            blob_id=blob.id,
+            processing_status=ProcessingStatus.pending
+        )
+    files = [outcome for outcome in outcomes.values() if isinstance(outcome, File)]
+    if files:
+        db.add_all(files)
+        db.flush()
+        index_new_files(db, files)
+        record_files_added(db, files)
+        enqueue_jobs(db, PROCESS_FILE_JOB, [file.id for file in files])
+    return outcomes
+
+
+# Uploads many files in one request. Parts are staged to storage concurrently and the
+# metadata of all of them is committed in one transaction; a part that fails validation
+# or storage is reported in its result without failing the others.
+async def upload_batch_service(user_id: int, files: List[UploadFile], db: AsyncSession) -> BatchUploadResponse:
+    if not files:
+        raise HTTPException(status_code=400, detail="No files uploaded")
+    if len(files) > BATCH_UPLOAD_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_UPLOAD_MAX_FILES} files can be uploaded at once")
+
+    slots = asyncio.Semaphore(settings.BATCH_UPLOAD_CONCURRENCY)
+    results = await asyncio.gather(*(_stage_batch_part(file, slots) for file in files), return_exceptions=True)
+    staged: List[StagedUpload] = []
+    outcomes: Dict[int, Union[File, HTTPException]] = {}
+    unexpected = None
+    for index, (file, result) in enumerate(zip(files, results)):
+        if isinstance(result, HTTPException):
+            outcomes[index] = result
+        elif isinstance(result, BaseException):
+            unexpected = unexpected or result
+        else:
+            staged.append((index, safe_filename(file.filename), file.content_type, result))
+    if unexpected is not None:
+        for _, _, _, (temp_location, _, _) in staged:
+            discard_staged_file(temp_location)
+        raise unexpected
+
+    try:
+        stored = await store_new_contents(
+            db, [(digest, temp_location) for _, _, _, (temp_location, _, digest) in staged],
+            settings.BATCH_UPLOAD_CONCURRENCY
+        )
+        outcomes.update(await db.run_sync(_record_batch, user_id, staged, stored))
+        await check_stored_contents(sorted({
+            outcomes[index].file_path for index, _, _, (_, _, digest) in staged
+            if digest in stored and isinstance(outcomes[index], File)
+        }))
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        for _, _, _, (temp_location, _, _) in staged:
+            discard_staged_file(temp_location)
+        raise
+    await invalidate_user_files(user_id)
+    notify_job_workers()
+
+    items = []
+    for index, file in enumerate(files):
+        outcome = outcomes[index]
+        if isinstance(outcome, HTTPException):
+            items.append(BatchUploadResult(filename=file.filename, status_code=outcome.status_code, detail=outcome.detail))
+        else:
+            items.append(BatchUploadResult.model_validate(
+                {"filename": outcome.filename, "status_code": 200, "file": outcome}, from_attributes=True
+            ))
+    uploaded = sum(1 for item in items if item.file is not None)
+    return BatchUploadResponse(uploaded=uploaded, failed=len(items) - uploaded, results=items)
 
 
-def list_all_files_service(db: Session, limit: int = 10, offset: int = 0, search: str = None) -> List[File]:
-    query = db.query(File)
+SORT_COLUMNS = {
+    FileSortField.date: File.upload_date,
+    FileSortField.size: File.file_size,
+    FileSortField.name: File.filename,
+}
+
+
+# The sort value of a decoded cursor, checked against the type of its column
+def _cursor_sort_value(sort: FileSortField, value):
+    if sort == FileSortField.date:
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    # bool is an int to isinstance, hence the exact type check
+    if type(value) is not (int if sort == FileSortField.size else str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value
+
+
+# Keyset pagination: each page continues after the (sort value, id) of the previous
+# page's last row, so every page costs the same however deep it is.
+async def _paginate_files(
+    db: AsyncSession,
+    statement: Select,
+    limit: int,
+    cursor: Optional[str],
+    sort: FileSortField,
+    order: SortOrder
+) -> FilePage:
+    column = SORT_COLUMNS[sort]
+    descending = order == SortOrder.desc
+    if cursor:
+        cursor_sort, value, last_id = decode_cursor(cursor, 3)
+        if cursor_sort != f"{sort.value}:{order.value}":
+            raise HTTPException(status_code=400, detail="Cursor does not match the requested sort order")
+        if type(last_id) is not int:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        value = _cursor_sort_value(sort, value)
+        statement = statement.where(keyset_condition(column, File.id, value, last_id, descending))
+
+    if descending:
+        statement = statement.order_by(column.desc(), File.id.desc())
+    else:
+        statement = statement.order_by(column.asc(), File.id.asc())
+    files = (await db.scalars(statement.limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(files) > limit:
+        files = files[:limit]
+        last = files[-1]
+        next_cursor = encode_cursor(f"{sort.value}:{order.value}", getattr(last, column.key), last.id)
+    return FilePage.model_validate({"items": files, "next_cursor": next_cursor}, from_attributes=True)
+
+
+async def list_user_files_service(
+    user_id: int,
+    db: AsyncSession,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    search: str = None,
+    sort: FileSortField = FileSortField.date,
+    order: SortOrder = SortOrder.asc,
+    match: SearchMode = SearchMode.substring
+) -> FilePage:
+    params = (limit, cursor, search, sort.value, order.value, match.value)
+    version = await user_version(user_id)
+    page = await get_cached_page(user_id, version, params)
+    if page is not None:
+        return page
+    statement = select(File).where(File.user_id == user_id)
+    if search:
+        statement = await db.run_sync(filter_files_by_name, statement, search, match, user_id)
+    page = await _paginate_files(db, statement, limit, cursor, sort, order)
+    await cache_page(user_id, version, params, page)
+    return page
+
+
+async def list_all_files_service(
+    db: AsyncSession,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    search: str = None,
+    sort: FileSortField = FileSortField.date,
+    order: SortOrder = SortOrder.asc,
+    match: SearchMode = SearchMode.substring
+) -> FilePage:
+    statement = select(File)
     if search:
-        query = query.filter(File.filename.ilike(f"%{search}%"))
-    files = query.offset(offset).limit(limit).all()
-    return files
+        statement = await db.run_sync(filter_files_by_name, statement, search, match)
+    return await _paginate_files(db, statement, limit, cursor, sort, order)
 
 
-def get_file_service(file_id: int, user_id: int, db: Session) -> File:
-    file = db.query(File).filter(File.id == file_id, File.user_id == user_id).first()
+async def _get_user_file(db: AsyncSession, file_id: int, user_id: int, *options) -> File:
+    file = await db.scalar(select(File).where(File.id == file_id, File.user_id == user_id).options(*options))
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
     return file
 
 
-def update_file_service(file_id: int, user_id: int, file_update: FileUpdate, db: Session) -> File:
-    file = db.query(File).filter(File.id == file_id, File.user_id == user_id).first()
-    if not file:
-        raise HTTPException(status_code=404, detail="File not found")
+async def get_file_service(file_id: int, user_id: int, db: AsyncSession) -> File:
+    file = await get_cached_file(file_id)
+    if file is not None and file.user_id == user_id:
+        return file
+    version = await user_version(user_id)
+    file = await _get_user_file(db, file_id, user_id, joinedload(File.blob))
+    await cache_file(file, version)
+    return file
+
 
-    old_file_path = file.file_path
+async def update_file_service(file_id: int, user_id: int, file_update: FileUpdate, db: AsyncSession) -> File:
+    file = await _get_user_file(db, file_id, user_id)
 
     if file_update.filename:
-        # Ensure the new filename includes the extension
+        # Ensure the new filename includes the extension. The name only lives in the
+        # database; stored files keep their path.
         old_extension = os.path.splitext(file.filename)[1]
-        new_filename = f"{file_update.filename}{old_extension}"
-        new_file_path = os.path.join("uploads", new_filename)
-
-        # Update the filename and file path in the database
-        file.filename = new_filename
-        file.file_path = new_file_path
-
-        # Update the filename in the filesystem
-        if os.path.exists(old_file_path):
-            try:
-                os.rename(old_file_path, new_file_path)
-            except FileNotFoundError:
-                raise HTTPException(status_code=404, detail="Original file not found on disk")
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error renaming file: {e}")
-        else:
-            raise HTTPException(status_code=404, detail="Original file not found on disk")
+        file.filename = f"{file_update.filename}{old_extension}"
+        await db.run_sync(index_file, file)
 
-    db.commit()
-    db.refresh(file)
+    await db.commit()
+    await invalidate_user_files(user_id)
+    await db.refresh(file)
     return file
 
 
-def delete_file_service(file_id: int, user_id: int, db: Session) -> File:
-    file = db.query(File).filter(File.id == file_id, File.user_id == user_id).first()
-    if not file:
-        raise HTTPException(status_code=404, detail="File not found")
+async def delete_file_service(file_id: int, user_id: int, db: AsyncSession) -> File:
+    file = await _get_user_file(db, file_id, user_id, joinedload(File.blob))
+
+    if file.blob is not None:
+        # The content is only removed once no other file references it
+        unused = await db.run_sync(release_blob, file.blob)
+        await db.run_sync(unindex_file, file.id)
+        await db.run_sync(record_file_removed, file)
+        revocations = await db.run_sync(revoke_shares, [file.id])
+        await db.delete(file)
+        await db.commit()
+        await invalidate_user_files(user_id)
+        remember_revocations(revocations)
+        if unused:
+            await run_in_threadpool(remove_unused_blobs, [file.blob_id])
+        return file
 
     file_path = file.file_path
-    if os.path.exists(file_path):
+    if await run_in_threadpool(stored_file_exists, file_path):
         try:
-            os.remove(file_path)
+            await run_in_threadpool(remove_stored_file, file_path)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error deleting file: {str(e)}")
     else:
         raise HTTPException(status_code=404, detail="File not found on disk")
 
-    db.delete(file)
-    db.commit()
+    await db.run_sync(unindex_file, file.id)
+    await db.run_sync(record_file_removed, file)
+    revocations = await db.run_sync(revoke_shares, [file.id])
+    await db.delete(file)
+    await db.commit()
+    await invalidate_user_files(user_id)
+    remember_revocations(revocations)
     return file
 
 
-def share_file_link_service(file_id: int, user_id: int, db: Session, base_url: str) -> FileShare:
-    file = db.query(File).filter(File.id == file_id, File.user_id == user_id).first()
-    if not file:
-        raise HTTPException(status_code=404, detail="File not found")
-
-    share_link = f"{base_url}/file/shared/{file_id}"
-    return FileShare(file_id=file.id, share_link=share_link)
+def _naive_local(value: datetime) -> datetime:
+    # Upload dates are stored as naive local times
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo is not None else value
+
+
+def _filter_conditions(user_id: int, file_filter: FileFilter) -> list:
+    conditions = []
+    if file_filter.ids is not None:
+        conditions.append(File.id.in_(file_filter.ids))
+    if file_filter.file_type:
+        conditions.append(File.file_type == file_filter.file_type)
+    if file_filter.uploaded_after:
+        conditions.append(File.upload_date >= _naive_local(file_filter.uploaded_after))
+    if file_filter.uploaded_before:
+        conditions.append(File.upload_date < _naive_local(file_filter.uploaded_before))
+    if file_filter.name_pattern:
+        conditions.append(File.filename.like(glob_to_like(file_filter.name_pattern), escape="\\"))
+    if not conditions:
+        raise HTTPException(status_code=400, detail="At least one filter is required")
+    return [File.user_id == user_id, *conditions]
+
+
+def _batches(ids: List[int]):
+    for start in range(0, len(ids), BULK_BATCH_SIZE):
+        yield ids[start:start + BULK_BATCH_SIZE]
+
+
+# Deletes every matching file with set-based statements over batches of ids. Returns the
+# number deleted, the stored files and blobs left unreferenced, to remove after the
+# commit, and the revoked share links.
+def _bulk_delete_files(db: Session, conditions: list) -> Tuple[int, List[str], List[int], List[dict]]:
+    file_ids = db.scalars(select(File.id).where(*conditions).with_for_update()).all()
+    unused_paths = []
+    unused_blob_ids = []
+    revocations = []
+    for batch in _batches(file_ids):
+        # Files stored before content-addressed storage own their path outright
+        unused_paths.extend(db.scalars(select(File.file_path).where(File.id.in_(batch), File.blob_id.is_(None))))
+        unused_blob_ids.extend(release_blobs(db, batch))
+        unindex_files(db, batch)
+        record_files_removed(db, batch)
+        revocations.extend(revoke_shares(db, batch))
+        db.execute(delete(File).where(File.id.in_(batch)))
+    return len(file_ids), unused_paths, unused_blob_ids, revocations
+
+
+async def bulk_delete_files_service(
+    user_id: int, file_filter: FileFilter, db: AsyncSession, background_tasks: BackgroundTasks
+) -> BulkDeleteResponse:
+    conditions = _filter_conditions(user_id, file_filter)
+    try:
+        deleted, unused_paths, unused_blob_ids, revocations = await db.run_sync(_bulk_delete_files, conditions)
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    await invalidate_user_files(user_id)
+    remember_revocations(revocations)
+    background_tasks.add_task(remove_stored_files, unused_paths)
+    background_tasks.add_task(remove_unused_blobs, unused_blob_ids)
+    return BulkDeleteResponse(deleted=deleted)
+
+
+# Replaces `find` with `replacement` in the names of matching files. New names are checked
+# first, then applied with one UPDATE using the database's REPLACE per batch of ids.
+# Like REPLACE, the match is case-sensitive. Stored paths are left as they are.
+def _bulk_rename_files(db: Session, conditions: list, find: str, replacement: str) -> int:
+    rows = db.execute(
+        select(File.id, File.user_id, File.filename)
+        .where(*conditions, File.filename.contains(find, autoescape=True)).with_for_update()
+    ).all()
+    names = {}
+    for row in rows:
+        name = row.filename.replace(find, replacement)
+        if name == row.filename:
+            continue
+        if name in ("", ".", "..") or os.path.basename(name) != name or len(name) > File.filename.type.length:
+            raise HTTPException(status_code=400, detail=f"Invalid new name for '{row.filename}': '{name}'")
+        names[row.id] = name
+    if not names:
+        return 0
+    user_id = rows[0].user_id
+    for batch in _batches(list(names)):
+        db.execute(
+            update(File).where(File.id.in_(batch)).values(filename=func.replace(File.filename, find, replacement))
+            .execution_options(synchronize_session=False)
+        )
+        reindex_files(db, user_id, {file_id: names[file_id] for file_id in batch})
+    return len(names)
+
+
+async def bulk_rename_files_service(user_id: int, bulk_rename: FileBulkRename, db: AsyncSession) -> BulkRenameResponse:
+    if not bulk_rename.find:
+        raise HTTPException(status_code=400, detail="The text to replace cannot be empty")
+    conditions = _filter_conditions(user_id, bulk_rename.filter)
+    try:
+        renamed = await db.run_sync(_bulk_rename_files, conditions, bulk_rename.find, bulk_rename.replace)
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    await invalidate_user_files(user_id)
+    return BulkRenameResponse(renamed=renamed)
+
+
+# Files the user owns among `file_ids`, in id order; ids of other users' files are skipped
+async def get_files_service(file_ids: List[int], user_id: int, db: AsyncSession) -> List[File]:
+    if len(file_ids) > BULK_FETCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_FETCH_MAX_IDS} files can be fetched at once")
+    if not file_ids:
+        return []
+    statement = select(File).where(File.user_id == user_id, File.id.in_(set(file_ids))).order_by(File.id)
+    return (await db.scalars(statement)).all()
+
+
+def _not_quarantined():
+    return or_(File.processing_status.is_(None), File.processing_status != ProcessingStatus.quarantined)
+
+
+def _unique_name(filename: str, taken: set) -> str:
+    name = filename
+    stem, extension = os.path.splitext(filename)
+    copy = 1
+    while name in taken:
+        copy += 1
+        name = f"{stem} ({copy}){extension}"
+    taken.add(name)
+    return name
+
+
+# Lists what an archive of the user's files, or of the given ones, contains. Only the
+# columns the archive needs are loaded; the content is read while the archive streams.
+async def archive_files_service(user_id: int, file_ids: Optional[List[int]], db: AsyncSession) -> List[ZipEntry]:
+    statement = select(File.filename, File.file_path, File.file_size, File.file_type, File.upload_date).where(
+        File.user_id == user_id, _not_quarantined()
+    )
+    if file_ids is not None:
+        if len(file_ids) > BULK_FETCH_MAX_IDS:
+            raise HTTPException(status_code=400, detail=f"At most {BULK_FETCH_MAX_IDS} files can be archived by id")
+        statement = statement.where(File.id.in_(set(file_ids)))
+    rows = (await db.execute(statement.order_by(File.id))).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="No files to download")
+    taken = set()
+    return [
+        ZipEntry(_unique_name(row.filename, taken), row.file_path, row.file_size, row.upload_date,
+                 compress=row.file_type not in PRECOMPRESSED_FILE_TYPES)
+        for row in rows
+    ]
+
+
+# Signs a link that serves the file without authentication until it expires or is
+# revoked. The link holds what serving needs, so downloads through it query nothing.
+async def share_file_link_service(
+    file_id: int, user_id: int, db: AsyncSession, base_url: str, share_create: FileShareCreate
+) -> FileShare:
+    file = await _get_user_file(db, file_id, user_id, joinedload(File.blob))
+    if file.processing_status == ProcessingStatus.quarantined:
+        raise HTTPException(status_code=403, detail="The file is quarantined")
+    expires_in = share_create.expires_in or settings.SHARE_LINK_TTL_SECONDS
+    if not 0 < expires_in <= settings.SHARE_LINK_MAX_TTL_SECONDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Links can expire after at most {settings.SHARE_LINK_MAX_TTL_SECONDS} seconds"
+        )
+    if not share_create.permissions:
+        raise HTTPException(status_code=400, detail="A link needs at least one permission")
+
+    expires_at = datetime.now().replace(microsecond=0) + timedelta(seconds=expires_in)
+    share_id, token = sign_share_token(
+        file.id, file.file_path, file.filename, file.file_type, file.file_size, file_etag(file), file.upload_date,
+        expires_at, share_create.permissions
+    )
+    return FileShare(
+        file_id=file.id,
+        share_link=f"{base_url}/file/public/{token}",
+        share_id=share_id,
+        expires_at=expires_at,
+        permissions=sorted(set(share_create.permissions))
+    )
 
 
-def download_file_service(file_id: int, db: Session) -> File:
-    file = db.query(File).filter(File.id == file_id).first()
-    if not file:
-        raise HTTPException(status_code=404, detail="File not found")
+# Revokes one share link of the file, or all the links shared so far when share_id is None
+async def revoke_share_service(file_id: int, user_id: int, share_id: Optional[str], db: AsyncSession) -> None:
+    file = await _get_user_file(db, file_id, user_id)
+    revocations = await db.run_sync(revoke_shares, [file.id], share_id)
+    await db.commit()
+    remember_revocations(revocations)
+
+
+# Any signed-in user can download a file by its id; `user_id`, the one asking, only
+# decides whether the file is cached, as the version of its owner must be read first.
+async def download_file_service(file_id: int, db: AsyncSession, user_id: Optional[int] = None) -> File:
+    file = await get_cached_file(file_id)
+    if file is None:
+        version = await user_version(user_id) if user_id is not None else None
+        file = await db.scalar(select(File).where(File.id == file_id).options(joinedload(File.blob)))
+        if not file:
+            raise HTTPException(status_code=404, detail="File not found")
+        if file.user_id == user_id:
+            await cache_file(file, version)
+    if file.processing_status == ProcessingStatus.quarantined:
+        raise HTTPException(status_code=403, detail="The file is quarantined")
 
     return file
 
 
-def get_file_analytics_service(user_id: int, db: Session) -> FileAnalytics:
-    files = db.query(File).filter(File.user_id == user_id).all()
-    total_size = sum(file.file_size for file in files)
+# Strong validator derived from the file's identity: the content digest for
+# deduplicated files, otherwise the row itself. Needs File.blob loaded.
+def file_etag(file: File) -> str:
+    if file.blob is not None:
+        return f'"{file.blob.digest}"'
+    return f'"{file.id}-{file.file_size}-{int(file.upload_date.timestamp())}"'
+
+
+async def get_file_analytics_service(user_id: Optional[int], db: AsyncSession) -> FileAnalytics:
+    # Read from the maintained summaries; a user_id of None aggregates every user
+    by_type = await db.run_sync(usage_by_type, user_id)
+    total_files = sum(usage.file_count for usage in by_type)
+    total_size = sum(usage.total_size for usage in by_type)
     total_size_with_unit = total_size
     if total_size < 1024:
         size_unit = "B"
@@ -166,6 +643,7 @@ def get_file_analytics_service(user_id: int, db: Session) -> FileAnalytics:
     else:
         total_size_with_unit = total_size / (1024 ** 3)
         size_unit = "GB"
-    analytics = FileAnalytics(total_files=len(files), total_size=total_size, total_size_with_unit=total_size_with_unit,
-                              size_unit=size_unit)
+    analytics = FileAnalytics(total_files=total_files, total_size=total_size, total_size_with_unit=total_size_with_unit,
+                              size_unit=size_unit, by_type=by_type,
+                              daily_uploads=await db.run_sync(daily_uploads, user_id))
     return analytics
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import secrets
+from datetime import datetime
+from typing import Optional
+from core.config import settings
+from core.metrics import counter
+from models.blob import Blob
+from models.file import File
+from schemas.file import FilePage, ProcessingStatus
+from utils.cache import TTLCache, create_cache_backend
+
+# File metadata and the pages of users' file lists are cached so that lookups and list
+# requests do not query the database. Every user has a version token, part of the key of
+# their list pages and stored with each of their files; the write paths replace it, which
+# makes all their entries stale at once. Like principals, entries live in a short-lived
+# per-process tier and, when CACHE_BACKEND_URL is set, in a shared tier. With a shared
+# tier, versions are read from it on every lookup, so other workers see a write at once;
+# without one, each process keeps its own versions and other workers may serve metadata
+# up to FILE_CACHE_TTL_SECONDS old, deleted and quarantined files included.
+FILE_FIELDS = tuple(column.key for column in File.__table__.columns)
+BLOB_FIELDS = ("id", "digest", "file_path", "file_size")
+
+CACHE_REQUESTS = counter(
+    "file_cache_requests_total", "File metadata cache lookups by kind and tier that answered", ["kind", "result"]
+)
+
+local_cache = TTLCache(settings.FILE_CACHE_MAX_ENTRIES, settings.FILE_CACHE_TTL_SECONDS)
+shared_cache = create_cache_backend(settings.CACHE_BACKEND_URL)
+
+
+def _version_key(user_id: int) -> str:
+    return f"files:version:{user_id}"
+
+
+def _file_key(file_id: int) -> str:
+    return f"files:file:{file_id}"
+
+
+def _page_key(user_id: int, version: str, params: tuple) -> str:
+    # Cursors and search terms can be long, so the parameters are hashed
+    digest = hashlib.sha256(json.dumps(params, default=str).encode()).hexdigest()[:32]
+    return f"files:page:{user_id}:{version}:{digest}"
+
+
+async def _shared_get(key: str) -> Optional[bytes]:
+    if shared_cache is None:
+        return None
+    return await shared_cache.get(key)
+
+
+async def _shared_set(key: str, value: bytes) -> None:
+    if shared_cache is not None:
+        await shared_cache.set(key, value, settings.FILE_CACHE_SHARED_TTL_SECONDS)
+
+
+# Versions live in the shared tier when there is one, so no local copy can hide a write
+# made by another worker; otherwise in the local tier.
+async def _set_version(user_id: int, version: str) -> None:
+    if shared_cache is not None:
+        await _shared_set(_version_key(user_id), version.encode())
+    else:
+        local_cache.set(_version_key(user_id), version)
+
+
+async def user_version(user_id: int) -> str:
+    if shared_cache is not None:
+        cached = await shared_cache.get(_version_key(user_id))
+        version = cached.decode() if cached is not None else None
+    else:
+        version = local_cache.get(_version_key(user_id))
+    if version is None:
+        # Unknown or expired: a fresh version, so no entry made before can match it
+        version = secrets.token_hex(8)
+        await _set_version(user_id, version)
+    return version
+
+
+# Called by every write to a user's files, after it is committed
+async def invalidate_user_files(user_id: int) -> None:
+    await _set_version(user_id, secrets.token_hex(8))
+
+
+async def _get(key: str, kind: str) -> Optional[bytes]:
+    value = local_cache.get(key)
+    if value is not None:
+        CACHE_REQUESTS.inc(kind=kind, result="local")
+        return value
+    value = await _shared_get(key)
+    if value is not None:
+        CACHE_REQUESTS.inc(kind=kind, result="shared")
+        local_cache.set(key, value)
+        return value
+    CACHE_REQUESTS.inc(kind=kind, result="miss")
+    return None
+
+
+async def _set(key: str, value: bytes) -> None:
+    local_cache.set(key, value)
+    await _shared_set(key, value)
+
+
+def _dump_fields(instance, fields: tuple) -> dict:
+    data = {}
+    for field in fields:
+        value = getattr(instance, field)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, ProcessingStatus):
+            value = value.value
+        data[field] = value
+    return data
+
+
+# Returns a File, with its Blob, that is not attached to any session
+async def get_cached_file(file_id: int) -> Optional[File]:
+    cached = await _get(_file_key(file_id), "file")
+    if cached is None:
+        return None
+    entry = json.loads(cached)
+    fields = entry["file"]
+    if entry["version"] != await user_version(fields["user_id"]):
+        return None
+    fields["upload_date"] = datetime.fromisoformat(fields["upload_date"])
+    if fields["processing_status"] is not None:
+        fields["processing_status"] = ProcessingStatus(fields["processing_status"])
+    file = File(**fields)
+    if entry["blob"] is not None:
+        file.blob = Blob(**entry["blob"])
+    return file
+
+
+# Needs File.blob loaded. `version` is the owner's, read before the file was queried, so
+# a write committed in between leaves the entry stale rather than wrong.
+async def cache_file(file: File, version: str) -> None:
+    blob = _dump_fields(file.blob, BLOB_FIELDS) if file.blob is not None else None
+    entry = {"version": version, "file": _dump_fields(file, FILE_FIELDS), "blob": blob}
+    await _set(_file_key(file.id), json.dumps(entry).encode())
+
+
+async def get_cached_page(user_id: int, version: str, params: tuple) -> Optional[FilePage]:
+    cached = await _get(_page_key(user_id, version, params), "page")
+    return FilePage.model_validate_json(cached) if cached is not None else None
+
+
+async def cache_page(user_id: int, version: str, params: tuple, page: FilePage) -> None:
+    await _set(_page_key(user_id, version, params), page.model_dump_json().encode())
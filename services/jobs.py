@@ -0,0 +1,190 @@
+import asyncio
+import multiprocessing
+import random
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from core.config import settings
+from core.metrics import counter, histogram
+from db.session import SessionLocal
+from logger.logger import logger
+from models.job import Job
+from schemas.job import JobStatus
+
+# Work that runs after the request that caused it. Jobs are rows in the jobs table, written
+# in the same transaction as the change they follow up, so none is lost to a restart.
+# Workers in every server process claim due jobs with a time-limited lease; a job whose
+# worker died is claimed again once its lease runs out. Done jobs are deleted, and jobs
+# that failed every attempt are kept as failed with their last error.
+
+JobHandler = Callable[[Job], Awaitable[None]]
+
+JOBS_TOTAL = counter("jobs_total", "Background jobs run, by kind and outcome", ["kind", "outcome"])
+JOB_SECONDS = histogram("job_duration_seconds", "Time spent running a background job", ["kind"])
+
+
+class PermanentJobError(Exception):
+    # Raised by a handler for a failure that retrying cannot fix
+    pass
+
+
+_executor: Optional[Executor] = None
+_wakeup = asyncio.Event()
+
+
+# Queues a job of `kind` for each file, in the caller's transaction
+def enqueue_jobs(db: Session, kind: str, file_ids: List[int]) -> None:
+    if file_ids:
+        db.execute(insert(Job), [{"kind": kind, "file_id": file_id} for file_id in file_ids])
+
+
+# Wakes this process's workers after a commit that queued jobs, instead of at their next poll
+def notify_job_workers() -> None:
+    _wakeup.set()
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if settings.JOB_EXECUTOR == "process":
+            # Spawned rather than forked: the server process runs threads (logging, threadpool)
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.JOB_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            _executor = ThreadPoolExecutor(max_workers=settings.JOB_WORKERS, thread_name_prefix="job")
+    return _executor
+
+
+def shutdown_jobs() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+# Runs CPU or IO heavy work of a handler in the job pool, a thread or a process pool as
+# JOB_EXECUTOR says. With processes, `function` and its arguments must be picklable and
+# paths absolute.
+async def run_in_job_executor(function: Callable, *args):
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), function, *args)
+    except BrokenProcessPool:
+        # A worker died, e.g. killed for memory; the retry gets a fresh pool
+        shutdown_jobs()
+        raise
+
+
+def _claimable(now: datetime):
+    return or_(
+        and_(Job.status == JobStatus.pending, Job.run_after <= now),
+        and_(Job.status == JobStatus.running, Job.locked_until < now)
+    )
+
+
+# Takes the lease of up to `limit` due jobs. Each claim is a conditional UPDATE, so when
+# several processes race for a job only one of them gets it.
+def claim_jobs(db: Session, kinds: List[str], limit: int) -> List[Job]:
+    now = datetime.now()
+    candidates = db.scalars(
+        select(Job.id).where(Job.kind.in_(kinds), _claimable(now)).order_by(Job.run_after).limit(limit)
+    ).all()
+    claimed = []
+    for job_id in candidates:
+        result = db.execute(
+            update(Job).where(Job.id == job_id, _claimable(now)).values(
+                status=JobStatus.running,
+                attempts=Job.attempts + 1,
+                locked_until=now + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+            ).execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            claimed.append(job_id)
+    db.commit()
+    if not claimed:
+        return []
+    jobs = db.scalars(select(Job).where(Job.id.in_(claimed))).all()
+    db.expunge_all()
+    return jobs
+
+
+def finish_job(db: Session, job: Job) -> None:
+    db.execute(delete(Job).where(Job.id == job.id))
+    db.commit()
+
+
+def _retry_delay(attempts: int) -> float:
+    delay = min(settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_SECONDS)
+    # Jitter spreads out jobs that failed together, e.g. while the database was away
+    return delay * random.uniform(0.5, 1.0)
+
+
+# Schedules another attempt after an exponential backoff, or marks the job failed once it
+# has used all its attempts or the error is permanent. Returns whether it failed for good.
+def retry_or_fail_job(db: Session, job: Job, error: Exception) -> bool:
+    failed = isinstance(error, PermanentJobError) or job.attempts >= settings.JOB_MAX_ATTEMPTS
+    values = {"last_error": f"{type(error).__name__}: {error}"[:10_000], "locked_until": None}
+    if failed:
+        values["status"] = JobStatus.failed
+    else:
+        values["status"] = JobStatus.pending
+        values["run_after"] = datetime.now() + timedelta(seconds=_retry_delay(job.attempts))
+    db.execute(update(Job).where(Job.id == job.id).values(**values))
+    db.commit()
+    return failed
+
+
+def _in_session(function: Callable, *args):
+    db = SessionLocal()
+    try:
+        return function(db, *args)
+    finally:
+        db.close()
+
+
+async def _run_job(handler: JobHandler, job: Job) -> None:
+    started = time.perf_counter()
+    try:
+        await handler(job)
+    except Exception as e:
+        failed = await run_in_threadpool(_in_session, retry_or_fail_job, job, e)
+        outcome = "failed" if failed else "retried"
+        if failed:
+            logger.exception(f"Job {job.id} ({job.kind}) failed after {job.attempts} attempt(s)")
+        else:
+            logger.warning(f"Job {job.id} ({job.kind}) failed on attempt {job.attempts}, will retry: {e!r}")
+    else:
+        await run_in_threadpool(_in_session, finish_job, job)
+        outcome = "done"
+    JOBS_TOTAL.inc(kind=job.kind, outcome=outcome)
+    JOB_SECONDS.observe(time.perf_counter() - started, kind=job.kind)
+
+
+# Claims and runs jobs of the kinds in `handlers`, at most JOB_WORKERS at a time. Polls the
+# table every JOB_POLL_INTERVAL_SECONDS for jobs queued by other processes or due to retry.
+async def run_job_workers(handlers: Dict[str, JobHandler]) -> None:
+    running = set()
+    while True:
+        _wakeup.clear()
+        free = settings.JOB_WORKERS - len(running)
+        if free > 0:
+            try:
+                jobs = await run_in_threadpool(_in_session, claim_jobs, list(handlers), free)
+            except Exception:
+                logger.exception("Failed to claim background jobs")
+                jobs = []
+            for job in jobs:
+                task = asyncio.create_task(_run_job(handlers[job.kind], job))
+                running.add(task)
+                task.add_done_callback(running.discard)
+                # More jobs may be due; look again as soon as a worker is free
+                task.add_done_callback(lambda _: notify_job_workers())
+        try:
+            await asyncio.wait_for(_wakeup.wait(), settings.JOB_POLL_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,113 @@
+import os
+from typing import Optional
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.exc import StaleDataError
+from core.config import settings
+from db.session import AsyncSessionLocal
+from logger.logger import logger
+from models.file import File
+from models.job import Job
+from schemas.file import ProcessingStatus
+from services.analytics import record_file_type_changed
+from services.file import ALLOWED_FILE_TYPES, PROCESS_FILE_JOB
+from services.file_cache import invalidate_user_files
+from services.jobs import PermanentJobError, run_in_job_executor
+from services.share import remember_revocations, revoke_shares
+from services.storage import local_copy
+from utils.file_analysis import ChecksumMismatch, analyze_file
+
+# Checks run on every upload after it has been stored: the content is verified against
+# its digest, scanned, and its type sniffed from the bytes instead of trusting the
+# client's Content-Type. Files whose content is flagged or of a type we do not accept are
+# quarantined and can no longer be downloaded.
+
+
+def _set_status(db: Session, file: File, status: ProcessingStatus) -> None:
+    db.execute(update(File).where(File.id == file.id).values(processing_status=status))
+    db.commit()
+
+
+async def _update_status(db: AsyncSession, file: File, status: ProcessingStatus) -> None:
+    await db.run_sync(_set_status, file, status)
+    await invalidate_user_files(file.user_id)
+
+
+# Files with the same content that were checked already. Their analysis is reused when
+# they were uploaded with the same type, which sniffing can depend on.
+def _previous_analysis(db: Session, file: File) -> Optional[dict]:
+    if file.blob_id is None:
+        return None
+    other = db.scalar(select(File).where(
+        File.blob_id == file.blob_id,
+        File.id != file.id,
+        File.processing_status.in_([ProcessingStatus.ready, ProcessingStatus.quarantined]),
+        File.detected_type == file.file_type
+    ).limit(1))
+    if other is None or other.file_metadata is None:
+        return None
+    return {"detected_type": other.detected_type, "threat": other.file_metadata.get("threat"),
+            "metadata": other.file_metadata}
+
+
+def _apply_analysis(db: Session, file_id: int, analysis: dict) -> Optional[File]:
+    file = db.get(File, file_id, with_for_update=True, populate_existing=True)
+    if file is None:
+        return None  # deleted while it was analyzed
+    detected_type = analysis["detected_type"]
+    file.detected_type = detected_type
+    file.file_metadata = analysis["metadata"]
+    if analysis["threat"]:
+        file.file_metadata = {**analysis["metadata"], "threat": analysis["threat"]}
+    if analysis["threat"] or (detected_type is not None and detected_type not in ALLOWED_FILE_TYPES):
+        file.processing_status = ProcessingStatus.quarantined
+        # Links shared while the file was being checked stop working
+        revocations = revoke_shares(db, [file.id])
+    else:
+        if detected_type is not None and detected_type != file.file_type:
+            # Another accepted type than the client claimed: the content decides
+            old_type = file.file_type
+            file.file_type = detected_type
+            record_file_type_changed(db, file, old_type)
+        file.processing_status = ProcessingStatus.ready
+        revocations = []
+    try:
+        db.commit()
+    except StaleDataError:
+        # Deleted after all, where the database does not lock rows (SQLite)
+        db.rollback()
+        return None
+    remember_revocations(revocations)
+    return file
+
+
+async def process_file_job(job: Job) -> None:
+    async with AsyncSessionLocal() as db:
+        file = await db.scalar(select(File).where(File.id == job.file_id).options(joinedload(File.blob)))
+        if file is None:
+            return  # deleted since it was uploaded
+        await _update_status(db, file, ProcessingStatus.processing)
+
+        analysis = await db.run_sync(_previous_analysis, file)
+        if analysis is None:
+            digest = file.blob.digest if file.blob is not None else None
+            try:
+                async with local_copy(file.file_path) as path:
+                    # Workers may be processes, which resolve paths on their own
+                    analysis = await run_in_job_executor(analyze_file, os.path.abspath(path), digest, file.file_type)
+            except (FileNotFoundError, ChecksumMismatch) as e:
+                await _update_status(db, file, ProcessingStatus.failed)
+                raise PermanentJobError(str(e)) from e
+            except Exception:
+                if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+                    await _update_status(db, file, ProcessingStatus.failed)
+                raise
+
+        file = await db.run_sync(_apply_analysis, file.id, analysis)
+        if file is None:
+            return
+        await invalidate_user_files(file.user_id)
+        if file.processing_status == ProcessingStatus.quarantined:
+            logger.warning(f"Quarantined file {file.id}: detected {file.detected_type}, "
+                           f"threat {file.file_metadata.get('threat')}")
@@ -0,0 +1,163 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, NamedTuple, Optional, Union
+from fastapi import BackgroundTasks, HTTPException
+from PIL import Image, UnidentifiedImageError
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from starlette.concurrency import run_in_threadpool
+from core.config import settings
+from core.metrics import counter, histogram
+from db.session import AsyncSessionLocal
+from logger.logger import logger
+from models.file import File
+from schemas.file import FileSchema
+from services.file import file_etag
+from services.storage import UPLOAD_DIRECTORY, local_copy
+from utils.cache import DiskLRUCache
+from utils.thumbnail import render_thumbnail
+
+# Scaled-down copies of images for previews, rendered in a pool of worker processes and
+# kept in a size-bounded cache directory. Renditions are named after the content they
+# were made from, so they never go stale and files with the same content share them.
+RENDITION_DIRECTORY = os.path.join(UPLOAD_DIRECTORY, ".renditions")
+RENDITION_FORMATS = {
+    "image/jpeg": ("JPEG", "jpg", "image/jpeg"),
+    "image/png": ("PNG", "png", "image/png"),
+    "image/gif": ("PNG", "png", "image/png"),  # the first frame
+}
+RENDITION_CACHE_CONTROL = "private, max-age=86400"
+
+RENDITION_REQUESTS = counter("rendition_requests_total", "Thumbnail lookups by cache result", ["result"])
+RENDITION_SECONDS = histogram("rendition_render_seconds", "Time to render a thumbnail in a worker process")
+
+
+class Rendition(NamedTuple):
+    name: str  # file name in the cache
+    size: int
+    image_format: str
+    media_type: str
+    etag: str
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_cache: Optional[DiskLRUCache] = None
+_rendering: Dict[str, asyncio.Task] = {}
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # Spawned rather than forked: the server process runs threads (logging, threadpool)
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.RENDITION_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def _get_cache() -> DiskLRUCache:
+    global _cache
+    if _cache is None:
+        _cache = DiskLRUCache(RENDITION_DIRECTORY, settings.RENDITION_CACHE_MAX_BYTES)
+    return _cache
+
+
+def shutdown_renditions() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+# Describes the rendition at `size` of content of `file_type` identified by `etag`
+def describe_content_rendition(file_type: str, etag: str, size: int) -> Rendition:
+    if file_type not in RENDITION_FORMATS:
+        raise HTTPException(status_code=400, detail="No preview is available for this file type")
+    if size not in settings.THUMBNAIL_SIZES:
+        sizes = ", ".join(str(size) for size in settings.THUMBNAIL_SIZES)
+        raise HTTPException(status_code=400, detail=f"Thumbnail size must be one of {sizes}")
+    image_format, extension, media_type = RENDITION_FORMATS[file_type]
+    content = etag.strip('"')
+    return Rendition(f"{content}-{size}.{extension}", size, image_format, media_type, f'"{content}-{size}"')
+
+
+# Describes the rendition of `file` at `size`. Needs File.blob loaded.
+def describe_rendition(file: File, size: int) -> Rendition:
+    return describe_content_rendition(file.file_type, file_etag(file), size)
+
+
+async def _render(source: str, rendition: Rendition) -> str:
+    cache = _get_cache()
+    temp_location = cache.temp_path(rendition.name)
+    started = time.perf_counter()
+    try:
+        async with local_copy(source) as path:
+            # Workers resolve paths on their own, so they get absolute ones
+            await asyncio.get_running_loop().run_in_executor(
+                _get_executor(), render_thumbnail, os.path.abspath(path), os.path.abspath(temp_location),
+                rendition.size, rendition.image_format
+            )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found on disk")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError):
+        await run_in_threadpool(_discard, temp_location)  # may hold a partial write
+        raise HTTPException(status_code=422, detail="The file could not be read as an image")
+    except BrokenProcessPool:
+        # A worker died, e.g. killed for memory; the next request starts a fresh pool
+        shutdown_renditions()
+        raise HTTPException(status_code=503, detail="Thumbnail rendering is unavailable, please retry")
+    finally:
+        RENDITION_SECONDS.observe(time.perf_counter() - started)
+    try:
+        return await run_in_threadpool(cache.add, rendition.name, temp_location)
+    except BaseException:
+        await run_in_threadpool(_discard, temp_location)
+        raise
+
+
+def _discard(location: str) -> None:
+    if os.path.exists(location):
+        os.remove(location)
+
+
+# Returns the path of the rendition, rendering it on a cache miss. Concurrent requests for
+# the same rendition wait for one render, which completes even if they all go away.
+async def get_rendition(source: str, rendition: Rendition) -> str:
+    path = await run_in_threadpool(_get_cache().get, rendition.name)
+    if path is not None:
+        RENDITION_REQUESTS.inc(result="hit")
+        return path
+    task = _rendering.get(rendition.name)
+    if task is None:
+        RENDITION_REQUESTS.inc(result="miss")
+        task = asyncio.ensure_future(_render(source, rendition))
+        _rendering[rendition.name] = task
+        task.add_done_callback(lambda _: _rendering.pop(rendition.name, None))
+    else:
+        RENDITION_REQUESTS.inc(result="coalesced")
+    return await asyncio.shield(task)
+
+
+# Renders every configured size of the given files ahead of the first request
+async def prerender_renditions(file_ids: List[int]) -> None:
+    async with AsyncSessionLocal() as db:
+        files = (await db.scalars(
+            select(File).where(File.id.in_(file_ids)).options(joinedload(File.blob))
+        )).all()
+    for file in files:
+        for size in settings.THUMBNAIL_SIZES:
+            try:
+                await get_rendition(file.file_path, describe_rendition(file, size))
+            except Exception:
+                logger.exception(f"Failed to render the {size}px thumbnail of file {file.id}")
+
+
+# Queues prerendering after the response when THUMBNAIL_EAGER is set
+def schedule_renditions(background_tasks: BackgroundTasks, files: List[Union[File, FileSchema]]) -> None:
+    file_ids = [file.id for file in files if file.file_type in RENDITION_FORMATS]
+    if settings.THUMBNAIL_EAGER and file_ids:
+        background_tasks.add_task(prerender_renditions, file_ids)
@@ -0,0 +1,183 @@
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import Select, delete, func, insert, literal, select, union_all
+from sqlalchemy.orm import Session
+from models.file import File
+from models.search import FileNameGram, UserSearchGram
+from models.user import User
+from schemas.file import SearchMode
+
+# Names are indexed as trigrams of each word, padded with a boundary marker the way
+# pg_trgm does it: "report" gives "$$r", "$re", "rep", "epo", "por", "ort", "rt$".
+# A query is turned into the grams any match must contain; the gram table narrows the
+# search to candidates and the original predicate is only evaluated on those.
+WORD_PATTERN = re.compile(r"[^\W_]+")
+BOUNDARY = "$"
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def index_grams(*texts: str) -> Set[str]:
+    grams = set()
+    for text in texts:
+        for word in WORD_PATTERN.findall(text.lower()):
+            grams |= _trigrams(f"{BOUNDARY}{BOUNDARY}{word}{BOUNDARY}")
+    return grams
+
+
+# Grams every name matching `term` must contain. A word of the query is padded on a side
+# only where the query itself shows a word boundary, so substrings inside words still match.
+def query_grams(term: str, mode: SearchMode = SearchMode.substring) -> Set[str]:
+    term = term.lower()
+    grams = set()
+    for match in WORD_PATTERN.finditer(term):
+        word = match.group()
+        if mode == SearchMode.tokens:
+            # Words are matched independently, anywhere in the name
+            grams |= _trigrams(word)
+            continue
+        starts_word = match.start() > 0 or mode == SearchMode.prefix
+        ends_word = match.end() < len(term)
+        padded = (BOUNDARY * 2 if starts_word else "") + word + (BOUNDARY if ends_word else "")
+        grams |= _trigrams(padded)
+    return grams
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# Turns a shell-style pattern (* and ?) into a LIKE pattern, escaped with a backslash
+def glob_to_like(pattern: str) -> str:
+    return _escape_like(pattern).replace("*", "%").replace("?", "_")
+
+
+def _name_predicates(column, term: str, mode: SearchMode) -> list:
+    if mode == SearchMode.prefix:
+        return [column.ilike(f"{_escape_like(term)}%", escape="\\")]
+    if mode == SearchMode.tokens:
+        words = WORD_PATTERN.findall(term.lower()) or [term]
+        return [column.ilike(f"%{_escape_like(word)}%", escape="\\") for word in words]
+    return [column.ilike(f"%{_escape_like(term)}%", escape="\\")]
+
+
+# Postings looked at per gram when choosing a strategy; also bounds the candidate set.
+SELECTIVITY_LIMIT = 2000
+
+
+# Returns the gram with the fewest postings, counting at most SELECTIVITY_LIMIT per gram,
+# in a single round trip whose cost does not grow with the table.
+def _rarest_gram(db: Session, gram_column, grams: Set[str], *criteria) -> Tuple[str, int]:
+    probes = [
+        select(literal(gram).label("gram"), func.count().label("postings")).select_from(
+            select(gram_column).where(gram_column == gram, *criteria).limit(SELECTIVITY_LIMIT).subquery()
+        )
+        for gram in sorted(grams)
+    ]
+    rows = db.execute(union_all(*probes) if len(probes) > 1 else probes[0]).all()
+    row = min(rows, key=lambda row: row.postings)
+    return row.gram, row.postings
+
+
+# Narrows `statement` to the rows whose id is posted under the rarest query gram, when that
+# gram is selective. Every match contains every query gram, so this never drops a match,
+# and the predicate then runs on a bounded candidate set. When even the rarest gram is
+# common, matches are dense and walking the sort index until the page is full is cheaper.
+def _restrict_to_candidates(
+    db: Session, statement: Select, id_column, gram_column, posting_column, grams: Set[str], *criteria
+) -> Select:
+    if not grams:
+        return statement
+    gram, postings = _rarest_gram(db, gram_column, grams, *criteria)
+    if postings >= SELECTIVITY_LIMIT:
+        return statement
+    return statement.where(id_column.in_(select(posting_column).where(gram_column == gram, *criteria)))
+
+
+# Filters a File select by name. `user_id` restricts the candidate lookup to one owner.
+# Choosing the strategy takes a query, so async callers go through AsyncSession.run_sync.
+def filter_files_by_name(
+    db: Session, statement: Select, term: str, mode: SearchMode, user_id: Optional[int] = None
+) -> Select:
+    statement = statement.where(*_name_predicates(File.filename, term, mode))
+    criteria = [FileNameGram.user_id == user_id] if user_id is not None else []
+    return _restrict_to_candidates(
+        db, statement, File.id, FileNameGram.gram, FileNameGram.file_id, query_grams(term, mode), *criteria
+    )
+
+
+def filter_users_by_name(db: Session, statement: Select, term: str) -> Select:
+    term_lower = term.lower()
+    statement = statement.where(
+        func.lower(User.username).contains(term_lower, autoescape=True)
+        | func.lower(User.email).contains(term_lower, autoescape=True)
+    )
+    return _restrict_to_candidates(
+        db, statement, User.id, UserSearchGram.gram, UserSearchGram.user_id, query_grams(term)
+    )
+
+
+def _insert_file_grams(db: Session, files: Iterable[File]) -> None:
+    rows = [
+        {"gram": gram, "user_id": file.user_id, "file_id": file.id}
+        for file in files for gram in index_grams(file.filename)
+    ]
+    if rows:
+        db.execute(insert(FileNameGram), rows)
+
+
+# Index maintenance runs inside the caller's transaction; the caller commits.
+def index_file(db: Session, file: File) -> None:
+    db.execute(delete(FileNameGram).where(FileNameGram.file_id == file.id))
+    _insert_file_grams(db, [file])
+
+
+# For files inserted in the current transaction, which have no grams to replace yet.
+def index_new_files(db: Session, files: List[File]) -> None:
+    _insert_file_grams(db, files)
+
+
+# Replaces the grams of many files of one owner, given their new names by file id.
+def reindex_files(db: Session, user_id: int, names: Dict[int, str]) -> None:
+    unindex_files(db, list(names))
+    rows = [{"gram": gram, "user_id": user_id, "file_id": file_id}
+            for file_id, name in names.items() for gram in index_grams(name)]
+    if rows:
+        db.execute(insert(FileNameGram), rows)
+
+
+def unindex_file(db: Session, file_id: int) -> None:
+    db.execute(delete(FileNameGram).where(FileNameGram.file_id == file_id))
+
+
+def unindex_files(db: Session, file_ids: List[int]) -> None:
+    db.execute(delete(FileNameGram).where(FileNameGram.file_id.in_(file_ids)))
+
+
+def index_user(db: Session, user: User) -> None:
+    db.execute(delete(UserSearchGram).where(UserSearchGram.user_id == user.id))
+    grams = index_grams(user.username, user.email)
+    if grams:
+        db.execute(insert(UserSearchGram), [{"gram": gram, "user_id": user.id} for gram in grams])
+
+
+def unindex_user(db: Session, user_id: int) -> None:
+    db.execute(delete(UserSearchGram).where(UserSearchGram.user_id == user_id))
+
+
+def rebuild_search_index(db: Session, batch_size: int = 1000) -> None:
+    db.execute(delete(FileNameGram))
+    db.execute(delete(UserSearchGram))
+    last_id = 0
+    while files := db.query(File).filter(File.id > last_id).order_by(File.id).limit(batch_size).all():
+        _insert_file_grams(db, files)
+        last_id = files[-1].id
+    last_id = 0
+    while users := db.query(User).filter(User.id > last_id).order_by(User.id).limit(batch_size).all():
+        rows = [{"gram": gram, "user_id": user.id} for user in users for gram in index_grams(user.username, user.email)]
+        if rows:
+            db.execute(insert(UserSearchGram), rows)
+        last_id = users[-1].id
+    db.commit()
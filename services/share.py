@@ -0,0 +1,198 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from core.config import settings
+from core.metrics import counter
+from db.session import SessionLocal
+from logger.logger import logger
+from models.share import ShareRevocation
+from schemas.file import SharePermission
+
+# Share links carry everything needed to serve the file (storage key, name, type and
+# validators) in a token signed with HMAC-SHA256, so checking one is CPU work only: no
+# user, no session and no query. Revocations are kept in a denylist in every process,
+# reloaded from the share_revocations table every SHARE_DENYLIST_REFRESH_SECONDS;
+# revoking applies at once in the process that did it.
+
+PERMISSION_CODES = {SharePermission.download: "d", SharePermission.thumbnail: "t"}
+SHARE_REQUESTS = counter("share_requests_total", "Requests for shared links by outcome", ["result"])
+
+_signing_key = hashlib.sha256(b"share-link\0" + settings.SECRET_KEY.encode()).digest()
+
+
+class ShareClaims(NamedTuple):
+    share_id: str
+    file_id: int
+    key: str  # where the content is stored
+    filename: str
+    media_type: str
+    file_size: int
+    etag: str
+    last_modified: datetime
+    issued_at: int  # milliseconds since the epoch
+    expires_at: int  # seconds since the epoch
+    permissions: str  # PERMISSION_CODES of what the link allows
+
+
+def _encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _signature(payload: str) -> str:
+    return _encode(hmac.new(_signing_key, payload.encode(), hashlib.sha256).digest())
+
+
+def sign_share_token(
+    file_id: int,
+    key: str,
+    filename: str,
+    media_type: str,
+    file_size: int,
+    etag: str,
+    last_modified: datetime,
+    expires_at: datetime,
+    permissions: List[SharePermission]
+) -> Tuple[str, str]:
+    share_id = secrets.token_hex(8)
+    claims = {
+        "s": share_id, "f": file_id, "k": key, "n": filename, "t": media_type, "z": file_size, "e": etag,
+        "m": int(last_modified.timestamp()), "i": int(time.time() * 1000), "x": int(expires_at.timestamp()),
+        "p": "".join(sorted({PERMISSION_CODES[permission] for permission in permissions})),
+    }
+    payload = _encode(json.dumps(claims, separators=(",", ":")).encode())
+    return share_id, f"{payload}.{_signature(payload)}"
+
+
+def _reject(result: str, status_code: int, detail: str) -> HTTPException:
+    SHARE_REQUESTS.inc(result=result)
+    return HTTPException(status_code=status_code, detail=detail)
+
+
+# Checks the signature, expiry, permission and revocation of a share token
+def verify_share_token(token: str, permission: SharePermission) -> ShareClaims:
+    payload, _, signature = token.partition(".")
+    if not hmac.compare_digest(signature.encode(), _signature(payload).encode()):
+        raise _reject("invalid", 404, "Shared file not found")
+    try:
+        claims = json.loads(_decode(payload))
+        claims = ShareClaims(
+            claims["s"], claims["f"], claims["k"], claims["n"], claims["t"], claims.get("z", 0), claims["e"],
+            datetime.fromtimestamp(claims["m"]), claims["i"], claims["x"], claims["p"]
+        )
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        # Signed by us, so only an older token format gets here
+        raise _reject("invalid", 404, "Shared file not found")
+    if claims.expires_at <= time.time():
+        raise _reject("expired", 410, "This link has expired")
+    if PERMISSION_CODES[permission] not in claims.permissions:
+        raise _reject("forbidden", 403, "This link does not allow this")
+    if share_denylist.is_revoked(claims):
+        raise _reject("revoked", 410, "This link has been revoked")
+    SHARE_REQUESTS.inc(result="served")
+    return claims
+
+
+class ShareDenylist:
+    """
+    Revoked share ids, and per file the time before which all its links are revoked. Each
+    entry is dropped once every link it could match has expired.
+    """
+
+    def __init__(self):
+        self._shares: Dict[str, float] = {}  # share id -> expiry
+        self._files: Dict[int, Tuple[int, float]] = {}  # file id -> (revoked at in ms, expiry)
+        self._lock = threading.Lock()
+
+    def add(self, file_id: int, share_id: Optional[str], revoked_at: int, expires_at: float) -> None:
+        with self._lock:
+            if share_id is not None:
+                self._shares[share_id] = max(expires_at, self._shares.get(share_id, 0))
+            else:
+                previous_at, previous_expiry = self._files.get(file_id, (0, 0))
+                self._files[file_id] = (max(revoked_at, previous_at), max(expires_at, previous_expiry))
+
+    def is_revoked(self, claims: ShareClaims) -> bool:
+        if claims.share_id in self._shares:
+            return True
+        revoked = self._files.get(claims.file_id)
+        return revoked is not None and claims.issued_at <= revoked[0]
+
+    def prune(self, now: float) -> None:
+        with self._lock:
+            self._shares = {share_id: expiry for share_id, expiry in self._shares.items() if expiry > now}
+            self._files = {file_id: entry for file_id, entry in self._files.items() if entry[1] > now}
+
+    # Adds the revocations other processes made. Every unexpired row is read each time: ids
+    # are assigned before commit, so rows can become visible out of id order.
+    def sync(self, db: Session) -> None:
+        rows = db.execute(
+            select(ShareRevocation.file_id, ShareRevocation.share_id, ShareRevocation.revoked_at,
+                   ShareRevocation.expires_date).where(ShareRevocation.expires_date > datetime.now())
+        ).all()
+        for row in rows:
+            self.add(row.file_id, row.share_id, row.revoked_at, row.expires_date.timestamp())
+        self.prune(time.time())
+
+    def __len__(self) -> int:
+        return len(self._shares) + len(self._files)
+
+
+share_denylist = ShareDenylist()
+
+
+# Records revocations of one link (`share_id`) or of every link issued so far to each of
+# `file_ids`, in the caller's transaction. Returns them for remember_revocations, to call
+# once committed.
+def revoke_shares(db: Session, file_ids: List[int], share_id: Optional[str] = None) -> List[dict]:
+    if not file_ids:
+        return []
+    revoked_at = int(time.time() * 1000)
+    # No link lives longer than the longest lifetime a link can be given
+    expires_date = datetime.now() + timedelta(seconds=settings.SHARE_LINK_MAX_TTL_SECONDS)
+    revocations = [
+        {"file_id": file_id, "share_id": share_id, "revoked_at": revoked_at, "expires_date": expires_date}
+        for file_id in file_ids
+    ]
+    db.execute(insert(ShareRevocation), revocations)
+    return revocations
+
+
+def remember_revocations(revocations: List[dict]) -> None:
+    for revocation in revocations:
+        share_denylist.add(revocation["file_id"], revocation["share_id"], revocation["revoked_at"],
+                           revocation["expires_date"].timestamp())
+
+
+def _sync_share_denylist() -> None:
+    db = SessionLocal()
+    try:
+        share_denylist.sync(db)
+        db.execute(delete(ShareRevocation).where(ShareRevocation.expires_date < datetime.now()))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def run_share_denylist_sync() -> None:
+    while True:
+        try:
+            await run_in_threadpool(_sync_share_denylist)
+        except Exception:
+            logger.exception("Failed to sync the share link denylist")
+        await asyncio.sleep(settings.SHARE_DENYLIST_REFRESH_SECONDS)
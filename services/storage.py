@@ -0,0 +1,354 @@
+import hashlib
+import os
+import shutil
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional, Set, Tuple
+from fastapi import HTTPException
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from core.config import settings
+from db.session import SessionLocal
+from logger.logger import logger
+from models.blob import Blob
+from models.file import File
+from utils.file_response import content_disposition
+from utils.storage_backend import create_storage_backend
+
+# Uploads are staged in UPLOAD_DIRECTORY on local disk, then stored in the configured
+# backend: the same directory, or object storage. File.file_path and Blob.file_path hold
+# the backend's key.
+UPLOAD_DIRECTORY = "uploads"
+storage_backend = create_storage_backend(
+    settings.STORAGE_BACKEND_URL,
+    endpoint_url=settings.S3_ENDPOINT_URL,
+    region=settings.S3_REGION,
+    multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+    multipart_chunk_size=settings.S3_MULTIPART_CHUNK_SIZE,
+    max_concurrency=settings.S3_MAX_CONCURRENCY
+)
+# Stored content is spread over two levels of directories named after the leading hex
+# digits of its digest, e.g. uploads/3f/a2/3fa2..., so no directory grows past a few
+# hundred entries. Names chosen by users never reach the disk.
+FANOUT_LEVELS = 2
+FANOUT_WIDTH = 2
+
+
+def blob_path(digest: str) -> str:
+    levels = [digest[level * FANOUT_WIDTH:(level + 1) * FANOUT_WIDTH] for level in range(FANOUT_LEVELS)]
+    return "/".join([UPLOAD_DIRECTORY, *levels, digest])
+
+
+def _new_staging_path() -> str:
+    return os.path.join(UPLOAD_DIRECTORY, f".{uuid.uuid4().hex}.part")
+
+
+def _write_chunk(buffer, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    if buffer is not None:
+        buffer.write(chunk)
+
+
+# Streams an upload into a temporary file in UPLOAD_DIRECTORY while hashing it,
+# enforcing max_size as chunks arrive. With write=False the content is only hashed,
+# which is enough when the caller already knows the blob exists.
+# Returns (temp_location, file_size, digest); temp_location is None when nothing was written.
+async def stage_upload_stream(
+    chunks: AsyncIterator[bytes],
+    max_size: int,
+    write: bool = True
+) -> Tuple[Optional[str], int, str]:
+    hasher = hashlib.sha256()
+    temp_location = _new_staging_path() if write else None
+    file_size = 0
+    buffer = await run_in_threadpool(open, temp_location, "wb") if write else None
+    try:
+        try:
+            async for chunk in chunks:
+                file_size += len(chunk)
+                if file_size > max_size:
+                    raise HTTPException(status_code=400, detail="File size exceeds the limit")
+                await run_in_threadpool(_write_chunk, buffer, hasher, chunk)
+        finally:
+            if buffer is not None:
+                await run_in_threadpool(buffer.close)
+    except BaseException:
+        discard_staged_file(temp_location)
+        raise
+    return temp_location, file_size, hasher.hexdigest()
+
+
+def hash_file(location: str, chunk_size: int = 1024 * 1024) -> str:
+    hasher = hashlib.sha256()
+    with open(location, "rb") as source:
+        while chunk := source.read(chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def discard_staged_file(temp_location: Optional[str]) -> None:
+    if temp_location and os.path.exists(temp_location):
+        os.remove(temp_location)
+
+
+# Blobs whose last reference was released stay behind as tombstones until their content is
+# removed (see remove_unused_blobs), so uploads of the same content meanwhile store it anew.
+def find_blob(db: Session, digest: str) -> Optional[Blob]:
+    return db.query(Blob).filter(Blob.digest == digest).first()
+
+
+def find_live_blob(db: Session, digest: str) -> Optional[Blob]:
+    return db.query(Blob).filter(Blob.digest == digest, Blob.ref_count > 0).first()
+
+
+def _add_reference(db: Session, blob_id: int) -> bool:
+    result = db.execute(
+        update(Blob).where(Blob.id == blob_id).values(ref_count=Blob.ref_count + 1)
+    )
+    return result.rowcount == 1
+
+
+# Stores staged content under the key of its digest, consuming the staged file. Keys come
+# from the content, so whatever is stored under one is that content, and it is safe to
+# store before the blob row exists. Blocking: async callers run it in the threadpool.
+def store_staged_file(temp_location: str, digest: str) -> None:
+    storage_backend.store(temp_location, blob_path(digest))
+
+
+# Stores the staged content of an upload unless a blob holds it already, off the event
+# loop. Returns whether it was stored; the staged file is consumed either way.
+async def store_new_content(db: AsyncSession, digest: str, temp_location: Optional[str]) -> bool:
+    try:
+        if temp_location is None or await db.run_sync(find_live_blob, digest) is not None:
+            return False
+        await run_in_threadpool(store_staged_file, temp_location, digest)
+        return True
+    finally:
+        await run_in_threadpool(discard_staged_file, temp_location)
+
+
+# Same as store_new_content for many uploads: one query for the digests already held, then
+# the new contents are stored `concurrency` at a time. Returns the digests stored.
+async def store_new_contents(
+    db: AsyncSession, staged: List[Tuple[str, Optional[str]]], concurrency: int
+) -> Set[str]:
+    known = set(await db.scalars(
+        select(Blob.digest).where(Blob.digest.in_({digest for digest, _ in staged}), Blob.ref_count > 0)
+    ))
+    pending = {digest: temp_location for digest, temp_location in staged
+               if temp_location is not None and digest not in known}
+    slots = asyncio.Semaphore(concurrency)
+
+    async def store(digest: str, temp_location: str) -> None:
+        async with slots:
+            await run_in_threadpool(store_staged_file, temp_location, digest)
+
+    try:
+        await asyncio.gather(*(store(digest, temp_location) for digest, temp_location in pending.items()))
+    finally:
+        for _, temp_location in staged:
+            await run_in_threadpool(discard_staged_file, temp_location)
+    return set(pending)
+
+
+# Takes a reference on the blob for `digest`, creating it if this content has not been
+# stored before; `stored` says whether the caller stored it with store_staged_file, and
+# must then call check_stored_contents. Taking a reference on a tombstone revives it.
+# The caller owns the transaction and must commit it.
+def acquire_blob(db: Session, digest: str, file_size: int, stored: bool) -> Blob:
+    blob = find_blob(db, digest)
+    if blob is not None and _add_reference(db, blob.id):
+        db.refresh(blob)
+        return blob
+
+    if not stored:
+        # Not stored because the blob existed, but its content was removed in the meantime.
+        raise HTTPException(status_code=409, detail="Stored content changed during upload, please retry")
+
+    blob = Blob(digest=digest, file_path=blob_path(digest), file_size=file_size, ref_count=1)
+    try:
+        with db.begin_nested():
+            db.add(blob)
+    except IntegrityError:
+        # A concurrent upload stored the same content first; the stored bytes are identical.
+        blob = find_blob(db, digest)
+        if blob is None or not _add_reference(db, blob.id):
+            raise HTTPException(status_code=409, detail="Stored content changed during upload, please retry")
+        db.refresh(blob)
+    return blob
+
+
+# Content an upload stored itself can be removed by the cleanup of a tombstone with the
+# same digest until the upload holds its reference. Called once acquire_blob has taken it
+# and before committing; raises 409 for the client to retry when the content is gone.
+async def check_stored_contents(locations: List[str]) -> None:
+    found = await asyncio.gather(*(run_in_threadpool(stored_file_exists, location) for location in locations))
+    if not all(found):
+        raise HTTPException(status_code=409, detail="Stored content changed during upload, please retry")
+
+
+# Drops one reference to the blob. Returns whether it was the last one; the blob is then
+# a tombstone for the caller to pass to remove_unused_blobs once the transaction commits.
+def release_blob(db: Session, blob: Blob) -> bool:
+    db.execute(
+        update(Blob).where(Blob.id == blob.id).values(ref_count=Blob.ref_count - 1)
+    )
+    db.refresh(blob)
+    return blob.ref_count <= 0
+
+
+# Drops the references held by the files in `file_ids` with one update per distinct count.
+# Returns the ids of the blobs left unreferenced, for remove_unused_blobs once committed.
+def release_blobs(db: Session, file_ids: List[int]) -> List[int]:
+    references = db.execute(
+        select(File.blob_id, func.count()).where(File.id.in_(file_ids), File.blob_id.isnot(None)).group_by(File.blob_id)
+    ).all()
+    if not references:
+        return []
+    by_count: Dict[int, List[int]] = {}
+    for blob_id, count in references:
+        by_count.setdefault(count, []).append(blob_id)
+    for count, blob_ids in by_count.items():
+        db.execute(update(Blob).where(Blob.id.in_(blob_ids)).values(ref_count=Blob.ref_count - count))
+    return db.scalars(
+        select(Blob.id).where(Blob.id.in_([blob_id for blob_id, _ in references]), Blob.ref_count <= 0)
+    ).all()
+
+
+# Removes the content of a tombstone and then the row, holding the row's lock throughout
+# and only while it is still unreferenced: an upload of the same content meanwhile either
+# revived it, and the content stays, or waits for the lock and then stores it anew.
+def remove_unused_blob(db: Session, blob_id: int) -> None:
+    blob = db.scalar(select(Blob).where(Blob.id == blob_id, Blob.ref_count <= 0).with_for_update())
+    if blob is None:
+        return
+    remove_stored_file(blob.file_path)
+    db.delete(blob)
+
+
+# Blocking; runs after the response for bulk deletes. Content that cannot be removed keeps
+# its tombstone, so nothing points to missing content.
+def remove_unused_blobs(blob_ids: List[int]) -> None:
+    for blob_id in blob_ids:
+        db = SessionLocal()
+        try:
+            remove_unused_blob(db, blob_id)
+            db.commit()
+        except Exception:
+            logger.exception(f"Failed to remove the content of blob {blob_id}")
+        finally:
+            db.close()
+
+
+def remove_stored_file(location: Optional[str]) -> None:
+    if location:
+        storage_backend.delete(location)
+
+
+def open_stored_file(location: str) -> BinaryIO:
+    return storage_backend.open(location)
+
+
+def stored_file_exists(location: str) -> bool:
+    return storage_backend.exists(location)
+
+
+# Path of stored content on local disk for the duration of the block: the stored file
+# itself with the local backend, otherwise a temporary download.
+@asynccontextmanager
+async def local_copy(location: str) -> AsyncIterator[str]:
+    path = storage_backend.local_path(location)
+    if path is not None:
+        if not await run_in_threadpool(os.path.exists, path):
+            raise FileNotFoundError(path)
+        yield path
+        return
+    temp_location = _new_staging_path()
+    try:
+        await run_in_threadpool(storage_backend.download, location, temp_location)
+        yield temp_location
+    finally:
+        await run_in_threadpool(discard_staged_file, temp_location)
+
+
+# A URL the client can download stored content from directly, when the backend issues them
+def presigned_download_url(location: str, filename: str, media_type: str) -> Optional[str]:
+    return storage_backend.presigned_url(
+        location, content_disposition(filename), media_type, settings.STORAGE_PRESIGNED_URL_TTL_SECONDS
+    )
+
+
+# Removes files of deleted rows, after the response has been sent. A file that cannot be
+# removed is left behind rather than failing anything: its row is already gone.
+def remove_stored_files(locations: List[str]) -> None:
+    for location in locations:
+        try:
+            remove_stored_file(location)
+        except OSError:
+            pass
+
+
+# Stages a copy of a file on local disk without touching it: a hard link where possible.
+def stage_local_file(location: str) -> str:
+    temp_location = _new_staging_path()
+    try:
+        os.link(location, temp_location)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        # Not supported by the filesystem
+        shutil.copy2(location, temp_location)
+    return temp_location
+
+
+# Same as stage_local_file but always a copy, for a file that is written to again after
+# staging: the part file of an upload session takes resent chunks until it is completed,
+# and writing to a link would change content stored from it.
+def stage_copy(location: str) -> str:
+    temp_location = _new_staging_path()
+    shutil.copyfile(location, temp_location)
+    return temp_location
+
+
+# Moves a blob still stored in the flat layout on local disk to its place in the fan-out
+# tree of the storage backend and points its files to it. The old path stays readable
+# until the caller has committed, then the caller removes it. Returns the old path, or
+# None when there is nothing to move.
+def relocate_blob(db: Session, blob_id: int) -> Optional[str]:
+    blob = db.get(Blob, blob_id, with_for_update=True)
+    if blob is None or blob.file_path == blob_path(blob.digest):
+        return None
+    old_location = blob.file_path
+    location = blob_path(blob.digest)
+    temp_location = stage_local_file(old_location)
+    try:
+        store_staged_file(temp_location, blob.digest)
+    finally:
+        discard_staged_file(temp_location)
+    db.execute(update(File).where(File.blob_id == blob.id).values(file_path=location))
+    blob.file_path = location
+    return old_location
+
+
+# Makes a file saved on local disk under its own name, before content-addressed storage,
+# a blob, and points every file row using that path to it; several rows can share one
+# path when users uploaded files with the same name. The caller has stored its content,
+# hashing to `digest`, with store_staged_file. Returns the old path for the caller to
+# remove after committing, or None when no row uses it any more.
+def adopt_legacy_file(db: Session, location: str, digest: str, file_size: int) -> Optional[str]:
+    files = db.scalars(
+        select(File).where(File.file_path == location, File.blob_id.is_(None)).with_for_update()
+    ).all()
+    if not files:
+        return None
+    blob = acquire_blob(db, digest, file_size, stored=True)
+    if len(files) > 1:
+        db.execute(update(Blob).where(Blob.id == blob.id).values(ref_count=Blob.ref_count + len(files) - 1))
+    for file in files:
+        file.blob_id = blob.id
+        file.file_path = blob.file_path
+    return location
@@ -0,0 +1,241 @@
+import asyncio
+import math
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List
+from fastapi import HTTPException
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from core.config import settings
+from db.session import SessionLocal
+from logger.logger import logger
+from models.file import File
+from models.upload_session import UploadSession, UploadSessionChunk
+from schemas.upload_session import UploadSessionCreate, UploadSessionSchema
+from services.file import ALLOWED_FILE_TYPES, MAX_FILE_SIZE, safe_filename, store_upload
+from services.storage import UPLOAD_DIRECTORY, discard_staged_file, hash_file, stage_copy
+
+SESSION_DIRECTORY = os.path.join(UPLOAD_DIRECTORY, ".sessions")
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024  # 8 MB
+MIN_CHUNK_SIZE = 256 * 1024  # 256 KB
+MAX_CHUNK_SIZE = 64 * 1024 * 1024  # 64 MB
+
+
+def _session_part_path(session_id: str) -> str:
+    return os.path.join(SESSION_DIRECTORY, f"{session_id}.part")
+
+
+def _total_chunks(session: UploadSession) -> int:
+    return math.ceil(session.file_size / session.chunk_size)
+
+
+def _expected_chunk_size(session: UploadSession, chunk_index: int) -> int:
+    return min(session.chunk_size, session.file_size - chunk_index * session.chunk_size)
+
+
+async def _received_chunks(db: AsyncSession, session_id: str) -> List[int]:
+    rows = await db.scalars(
+        select(UploadSessionChunk.chunk_index).where(
+            UploadSessionChunk.session_id == session_id
+        ).order_by(UploadSessionChunk.chunk_index)
+    )
+    return list(rows)
+
+
+async def _to_schema(db: AsyncSession, session: UploadSession) -> UploadSessionSchema:
+    return UploadSessionSchema(
+        id=session.id,
+        filename=session.filename,
+        file_type=session.file_type,
+        file_size=session.file_size,
+        chunk_size=session.chunk_size,
+        total_chunks=_total_chunks(session),
+        received_chunks=await _received_chunks(db, session.id),
+        created_date=session.created_date,
+        expires_at=session.updated_date + timedelta(seconds=settings.UPLOAD_SESSION_TTL_SECONDS)
+    )
+
+
+async def _get_session(db: AsyncSession, session_id: str, user_id: int) -> UploadSession:
+    session = await db.scalar(
+        select(UploadSession).where(UploadSession.id == session_id, UploadSession.user_id == user_id)
+    )
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+
+def _allocate_part_file(location: str, file_size: int) -> None:
+    os.makedirs(SESSION_DIRECTORY, exist_ok=True)
+    with open(location, "wb") as part:
+        part.truncate(file_size)
+
+
+def _open_part_file(location: str, offset: int):
+    part = open(location, "r+b")
+    part.seek(offset)
+    return part
+
+
+async def create_upload_session_service(
+    user_id: int, session_create: UploadSessionCreate, db: AsyncSession
+) -> UploadSessionSchema:
+    if session_create.file_type not in ALLOWED_FILE_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid file type")
+    if session_create.file_size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=400, detail="File size exceeds the limit")
+
+    chunk_size = session_create.chunk_size or DEFAULT_CHUNK_SIZE
+    if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Chunk size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE} bytes"
+        )
+
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        filename=safe_filename(session_create.filename),
+        file_size=session_create.file_size,
+        file_type=session_create.file_type,
+        chunk_size=chunk_size,
+        user_id=user_id
+    )
+    await run_in_threadpool(_allocate_part_file, _session_part_path(session.id), session.file_size)
+
+    db.add(session)
+    await db.commit()
+    await db.refresh(session)
+    return await _to_schema(db, session)
+
+
+async def get_upload_session_service(session_id: str, user_id: int, db: AsyncSession) -> UploadSessionSchema:
+    session = await _get_session(db, session_id, user_id)
+    return await _to_schema(db, session)
+
+
+# Writes one chunk straight into its slot of the preallocated part file, so chunks can
+# arrive in any order and in parallel. A chunk only counts as received once all of its
+# bytes are on disk; an interrupted chunk is simply sent again.
+async def upload_chunk_service(
+    session_id: str,
+    chunk_index: int,
+    user_id: int,
+    chunks: AsyncIterator[bytes],
+    db: AsyncSession
+) -> UploadSessionSchema:
+    session = await _get_session(db, session_id, user_id)
+    if not 0 <= chunk_index < _total_chunks(session):
+        raise HTTPException(status_code=400, detail="Chunk index out of range")
+    # The chunk may take a while to arrive; its connection goes back to the pool meanwhile
+    await db.commit()
+
+    expected_size = _expected_chunk_size(session, chunk_index)
+    received_size = 0
+    part = await run_in_threadpool(
+        _open_part_file, _session_part_path(session.id), chunk_index * session.chunk_size
+    )
+    try:
+        async for chunk in chunks:
+            received_size += len(chunk)
+            if received_size > expected_size:
+                raise HTTPException(status_code=400, detail=f"Chunk {chunk_index} must be {expected_size} bytes")
+            await run_in_threadpool(part.write, chunk)
+    finally:
+        await run_in_threadpool(part.close)
+    if received_size != expected_size:
+        raise HTTPException(status_code=400, detail=f"Chunk {chunk_index} must be {expected_size} bytes")
+
+    touched = await db.execute(
+        update(UploadSession).where(UploadSession.id == session.id, UploadSession.user_id == user_id)
+        .values(updated_date=datetime.now())
+    )
+    if touched.rowcount != 1:
+        # Completed or aborted while the chunk was arriving
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    try:
+        async with db.begin_nested():
+            db.add(UploadSessionChunk(session_id=session.id, chunk_index=chunk_index))
+    except IntegrityError:
+        pass  # The chunk was sent again; its slot has simply been rewritten
+    await db.commit()
+    return await _to_schema(db, session)
+
+
+# The session is claimed by deleting its row in the transaction that records the file. A
+# concurrent completion waits on the row until this one commits and then finds nothing
+# to claim; if this one fails, its rollback hands the session back. A copy of the part
+# file is stored, so the part file stays usable until the file has been recorded.
+async def complete_upload_session_service(session_id: str, user_id: int, db: AsyncSession) -> File:
+    session = await _get_session(db, session_id, user_id)
+    missing = _total_chunks(session) - len(await _received_chunks(db, session.id))
+    if missing:
+        raise HTTPException(status_code=409, detail=f"Upload session is missing {missing} chunk(s)")
+
+    filename, file_type, file_size = session.filename, session.file_type, session.file_size
+    claimed = await db.execute(
+        delete(UploadSession).where(UploadSession.id == session.id, UploadSession.user_id == user_id)
+    )
+    if claimed.rowcount != 1:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    await db.execute(delete(UploadSessionChunk).where(UploadSessionChunk.session_id == session_id))
+
+    part_location = _session_part_path(session_id)
+    if not await run_in_threadpool(os.path.exists, part_location):
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Upload session data not found on disk")
+    temp_location = await run_in_threadpool(stage_copy, part_location)
+    try:
+        digest = await run_in_threadpool(hash_file, temp_location)
+    except BaseException:
+        await db.rollback()
+        discard_staged_file(temp_location)
+        raise
+    db_file = await store_upload(db, user_id, filename, file_type, file_size, digest, temp_location)
+    await run_in_threadpool(discard_staged_file, part_location)
+    return db_file
+
+
+async def abort_upload_session_service(session_id: str, user_id: int, db: AsyncSession) -> None:
+    session = await _get_session(db, session_id, user_id)
+    await db.execute(delete(UploadSessionChunk).where(UploadSessionChunk.session_id == session.id))
+    await db.execute(delete(UploadSession).where(UploadSession.id == session.id))
+    await db.commit()
+    discard_staged_file(_session_part_path(session_id))
+
+
+def purge_stale_upload_sessions(db: Session) -> int:
+    cutoff = datetime.now() - timedelta(seconds=settings.UPLOAD_SESSION_TTL_SECONDS)
+    stale_ids = [row.id for row in db.query(UploadSession.id).filter(UploadSession.updated_date < cutoff).all()]
+    if not stale_ids:
+        return 0
+    db.query(UploadSessionChunk).filter(UploadSessionChunk.session_id.in_(stale_ids)).delete(synchronize_session=False)
+    db.query(UploadSession).filter(UploadSession.id.in_(stale_ids)).delete(synchronize_session=False)
+    db.commit()
+    for session_id in stale_ids:
+        discard_staged_file(_session_part_path(session_id))
+    return len(stale_ids)
+
+
+def _purge_stale_upload_sessions() -> int:
+    db = SessionLocal()
+    try:
+        return purge_stale_upload_sessions(db)
+    finally:
+        db.close()
+
+
+async def run_upload_session_gc() -> None:
+    while True:
+        await asyncio.sleep(settings.UPLOAD_SESSION_GC_INTERVAL_SECONDS)
+        try:
+            purged = await run_in_threadpool(_purge_stale_upload_sessions)
+            if purged:
+                logger.info(f"Purged {purged} stale upload session(s)")
+        except Exception:
+            logger.exception("Failed to purge stale upload sessions")
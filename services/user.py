@@ -1,63 +1,87 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from schemas.user import UserCreate, UserUpdate, UserIn
-from utils.password_utils import get_password_hash
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from schemas.user import UserCreate, UserUpdate, UserIn, UserPage
+from utils.password_utils import hash_password
 from models.user import User
 from fastapi import HTTPException
 from typing import List, Optional
+from services.auth import invalidate_principal
+from services.file_cache import invalidate_user_files
+from services.search import filter_users_by_name, index_user, unindex_user
+from utils.pagination import decode_cursor, encode_cursor
 
 # Function to check if user exists
-def check_user_exists(db: Session, username: str, email: str) -> bool:
-    return db.query(User).filter(
+async def check_user_exists(db: AsyncSession, username: str, email: str) -> bool:
+    return await db.scalar(select(User.id).where(
         (User.username == username) | (User.email == email)
-    ).first() is not None
+    ).limit(1)) is not None
 
 # Function to create a new user
-def create_user(db: Session, user: UserCreate) -> User:
-    hashed_password = get_password_hash(user.password)
+async def create_user(db: AsyncSession, user: UserCreate) -> User:
+    hashed_password = await hash_password(user.password)
     db_user = User(username=user.username, email=user.email, password=hashed_password, role=user.role)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.flush()
+    await db.run_sync(index_user, db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 # Function to register a new user
-def register_new_user(db: Session, user: UserCreate):
-    if check_user_exists(db, user.username, user.email):
+async def register_new_user(db: AsyncSession, user: UserCreate):
+    if await check_user_exists(db, user.username, user.email):
         raise HTTPException(status_code=400, detail="Username or email already exists.")
-    return create_user(db, user)
+    return await create_user(db, user)
 
 # Function to update user details
-def update_user(db: Session, current_user: User, user_update: UserUpdate) -> User:
+async def update_user(db: AsyncSession, current_user: User, user_update: UserUpdate) -> User:
+    old_username = current_user.username
     if user_update.username:
         current_user.username = user_update.username
     if user_update.email:
         current_user.email = user_update.email
     if user_update.password:
-        current_user.password = user_update.password  # Hash the password in a real application
-    db.commit()
-    db.refresh(current_user)
+        current_user.password = await hash_password(user_update.password)
+    if user_update.username or user_update.email:
+        await db.run_sync(index_user, current_user)
+    await db.commit()
+    await invalidate_principal(old_username)
+    await invalidate_principal(current_user.username)
+    await db.refresh(current_user)
     return current_user
 
-# Function to fetch all users with pagination and search
-def fetch_all_users(db: Session, limit: int, offset: int, search: Optional[str] = None) -> List[User]:
-    query = db.query(User)
+# Function to fetch all users with keyset pagination (by id) and search
+async def fetch_all_users(db: AsyncSession, limit: int, cursor: Optional[str] = None, search: Optional[str] = None) -> UserPage:
+    statement = select(User)
     if search:
-        query = query.filter(func.lower(User.username).contains(search.lower()) | func.lower(User.email).contains(search.lower()))
-    return query.offset(offset).limit(limit).all()
+        statement = await db.run_sync(filter_users_by_name, statement, search)
+    if cursor:
+        last_id, = decode_cursor(cursor, 1)
+        if not isinstance(last_id, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        statement = statement.where(User.id > last_id)
+    users = (await db.scalars(statement.order_by(User.id).limit(limit + 1))).all()
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor(users[-1].id)
+    return UserPage.model_validate({"items": users, "next_cursor": next_cursor}, from_attributes=True)
 
 # Function to fetch a user by ID
-def fetch_user(db: Session, user_id: int) -> User:
-    user = db.query(User).filter(User.id == user_id).first()
+async def fetch_user(db: AsyncSession, user_id: int) -> User:
+    user = await db.get(User, user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 # Function to delete a user by ID
-def delete_user_by_id(db: Session, user_id: int) -> User:
-    user = db.query(User).filter(User.id == user_id).first()
+async def delete_user_by_id(db: AsyncSession, user_id: int) -> User:
+    user = await db.get(User, user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    db.delete(user)
-    db.commit()
+    await db.run_sync(unindex_user, user.id)
+    await db.delete(user)
+    await db.commit()
+    await invalidate_principal(user.username)
+    await invalidate_user_files(user.id)
     return user
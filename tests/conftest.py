@@ -0,0 +1,102 @@
+import os
+import tempfile
+
+import pytest
+
+# Settings are read when the application modules are imported, so the environment is set
+# up first: a throwaway SQLite database instead of MySQL.
+_workdir = tempfile.mkdtemp(prefix="file-manager-tests-")
+for name, value in {
+    "SECRET_KEY": "test-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "MYSQL_USER": "test",
+    "MYSQL_PASSWORD": "test",
+    "MYSQL_HOST": "localhost",
+    "MYSQL_PORT": "3306",
+    "MYSQL_DB_NAME": "file_manager",
+    "MYSQL_TEST_DB_NAME": "file_manager_test",
+    "BASE_URL": "http://test",
+    "MYSQL_ROOT_PASSWORD": "test",
+    "TESTING": "true",
+    "LOG_LEVEL": "WARNING",
+    "PASSWORD_HASH_ROUNDS": "4",
+}.items():
+    os.environ.setdefault(name, value)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'test.db')}"
+
+
+@pytest.fixture(scope="session")
+def _schema():
+    from db.init_db import init_db
+    from db.session import SessionLocal
+
+    with SessionLocal() as db:
+        init_db(db)
+
+
+@pytest.fixture
+def db(_schema):
+    from db.session import SessionLocal
+
+    with SessionLocal() as session:
+        yield session
+
+
+# Stored content goes to uploads/ under the working directory
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("uploads")
+    return tmp_path
+
+
+# Runs a coroutine of a test on its own event loop. Pooled async connections belong to the
+# loop that opened them, so they are closed before it ends.
+@pytest.fixture
+def run(_schema):
+    import asyncio
+
+    from db.session import async_engine
+
+    def run(coroutine):
+        async def main():
+            try:
+                return await coroutine
+            finally:
+                await async_engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
+
+
+@pytest.fixture
+def user(db):
+    import uuid
+
+    from models.user import User
+
+    user = User(username=uuid.uuid4().hex, email=f"{uuid.uuid4().hex}@example.com", password="-")
+    db.add(user)
+    db.commit()
+    return user
+
+
+# Uploads a file for `user` (or the user with `user_id`), random content by default
+@pytest.fixture
+def upload(run, user, workdir):
+    from db.session import AsyncSessionLocal
+    from services.file import upload_stream_service
+
+    async def stream(content):
+        yield content
+
+    async def store(filename, content, user_id):
+        async with AsyncSessionLocal() as db:
+            return await upload_stream_service(user_id, filename, "text/plain", stream(content), db)
+
+    def upload(filename, content=None, user_id=None):
+        return run(store(filename, os.urandom(64) if content is None else content, user_id or user.id))
+
+    return upload
@@ -0,0 +1,92 @@
+import uuid
+
+import pytest
+from sqlalchemy import inspect
+
+from db.session import AsyncSessionLocal
+from models.user import User
+from schemas.user import UserCreate, UserUpdate
+from services import auth
+from services.auth import authenticate_user, get_principal
+from services.user import create_user, update_user
+from utils.cache import TTLCache
+
+PASSWORD = "Secret-123!"
+
+
+@pytest.fixture(autouse=True)
+def principal_cache(monkeypatch):
+    cache = TTLCache(100, 60)
+    monkeypatch.setattr(auth, "principal_cache", cache)
+    monkeypatch.setattr(auth, "shared_principal_cache", None)
+    return cache
+
+
+async def _register() -> str:
+    username = uuid.uuid4().hex
+    async with AsyncSessionLocal() as db:
+        await create_user(db, UserCreate(username=username, email=f"{username}@example.com", password=PASSWORD))
+    return username
+
+
+async def _principal(username: str) -> User:
+    async with AsyncSessionLocal() as db:
+        return await get_principal(db, username)
+
+
+def test_a_cached_principal_has_the_cached_columns(run, principal_cache):
+    username = run(_register())
+    loaded = run(_principal(username))
+    assert principal_cache.get(username) is not None
+
+    cached = run(_principal(username))
+    for field in auth.PRINCIPAL_FIELDS:
+        assert getattr(cached, field) == getattr(loaded, field)
+    assert "password" in inspect(cached).unloaded
+
+
+def test_the_password_of_a_cached_principal_is_reloaded_explicitly(run):
+    username = run(_register())
+    run(_principal(username))
+
+    async def password():
+        async with AsyncSessionLocal() as db:
+            user = await get_principal(db, username)
+            await db.refresh(user, ["password"])
+            return user.password
+
+    assert run(password()).startswith("$2")
+
+
+def test_a_cached_principal_can_be_updated(run):
+    username = run(_register())
+    run(_principal(username))
+    new_username = uuid.uuid4().hex
+
+    async def update():
+        async with AsyncSessionLocal() as db:
+            user = await get_principal(db, username)
+            return await update_user(db, user, UserUpdate(username=new_username, password="Other-456!"))
+
+    assert run(update()).username == new_username
+    assert run(_principal(username)) is None
+
+    async def login(password):
+        async with AsyncSessionLocal() as db:
+            return await authenticate_user(db, new_username, password)
+
+    assert run(login(PASSWORD)) is None
+    assert run(login("Other-456!")).username == new_username
+
+
+def test_credentials_are_checked_in_a_session_holding_a_cached_principal(run):
+    username = run(_register())
+    run(_principal(username))
+
+    async def login():
+        async with AsyncSessionLocal() as db:
+            principal = await get_principal(db, username)
+            return principal, await authenticate_user(db, username, PASSWORD)
+
+    principal, user = run(login())
+    assert user is principal
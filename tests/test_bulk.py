@@ -0,0 +1,148 @@
+import os
+import uuid
+
+import pytest
+from fastapi import BackgroundTasks, HTTPException
+from sqlalchemy import select
+
+from db.session import AsyncSessionLocal
+from models.blob import Blob
+from models.file import File
+from models.search import FileNameGram
+from models.user import User
+from schemas.file import FileBulkRename, FileFilter
+from services.analytics import usage_by_type
+from services.file import bulk_delete_files_service, bulk_rename_files_service, get_files_service
+from services.search import index_grams
+from services.storage import stored_file_exists
+
+
+@pytest.fixture
+def other(db):
+    other = User(username=uuid.uuid4().hex, email=f"{uuid.uuid4().hex}@example.com", password="-")
+    db.add(other)
+    db.commit()
+    return other
+
+
+async def _bulk_delete(user_id, file_filter):
+    tasks = BackgroundTasks()
+    async with AsyncSessionLocal() as db:
+        response = await bulk_delete_files_service(user_id, file_filter, db, tasks)
+    await tasks()
+    return response.deleted
+
+
+async def _bulk_rename(user_id, file_filter, find, replace):
+    async with AsyncSessionLocal() as db:
+        response = await bulk_rename_files_service(user_id, FileBulkRename(filter=file_filter, find=find, replace=replace), db)
+    return response.renamed
+
+
+def _file(db, file_id):
+    db.expire_all()
+    return db.get(File, file_id)
+
+
+def _ref_count(db, blob_id):
+    db.expire_all()
+    blob = db.get(Blob, blob_id)
+    return None if blob is None else blob.ref_count
+
+
+def _usage(db, user_id):
+    db.expire_all()
+    usage = {entry.file_type: (entry.file_count, entry.total_size) for entry in usage_by_type(db, user_id)}
+    db.rollback()
+    return usage
+
+
+def test_bulk_delete_skips_files_of_other_users(db, run, user, other, upload):
+    mine = [upload("a.txt"), upload("b.txt")]
+    theirs = upload("c.txt", user_id=other.id)
+
+    assert run(_bulk_delete(user.id, FileFilter(ids=[file.id for file in (*mine, theirs)]))) == 2
+    assert all(_file(db, file.id) is None for file in mine)
+    assert _file(db, theirs.id) is not None
+    assert _ref_count(db, theirs.blob_id) == 1
+    assert stored_file_exists(theirs.file_path)
+
+
+def test_bulk_delete_releases_blob_references(db, run, user, other, upload):
+    shared, single = os.urandom(64), os.urandom(64)
+    first, second, unique = upload("a.txt", shared), upload("b.txt", shared), upload("c.txt", single)
+    theirs = upload("d.txt", shared, user_id=other.id)
+    assert first.blob_id == second.blob_id == theirs.blob_id
+    assert _ref_count(db, first.blob_id) == 3
+
+    assert run(_bulk_delete(user.id, FileFilter(ids=[first.id, unique.id]))) == 2
+    assert _ref_count(db, first.blob_id) == 2
+    assert _ref_count(db, unique.blob_id) is None
+    assert not stored_file_exists(unique.file_path)
+
+    assert run(_bulk_delete(user.id, FileFilter(name_pattern="*.txt"))) == 1
+    assert _ref_count(db, first.blob_id) == 1
+    assert stored_file_exists(theirs.file_path)
+
+
+def test_bulk_delete_updates_the_usage_summary(db, run, user, upload):
+    upload("a.txt", b"x" * 10)
+    upload("b.txt", b"y" * 20)
+    upload("c.log", b"z" * 30)
+    assert _usage(db, user.id) == {"text/plain": (3, 60)}
+
+    assert run(_bulk_delete(user.id, FileFilter(name_pattern="*.txt"))) == 2
+    assert _usage(db, user.id) == {"text/plain": (1, 30)}
+
+
+def test_bulk_operations_need_a_filter(run, user):
+    with pytest.raises(HTTPException) as error:
+        run(_bulk_delete(user.id, FileFilter()))
+    assert error.value.status_code == 400
+    with pytest.raises(HTTPException) as error:
+        run(_bulk_rename(user.id, FileFilter(), "a", "b"))
+    assert error.value.status_code == 400
+
+
+def test_bulk_rename_skips_files_of_other_users(db, run, user, other, upload):
+    mine = upload("scan-1.pdf")
+    theirs = upload("scan-2.pdf", user_id=other.id)
+
+    assert run(_bulk_rename(user.id, FileFilter(ids=[mine.id, theirs.id]), "scan", "invoice")) == 1
+    assert _file(db, mine.id).filename == "invoice-1.pdf"
+    assert _file(db, theirs.id).filename == "scan-2.pdf"
+    db.rollback()
+    assert set(db.scalars(select(FileNameGram.gram).where(FileNameGram.file_id == theirs.id))) == index_grams("scan-2.pdf")
+
+
+def test_bulk_rename_keeps_the_usage_summary(db, run, user, upload):
+    upload("a.txt", b"x" * 10)
+    upload("b.txt", b"y" * 20)
+
+    assert run(_bulk_rename(user.id, FileFilter(name_pattern="*.txt"), ".txt", "-old.txt")) == 2
+    assert _usage(db, user.id) == {"text/plain": (2, 30)}
+
+
+def test_bulk_rename_rejects_invalid_names_without_renaming(db, run, user, upload):
+    files = [upload("a.txt"), upload("b.txt")]
+
+    with pytest.raises(HTTPException) as error:
+        run(_bulk_rename(user.id, FileFilter(name_pattern="*.txt"), "b.txt", "dir/b.txt"))
+    assert error.value.status_code == 400
+    assert [_file(db, file.id).filename for file in files] == ["a.txt", "b.txt"]
+
+
+def test_bulk_metadata_returns_only_own_files(run, user, other, upload):
+    mine = [upload("b.txt"), upload("a.txt")]
+    theirs = upload("c.txt", user_id=other.id)
+
+    async def fetch(file_ids):
+        async with AsyncSessionLocal() as db:
+            return await get_files_service(file_ids, user.id, db)
+
+    files = run(fetch([theirs.id, mine[1].id, mine[0].id, mine[0].id, 0]))
+    assert [file.id for file in files] == sorted(file.id for file in mine)
+    assert run(fetch([])) == []
+    with pytest.raises(HTTPException) as error:
+        run(fetch(list(range(1001))))
+    assert error.value.status_code == 400
@@ -0,0 +1,137 @@
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from schemas.file import SharePermission
+from services import compression, share
+from services.share import ShareDenylist, sign_share_token
+from services.storage import blob_path, store_staged_file
+from utils import compression as codings
+from utils.compression import Encoder, negotiate_encoding
+
+TEXT = b"".join(b"line %d of a compressible text file\n" % number for number in range(200))
+
+
+@pytest.fixture
+def encoders(monkeypatch):
+    # Every coding we can produce, whichever optional packages are installed
+    encoders = {"zstd": Encoder("zst", None), "br": Encoder("br", None), "gzip": Encoder("gz", None)}
+    monkeypatch.setattr(codings, "ENCODERS", encoders)
+    return encoders
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("gzip", "gzip"),
+    ("GZIP", "gzip"),
+    ("gzip, br", "br"),
+    ("gzip, br, zstd", "zstd"),
+    ("gzip;q=1.0, br;q=0.5", "gzip"),
+    ("gzip;q=0.5, br;q=0.8, zstd;q=0.1", "br"),
+    ("br;q=0, gzip", "gzip"),
+    ("gzip;q=oops, br;q=0.2", "br"),
+    ("*", "zstd"),
+    ("*;q=0.5, gzip", "gzip"),
+    ("zstd;q=0, br;q=0, *", "gzip"),
+    ("identity", None),
+    ("identity;q=0", None),
+    ("identity;q=0, gzip", "gzip"),
+    ("compress, x-unknown", None),
+    ("*;q=0", None),
+])
+def test_codings_are_negotiated_by_weight_then_preference(encoders, header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+def test_only_codings_that_can_be_produced_are_chosen(encoders):
+    del encoders["zstd"], encoders["br"]
+    assert negotiate_encoding("br, zstd") is None
+    assert negotiate_encoding("br, gzip;q=0.1") == "gzip"
+
+
+@pytest.fixture
+def client(workdir, monkeypatch):
+    from app.main import app
+
+    monkeypatch.setattr(compression, "_cache", None)
+    monkeypatch.setattr(share, "share_denylist", ShareDenylist())
+    return TestClient(app)
+
+
+# A share link to `content` stored in the local backend, with the digest as its ETag
+def _link(content: bytes, media_type: str = "text/plain") -> tuple:
+    digest = hashlib.sha256(content).hexdigest()
+    with open("uploads/.staged", "wb") as staged:
+        staged.write(content)
+    store_staged_file("uploads/.staged", digest)
+    _, token = sign_share_token(
+        1, blob_path(digest), "notes.txt", media_type, len(content), f'"{digest}"', datetime(2024, 1, 1),
+        datetime.now() + timedelta(minutes=5), [SharePermission.download]
+    )
+    return f"/file/public/{token}", digest
+
+
+def test_compressible_downloads_are_sent_gzipped(client):
+    url, digest = _link(TEXT)
+
+    response = client.get(url, headers={"accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == f'"{digest}-gzip"'
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(TEXT)
+    assert response.content == TEXT
+
+    cached = client.get(url, headers={"accept-encoding": "gzip", "if-none-match": f'"{digest}-gzip"'})
+    assert cached.status_code == 304
+    assert cached.headers["vary"] == "Accept-Encoding"
+
+
+@pytest.mark.parametrize("accept_encoding", ["identity", "gzip;q=0", "identity;q=0", "compress, x-unknown"])
+def test_downloads_without_an_acceptable_coding_are_sent_as_they_are(client, accept_encoding):
+    url, digest = _link(TEXT)
+
+    response = client.get(url, headers={"accept-encoding": accept_encoding})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == f'"{digest}"'
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == TEXT
+
+
+def test_byte_ranges_are_served_on_the_identity_content(client):
+    url, digest = _link(TEXT)
+
+    response = client.get(url, headers={"accept-encoding": "gzip", "range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == f'"{digest}"'
+    assert response.headers["content-range"] == f"bytes 100-199/{len(TEXT)}"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == TEXT[100:200]
+
+
+def test_a_range_validated_by_the_compressed_etag_gets_the_whole_identity_content(client):
+    url, digest = _link(TEXT)
+
+    response = client.get(url, headers={
+        "accept-encoding": "gzip", "range": "bytes=100-199", "if-range": f'"{digest}-gzip"'
+    })
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == f'"{digest}"'
+    assert response.content == TEXT
+
+
+@pytest.mark.parametrize("content, media_type", [(TEXT[:100], "text/plain"), (b"%PDF-1.7" + TEXT, "application/pdf")])
+def test_small_and_precompressed_downloads_are_not_compressed(client, content, media_type):
+    url, digest = _link(content, media_type)
+
+    response = client.get(url, headers={"accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert "vary" not in response.headers
+    assert response.content == content
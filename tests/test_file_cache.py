@@ -0,0 +1,131 @@
+import time
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from db.session import AsyncSessionLocal
+from models.file import File
+from models.job import Job
+from schemas.file import FileUpdate
+from services import file_cache, share
+from services.file import (delete_file_service, download_file_service, get_file_service, list_user_files_service,
+                           update_file_service)
+from services.file_cache import invalidate_user_files, user_version
+from services.processing import process_file_job
+from services.share import ShareDenylist
+from utils.cache import MemoryCacheBackend, TTLCache
+from utils.file_analysis import SIGNATURES
+
+
+# Each TTLCache stands for the local tier of one worker process
+def _local(ttl=60):
+    return TTLCache(1000, ttl)
+
+
+@pytest.fixture(autouse=True)
+def tiers(monkeypatch):
+    monkeypatch.setattr(file_cache, "local_cache", _local())
+    monkeypatch.setattr(file_cache, "shared_cache", None)
+    monkeypatch.setattr(share, "share_denylist", ShareDenylist())
+    return monkeypatch
+
+
+def _status(run, coroutine) -> int:
+    with pytest.raises(HTTPException) as error:
+        run(coroutine)
+    return error.value.status_code
+
+
+async def _get(file_id, user_id):
+    async with AsyncSessionLocal() as db:
+        return await get_file_service(file_id, user_id, db)
+
+
+async def _delete(file_id, user_id):
+    async with AsyncSessionLocal() as db:
+        await delete_file_service(file_id, user_id, db)
+
+
+async def _names(user_id):
+    async with AsyncSessionLocal() as db:
+        page = await list_user_files_service(user_id, db, limit=100)
+    return sorted(item.filename for item in page.items)
+
+
+def test_writes_replace_the_version(run, user):
+    version = run(user_version(user.id))
+    assert run(user_version(user.id)) == version
+    run(invalidate_user_files(user.id))
+    assert run(user_version(user.id)) not in (version, None)
+
+
+def test_a_rename_shows_in_the_next_listing(db, run, user, upload):
+    file = upload("draft.txt")
+    assert run(_names(user.id)) == ["draft.txt"]
+
+    # Not written through the services, so the cached page is still served
+    db.add(File(filename="direct.txt", file_path="uploads/direct", upload_date=datetime.now(), file_size=1,
+                file_type="text/plain", user_id=user.id))
+    db.commit()
+    assert run(_names(user.id)) == ["draft.txt"]
+
+    async def rename():
+        async with AsyncSessionLocal() as session:
+            await update_file_service(file.id, user.id, FileUpdate(filename="final"), session)
+
+    run(rename())
+    assert run(_names(user.id)) == ["direct.txt", "final.txt"]
+
+
+def test_a_deleted_file_is_not_served_from_the_cache(run, user, upload):
+    file = upload("notes.txt")
+    assert run(_get(file.id, user.id)).filename == "notes.txt"
+
+    run(_delete(file.id, user.id))
+    assert _status(run, _get(file.id, user.id)) == 404
+
+
+def test_a_quarantined_file_is_not_served_from_the_cache(run, user, upload):
+    file = upload("notes.txt", SIGNATURES["EICAR-Test-File"])
+
+    async def download():
+        async with AsyncSessionLocal() as db:
+            return await download_file_service(file.id, db, user.id)
+
+    assert run(download()).id == file.id
+    run(process_file_job(Job(kind="process_file", file_id=file.id, attempts=1)))
+    assert _status(run, download()) == 403
+
+
+def test_other_workers_see_writes_at_once_with_a_shared_tier(run, user, upload, tiers):
+    tiers.setattr(file_cache, "shared_cache", MemoryCacheBackend())
+    first, second = _local(), _local()
+    file = upload("notes.txt")
+
+    tiers.setattr(file_cache, "local_cache", first)
+    assert run(_get(file.id, user.id)).filename == "notes.txt"
+    assert run(_names(user.id)) == ["notes.txt"]
+
+    tiers.setattr(file_cache, "local_cache", second)
+    run(_delete(file.id, user.id))
+
+    tiers.setattr(file_cache, "local_cache", first)
+    assert _status(run, _get(file.id, user.id)) == 404
+    assert run(_names(user.id)) == []
+
+
+def test_without_a_shared_tier_other_workers_see_writes_within_the_local_ttl(run, user, upload, tiers):
+    first, second = _local(ttl=0.5), _local(ttl=0.5)
+    file = upload("notes.txt")
+
+    tiers.setattr(file_cache, "local_cache", first)
+    assert run(_get(file.id, user.id)).filename == "notes.txt"
+
+    tiers.setattr(file_cache, "local_cache", second)
+    run(_delete(file.id, user.id))
+
+    tiers.setattr(file_cache, "local_cache", first)
+    assert run(_get(file.id, user.id)).filename == "notes.txt"  # stale, within the documented bound
+    time.sleep(0.6)
+    assert _status(run, _get(file.id, user.id)) == 404
@@ -0,0 +1,41 @@
+import pytest
+
+from utils.file_response import MAX_RANGES, parse_range_header
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", [(0, 99)]),
+    ("bytes=100-", [(100, 999)]),
+    ("bytes=-100", [(900, 999)]),
+    ("bytes=-5000", [(0, 999)]),
+    ("bytes=900-5000", [(900, 999)]),
+    ("BYTES = 0-0", [(0, 0)]),
+    ("bytes=0-9, 20-29", [(0, 9), (20, 29)]),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_range_header(header, 1000) == expected
+
+
+def test_overlapping_and_adjacent_ranges_are_merged():
+    assert parse_range_header("bytes=50-99,0-49,40-60,200-210,211-220", 1000) == [(0, 99), (200, 220)]
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=2000-3000", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    assert parse_range_header(header, 1000) == []
+
+
+def test_nothing_is_satisfiable_in_an_empty_file():
+    assert parse_range_header("bytes=0-", 0) == []
+
+
+@pytest.mark.parametrize("header", ["items=0-9", "bytes=", "bytes=5", "bytes=a-b", "bytes=9-0", "bytes=0-9,x"])
+def test_malformed_headers_are_ignored(header):
+    assert parse_range_header(header, 1000) is None
+
+
+def test_too_many_ranges_are_ignored():
+    specs = ",".join(f"{start}-{start}" for start in range(0, 2 * (MAX_RANGES + 1), 2))
+    assert parse_range_header(f"bytes={specs}", 1000) is None
+    specs = ",".join(f"{start}-{start}" for start in range(0, 2 * MAX_RANGES, 2))
+    assert len(parse_range_header(f"bytes={specs}", 1000)) == MAX_RANGES
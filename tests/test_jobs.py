@@ -0,0 +1,117 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from core.config import settings
+from models.job import Job
+from schemas.job import JobStatus
+from services import jobs
+from services.jobs import PermanentJobError, _run_job, claim_jobs, enqueue_jobs, finish_job, retry_or_fail_job
+
+
+@pytest.fixture
+def kind():
+    # Every test queues its own kind of job, so it only ever claims its own
+    return uuid.uuid4().hex
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(jobs.random, "uniform", lambda low, high: high)
+
+
+def _queue(db, kind, count=1):
+    enqueue_jobs(db, kind, [None] * count)
+    db.commit()
+
+
+def _job(db, job_id):
+    db.expire_all()
+    job = db.get(Job, job_id)
+    db.rollback()
+    return job
+
+
+def test_a_claimed_job_is_leased(db, kind):
+    _queue(db, kind, 3)
+
+    claimed = claim_jobs(db, [kind], 2)
+    assert len(claimed) == 2
+    for job in claimed:
+        assert (job.status, job.attempts) == (JobStatus.running, 1)
+        assert job.locked_until > datetime.now() + timedelta(seconds=settings.JOB_LEASE_SECONDS - 60)
+    assert len(claim_jobs(db, [kind], 5)) == 1
+    assert claim_jobs(db, [kind], 5) == []
+
+
+def test_a_job_whose_lease_ran_out_is_claimed_again(db, kind):
+    _queue(db, kind)
+    job, = claim_jobs(db, [kind], 1)
+
+    db.execute(update(Job).where(Job.id == job.id).values(locked_until=datetime.now() - timedelta(seconds=1)))
+    db.commit()
+    reclaimed, = claim_jobs(db, [kind], 1)
+    assert reclaimed.id == job.id
+    assert reclaimed.attempts == 2
+
+
+def test_failed_attempts_back_off_exponentially(db, kind, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 10)
+    _queue(db, kind)
+    delays = []
+    for attempt in range(1, 4):
+        job, = claim_jobs(db, [kind], 1)
+        assert job.attempts == attempt
+        before = datetime.now()
+        assert not retry_or_fail_job(db, job, RuntimeError("unavailable"))
+
+        job = _job(db, job.id)
+        assert (job.status, job.locked_until, job.last_error) == (JobStatus.pending, None, "RuntimeError: unavailable")
+        assert claim_jobs(db, [kind], 1) == []
+        delays.append(round((job.run_after - before).total_seconds()))
+        db.execute(update(Job).where(Job.id == job.id).values(run_after=datetime.now()))
+        db.commit()
+
+    base = settings.JOB_RETRY_BASE_SECONDS
+    assert delays == [base, 2 * base, 4 * base]
+    assert jobs._retry_delay(30) == settings.JOB_RETRY_MAX_SECONDS
+
+
+def test_a_job_fails_for_good_after_its_last_attempt(db, kind, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 1)
+    _queue(db, kind)
+    job, = claim_jobs(db, [kind], 1)
+
+    assert retry_or_fail_job(db, job, RuntimeError("broken"))
+    assert _job(db, job.id).status == JobStatus.failed
+    assert claim_jobs(db, [kind], 1) == []
+
+
+def test_a_permanent_error_is_not_retried(db, kind):
+    _queue(db, kind)
+    job, = claim_jobs(db, [kind], 1)
+
+    assert retry_or_fail_job(db, job, PermanentJobError("no such content"))
+    assert _job(db, job.id).last_error == "PermanentJobError: no such content"
+
+
+def test_workers_finish_or_retry_the_jobs_they_run(db, kind):
+    _queue(db, kind, 2)
+    done, failing = claim_jobs(db, [kind], 2)
+
+    async def succeed(job):
+        pass
+
+    async def fail(job):
+        raise RuntimeError("unavailable")
+
+    asyncio.run(_run_job(succeed, done))
+    asyncio.run(_run_job(fail, failing))
+    assert _job(db, done.id) is None
+    assert _job(db, failing.id).status == JobStatus.pending
+
+    finish_job(db, failing)
+    assert _job(db, failing.id) is None
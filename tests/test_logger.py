@@ -0,0 +1,50 @@
+import logging
+import queue
+import threading
+import time
+
+from core.config import settings
+from logger.logger import DrainingQueueListener
+
+
+class SlowHandler(logging.Handler):
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+        self.records = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        time.sleep(self.delay)
+        self.records.append(record.getMessage())
+
+
+def _saturated(handler: logging.Handler, size: int = 5):
+    log_queue = queue.Queue(maxsize=size)
+    listener = DrainingQueueListener(log_queue, handler)
+    listener.start()
+    for number in range(size + 1):  # one is taken off by the listener at once
+        log_queue.put(logging.makeLogRecord({"msg": f"record {number}"}))
+    assert log_queue.full()
+    return listener
+
+
+def test_stopping_with_a_full_queue_writes_every_record():
+    handler = SlowHandler(0.01)
+    listener = _saturated(handler)
+
+    listener.stop()
+    assert handler.records == [f"record {number}" for number in range(6)]
+    listener.stop()
+
+
+def test_stopping_gives_up_when_no_record_can_be_written(monkeypatch):
+    monkeypatch.setattr(settings, "LOG_SHUTDOWN_TIMEOUT_SECONDS", 0.1)
+    stuck = threading.Event()
+    handler = SlowHandler(0)
+    handler.emit = lambda record: stuck.wait()
+    listener = _saturated(handler)
+
+    started = time.monotonic()
+    listener.stop()
+    assert time.monotonic() - started < 1
+    stuck.set()
@@ -0,0 +1,90 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from db.session import AsyncSessionLocal
+from models.file import File
+from schemas.file import FileSortField, SortOrder
+from services.file import list_user_files_service
+from utils.pagination import decode_cursor, encode_cursor
+
+UPLOAD_DATE = datetime(2024, 3, 1, 9, 30)
+
+
+@pytest.fixture
+def files(db, user):
+    files = [
+        File(filename=name, file_path=f"uploads/{index}", upload_date=UPLOAD_DATE.replace(minute=minute),
+             file_size=size, file_type="text/plain", user_id=user.id)
+        for index, (name, size, minute) in enumerate([
+            ("b.txt", 5, 30), ("a.txt", 5, 30), ("b.txt", 1, 10), ("c.txt", 9, 30), ("a.txt", 5, 20),
+            ("c.txt", 1, 10), ("b.txt", 9, 20)
+        ])
+    ]
+    db.add_all(files)
+    db.commit()
+    return files
+
+
+async def _page(user_id, cursor=None, sort=FileSortField.date, order=SortOrder.asc, limit=2):
+    async with AsyncSessionLocal() as db:
+        return await list_user_files_service(user_id, db, limit=limit, cursor=cursor, sort=sort, order=order)
+
+
+def _status(run, coroutine) -> int:
+    with pytest.raises(HTTPException) as error:
+        run(coroutine)
+    return error.value.status_code
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("date:asc", UPLOAD_DATE, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, 3) == ["date:asc", UPLOAD_DATE.isoformat(), 42]
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor!", encode_cursor("date:asc", 1), encode_cursor(1, 2, 3, 4)])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, 3)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize("sort, column", [
+    (FileSortField.date, "upload_date"), (FileSortField.size, "file_size"), (FileSortField.name, "filename")
+])
+@pytest.mark.parametrize("order", [SortOrder.asc, SortOrder.desc])
+def test_pages_follow_the_sort_order_with_ties_broken_by_id(run, user, files, sort, column, order):
+    seen, cursor = [], None
+    while True:
+        page = run(_page(user.id, cursor, sort, order))
+        seen.extend(item.id for item in page.items)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    expected = sorted(files, key=lambda file: (getattr(file, column), file.id), reverse=order == SortOrder.desc)
+    assert seen == [file.id for file in expected]
+
+
+def test_a_cursor_only_continues_its_own_sort_order(run, user, files):
+    cursor = run(_page(user.id, sort=FileSortField.size)).next_cursor
+    assert _status(run, _page(user.id, cursor, FileSortField.size, SortOrder.desc)) == 400
+    assert _status(run, _page(user.id, cursor, FileSortField.name)) == 400
+
+
+@pytest.mark.parametrize("sort, value, last_id", [
+    (FileSortField.date, "yesterday", 1),
+    (FileSortField.date, {"a": 1}, 1),
+    (FileSortField.size, {"a": 1}, 1),
+    (FileSortField.size, "5", 1),
+    (FileSortField.size, True, 1),
+    (FileSortField.name, ["a.txt"], 1),
+    (FileSortField.name, 5, 1),
+    (FileSortField.name, "a.txt", "1"),
+    (FileSortField.name, "a.txt", None),
+])
+def test_cursors_with_values_of_the_wrong_type_are_rejected(run, user, sort, value, last_id):
+    cursor = encode_cursor(f"{sort.value}:asc", value, last_id)
+    assert _status(run, _page(user.id, cursor, sort)) == 400
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from db.session import AsyncSessionLocal
+from models.file import File
+from models.job import Job
+from models.share import ShareRevocation
+from schemas.file import FileShareCreate, ProcessingStatus, SharePermission
+from services import share
+from services.analytics import usage_by_type
+from services.file import download_file_service, share_file_link_service
+from services.jobs import PermanentJobError
+from services.processing import process_file_job
+from services.share import ShareDenylist, verify_share_token
+from services.storage import remove_stored_file
+from utils.file_analysis import SIGNATURES
+
+EICAR = SIGNATURES["EICAR-Test-File"]
+
+
+@pytest.fixture(autouse=True)
+def denylist(monkeypatch):
+    denylist = ShareDenylist()
+    monkeypatch.setattr(share, "share_denylist", denylist)
+    return denylist
+
+
+def _process(run, file):
+    return run(process_file_job(Job(kind="process_file", file_id=file.id, attempts=1)))
+
+
+def _file(db, file_id):
+    db.expire_all()
+    file = db.get(File, file_id)
+    db.rollback()
+    return file
+
+
+async def _share(file, user_id):
+    async with AsyncSessionLocal() as db:
+        return await share_file_link_service(
+            file.id, user_id, db, "http://test", FileShareCreate(permissions=[SharePermission.download])
+        )
+
+
+def _status(run, coroutine) -> int:
+    with pytest.raises(HTTPException) as error:
+        run(coroutine)
+    return error.value.status_code
+
+
+def test_clean_files_become_ready_with_their_metadata(db, run, upload):
+    file = upload("notes.txt", b"first\nsecond\nthird")
+    assert file.processing_status == ProcessingStatus.pending
+
+    _process(run, file)
+    file = _file(db, file.id)
+    assert (file.processing_status, file.detected_type) == (ProcessingStatus.ready, "text/plain")
+    assert file.file_metadata["lines"] == 3
+    assert file.file_metadata["size"] == 18
+
+
+def test_the_content_decides_an_accepted_type(db, run, user, upload):
+    file = upload("report.txt", b"%PDF-1.7\n" + os.urandom(64))
+
+    _process(run, file)
+    assert _file(db, file.id).file_type == "application/pdf"
+    usage = {entry.file_type: entry.file_count for entry in usage_by_type(db, user.id)}
+    db.rollback()
+    assert usage == {"application/pdf": 1}
+
+
+@pytest.mark.parametrize("content", [b"prefix " + EICAR + b" suffix", b"MZ" + os.urandom(64)])
+def test_flagged_files_are_quarantined_and_their_links_revoked(db, run, user, upload, denylist, content):
+    file = upload("notes.txt", content)
+    link = run(_share(file, user.id))
+    token = link.share_link.rsplit("/", 1)[1]
+    verify_share_token(token, SharePermission.download)
+
+    _process(run, file)
+    assert _file(db, file.id).processing_status == ProcessingStatus.quarantined
+    assert db.scalars(select(ShareRevocation.file_id).where(ShareRevocation.file_id == file.id)).all() == [file.id]
+    db.rollback()
+    with pytest.raises(HTTPException) as error:
+        verify_share_token(token, SharePermission.download)
+    assert error.value.status_code == 410
+
+    async def download():
+        async with AsyncSessionLocal() as session:
+            return await download_file_service(file.id, session, user.id)
+
+    assert _status(run, download()) == 403
+    assert _status(run, _share(file, user.id)) == 403
+
+
+def test_a_threat_is_recorded_in_the_metadata(db, run, upload):
+    file = upload("notes.txt", EICAR)
+
+    _process(run, file)
+    assert _file(db, file.id).file_metadata["threat"] == "EICAR-Test-File"
+
+
+def test_files_whose_content_is_missing_fail_permanently(db, run, upload):
+    file = upload("notes.txt")
+    remove_stored_file(file.file_path)
+
+    with pytest.raises(PermanentJobError):
+        _process(run, file)
+    assert _file(db, file.id).processing_status == ProcessingStatus.failed
+
+
+def test_a_deleted_file_needs_no_processing(run):
+    _process(run, File(id=2 ** 31 - 1))
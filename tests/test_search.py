@@ -0,0 +1,126 @@
+import pytest
+from fastapi import BackgroundTasks
+from sqlalchemy import select
+
+from db.session import AsyncSessionLocal
+from models.file import File
+from models.search import FileNameGram
+from schemas.file import FileBulkRename, FileFilter, FileUpdate, SearchMode
+from services import search
+from services.file import (bulk_delete_files_service, bulk_rename_files_service, delete_file_service,
+                           list_user_files_service, update_file_service)
+from services.search import _rarest_gram, filter_files_by_name, index_grams, query_grams
+
+
+def test_names_are_indexed_as_padded_trigrams_of_each_word():
+    assert index_grams("Report") == {"$$r", "$re", "rep", "epo", "por", "ort", "rt$"}
+    assert index_grams("a_b.pdf") == {"$$a", "$a$", "$$b", "$b$", "$$p", "$pd", "pdf", "df$"}
+    assert index_grams("") == set()
+
+
+def test_query_words_are_padded_only_at_boundaries_the_query_shows():
+    assert query_grams("epo") == {"epo"}
+    assert query_grams("report.p") == {"rep", "epo", "por", "ort", "rt$", "$$p"}
+    assert query_grams("rep", SearchMode.prefix) == {"$$r", "$re", "rep"}
+    assert query_grams("port rep", SearchMode.tokens) == {"por", "ort", "rep"}
+
+
+@pytest.mark.parametrize("term", ["", "x", "ab", "-", "%"])
+def test_queries_shorter_than_a_trigram_have_no_grams(term):
+    assert query_grams(term) == set()
+
+
+def _grams(db, file_id):
+    db.expire_all()
+    return set(db.scalars(select(FileNameGram.gram).where(FileNameGram.file_id == file_id)))
+
+
+def _search(run, user_id, term, match=SearchMode.substring):
+    async def search_files():
+        async with AsyncSessionLocal() as db:
+            return await list_user_files_service(user_id, db, limit=100, search=term, match=match)
+
+    return sorted(item.filename for item in run(search_files()).items)
+
+
+def test_short_queries_fall_back_to_the_name_predicate(run, user, upload):
+    for name in ("ab.txt", "xaby.txt", "other.txt"):
+        upload(name)
+    assert _search(run, user.id, "ab") == ["ab.txt", "xaby.txt"]
+    assert _search(run, user.id, "A") == ["ab.txt", "xaby.txt"]
+
+
+def test_candidates_come_from_the_rarest_gram(db, run, user, upload):
+    for name in ("invoice-1.pdf", "invoice-2.pdf", "invoice-3.pdf", "voices.txt"):
+        upload(name)
+    gram, postings = _rarest_gram(db, FileNameGram.gram, query_grams("invoice"), FileNameGram.user_id == user.id)
+    assert (gram, postings) == ("inv", 3)
+    gram, postings = _rarest_gram(db, FileNameGram.gram, query_grams("voices"), FileNameGram.user_id == user.id)
+    assert postings == 1 and gram not in index_grams("invoice")
+
+    restricted = filter_files_by_name(db, select(File), "voice", SearchMode.substring, user.id)
+    assert "file_name_grams" in str(restricted)
+    assert _search(run, user.id, "voice") == ["invoice-1.pdf", "invoice-2.pdf", "invoice-3.pdf", "voices.txt"]
+    assert _search(run, user.id, "invoice-2") == ["invoice-2.pdf"]
+
+
+def test_common_grams_skip_the_candidate_lookup(db, run, user, upload, monkeypatch):
+    for name in ("invoice-1.pdf", "invoice-2.pdf", "invoice-3.pdf"):
+        upload(name)
+    monkeypatch.setattr(search, "SELECTIVITY_LIMIT", 2)
+    unrestricted = filter_files_by_name(db, select(File), "invoice", SearchMode.substring, user.id)
+    assert "file_name_grams" not in str(unrestricted)
+    assert _search(run, user.id, "invoice") == ["invoice-1.pdf", "invoice-2.pdf", "invoice-3.pdf"]
+
+
+def test_search_matches_prefixes_and_tokens(run, user, upload):
+    for name in ("annual report.pdf", "report-annual.pdf", "reporting.txt"):
+        upload(name)
+    assert _search(run, user.id, "rep", SearchMode.prefix) == ["report-annual.pdf", "reporting.txt"]
+    assert _search(run, user.id, "annual report", SearchMode.tokens) == ["annual report.pdf", "report-annual.pdf"]
+
+
+def test_the_index_follows_a_rename(db, run, user, upload):
+    file = upload("draft.txt")
+
+    async def rename():
+        async with AsyncSessionLocal() as session:
+            await update_file_service(file.id, user.id, FileUpdate(filename="final"), session)
+
+    run(rename())
+    assert _grams(db, file.id) == index_grams("final.txt")
+    assert _search(run, user.id, "draft") == []
+    assert _search(run, user.id, "final") == ["final.txt"]
+
+
+def test_the_index_follows_a_bulk_rename(db, run, user, upload):
+    files = [upload(name) for name in ("scan-01.pdf", "scan-02.pdf", "notes.txt")]
+
+    async def rename():
+        async with AsyncSessionLocal() as session:
+            return await bulk_rename_files_service(user.id, FileBulkRename(
+                filter=FileFilter(name_pattern="scan-*"), find="scan", replace="invoice"
+            ), session)
+
+    assert run(rename()).renamed == 2
+    assert _grams(db, files[0].id) == index_grams("invoice-01.pdf")
+    assert _grams(db, files[2].id) == index_grams("notes.txt")
+    assert _search(run, user.id, "scan") == []
+    assert _search(run, user.id, "invoice") == ["invoice-01.pdf", "invoice-02.pdf"]
+
+
+def test_the_index_follows_deletes(db, run, user, upload):
+    single, *bulk = [upload(name) for name in ("report.txt", "report-a.tmp", "report-b.tmp")]
+
+    async def delete():
+        async with AsyncSessionLocal() as session:
+            await delete_file_service(single.id, user.id, session)
+        tasks = BackgroundTasks()
+        async with AsyncSessionLocal() as session:
+            await bulk_delete_files_service(user.id, FileFilter(name_pattern="*.tmp"), session, tasks)
+        await tasks()
+
+    run(delete())
+    for file in (single, *bulk):
+        assert _grams(db, file.id) == set()
+    assert _search(run, user.id, "report") == []
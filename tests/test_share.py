@@ -0,0 +1,96 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from models.share import ShareRevocation
+from schemas.file import SharePermission
+from services import share
+from services.share import ShareDenylist, sign_share_token, verify_share_token
+
+
+@pytest.fixture(autouse=True)
+def denylist(monkeypatch):
+    denylist = ShareDenylist()
+    monkeypatch.setattr(share, "share_denylist", denylist)
+    return denylist
+
+
+def _sign(file_id=1, expires_in=60, permissions=(SharePermission.download,)):
+    return sign_share_token(
+        file_id, "uploads/ab/cd/abcd", "report é.pdf", "application/pdf", 1234, '"abcd"',
+        datetime(2024, 1, 1, 12, 0), datetime.now() + timedelta(seconds=expires_in), list(permissions)
+    )
+
+
+def _claims(share_id, file_id):
+    return share.ShareClaims(share_id, file_id, "", "", "", 0, "", datetime.now(), int(time.time() * 1000),
+                             int(time.time()) + 60, "d")
+
+
+def _status(token, permission=SharePermission.download):
+    with pytest.raises(HTTPException) as error:
+        verify_share_token(token, permission)
+    return error.value.status_code
+
+
+def test_valid_token_returns_its_claims():
+    share_id, token = _sign()
+    claims = verify_share_token(token, SharePermission.download)
+    assert claims.share_id == share_id
+    assert (claims.file_id, claims.key, claims.filename) == (1, "uploads/ab/cd/abcd", "report é.pdf")
+    assert (claims.media_type, claims.file_size, claims.etag) == ("application/pdf", 1234, '"abcd"')
+
+
+def test_tampered_tokens_are_rejected():
+    _, token = _sign()
+    payload, _, signature = token.partition(".")
+    _, other = _sign(file_id=2)
+    assert _status(f"{other.partition('.')[0]}.{signature}") == 404
+    assert _status(f"{payload}.{signature[:-2]}AA") == 404
+    assert _status(payload) == 404
+    assert _status("") == 404
+
+
+def test_expired_token_is_gone():
+    _, token = _sign(expires_in=-1)
+    assert _status(token) == 410
+
+
+def test_token_only_allows_its_permissions():
+    _, token = _sign(permissions=(SharePermission.thumbnail,))
+    assert verify_share_token(token, SharePermission.thumbnail)
+    assert _status(token, SharePermission.download) == 403
+
+
+def test_revoking_one_link_leaves_the_others(denylist):
+    share_id, token = _sign()
+    _, other = _sign()
+    denylist.add(1, share_id, int(time.time() * 1000), time.time() + 60)
+    assert _status(token) == 410
+    assert verify_share_token(other, SharePermission.download)
+
+
+def test_revoking_a_file_only_affects_links_issued_before(denylist):
+    _, token = _sign()
+    denylist.add(1, None, int(time.time() * 1000), time.time() + 60)
+    time.sleep(0.002)
+    _, later = _sign()
+    assert _status(token) == 410
+    assert verify_share_token(later, SharePermission.download)
+
+
+def test_sync_picks_up_revocations_committed_out_of_id_order(db, denylist):
+    expires_date = datetime.now() + timedelta(hours=1)
+    db.add(ShareRevocation(id=1002, file_id=10, share_id="later-id", revoked_at=1, expires_date=expires_date))
+    db.commit()
+    denylist.sync(db)
+    db.add(ShareRevocation(id=1001, file_id=10, share_id="earlier-id", revoked_at=1, expires_date=expires_date))
+    db.add(ShareRevocation(id=1003, file_id=11, share_id="expired", revoked_at=1,
+                           expires_date=datetime.now() - timedelta(hours=1)))
+    db.commit()
+    denylist.sync(db)
+    assert denylist.is_revoked(_claims("earlier-id", 10))
+    assert denylist.is_revoked(_claims("later-id", 10))
+    assert not denylist.is_revoked(_claims("expired", 11))
@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from models.blob import Blob
+from models.file import File
+from models.user import User
+from services.storage import (acquire_blob, blob_path, check_stored_contents, find_live_blob, release_blob,
+                              release_blobs, remove_unused_blobs, store_staged_file, stored_file_exists)
+
+
+def _store(content: bytes) -> str:
+    digest = hashlib.sha256(content).hexdigest()
+    temp_location = os.path.join("uploads", f".{uuid.uuid4().hex}.part")
+    with open(temp_location, "wb") as target:
+        target.write(content)
+    store_staged_file(temp_location, digest)
+    return digest
+
+
+def _content() -> bytes:
+    return uuid.uuid4().bytes * 4
+
+
+def _ref_count(db, blob_id):
+    db.expire_all()
+    blob = db.get(Blob, blob_id)
+    return None if blob is None else blob.ref_count
+
+
+def test_uploads_of_the_same_content_share_one_blob(db, workdir):
+    digest = _store(_content())
+    first = acquire_blob(db, digest, 64, stored=True)
+    second = acquire_blob(db, digest, 64, stored=False)
+    db.commit()
+    assert first.id == second.id
+    assert first.file_path == blob_path(digest)
+    assert _ref_count(db, first.id) == 2
+
+
+def test_acquiring_content_that_was_not_stored_needs_a_blob(db, workdir):
+    with pytest.raises(HTTPException) as error:
+        acquire_blob(db, hashlib.sha256(_content()).hexdigest(), 64, stored=False)
+    assert error.value.status_code == 409
+
+
+def test_releasing_the_last_reference_leaves_a_tombstone(db, workdir):
+    digest = _store(_content())
+    blob = acquire_blob(db, digest, 64, stored=True)
+    acquire_blob(db, digest, 64, stored=False)
+    db.commit()
+
+    assert not release_blob(db, blob)
+    assert release_blob(db, blob)
+    db.commit()
+    assert _ref_count(db, blob.id) == 0
+    assert find_live_blob(db, digest) is None
+    assert stored_file_exists(blob_path(digest))
+
+    remove_unused_blobs([blob.id])
+    assert _ref_count(db, blob.id) is None
+    assert not stored_file_exists(blob_path(digest))
+
+
+def test_cleanup_spares_a_tombstone_revived_by_an_upload(db, workdir):
+    content = _content()
+    digest = _store(content)
+    blob = acquire_blob(db, digest, 64, stored=True)
+    db.commit()
+    assert release_blob(db, blob)
+    db.commit()
+
+    # The same content is uploaded again before the cleanup runs
+    revived = acquire_blob(db, _store(content), 64, stored=True)
+    db.commit()
+    assert revived.id == blob.id
+
+    remove_unused_blobs([blob.id])
+    assert _ref_count(db, blob.id) == 1
+    assert stored_file_exists(blob_path(digest))
+
+
+def test_release_blobs_returns_the_blobs_left_unused(db, workdir):
+    user = User(username=uuid.uuid4().hex, email=f"{uuid.uuid4().hex}@example.com", password="-")
+    db.add(user)
+    db.flush()
+    shared, single = _store(_content()), _store(_content())
+    files = []
+    for digest in (shared, shared, single):
+        blob = acquire_blob(db, digest, 64, stored=True)
+        files.append(File(filename="a.txt", file_path=blob.file_path, upload_date=datetime.now(), file_size=64,
+                          file_type="text/plain", user_id=user.id, blob_id=blob.id))
+    db.add_all(files)
+    db.commit()
+
+    unused = release_blobs(db, [files[0].id, files[2].id])
+    db.commit()
+    assert unused == [files[2].blob_id]
+    assert _ref_count(db, files[0].blob_id) == 1
+
+
+def test_check_stored_contents_reports_removed_content(workdir):
+    digest = _store(_content())
+    asyncio.run(check_stored_contents([blob_path(digest)]))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(check_stored_contents([blob_path(digest), blob_path("0" * 64)]))
+    assert error.value.status_code == 409
@@ -0,0 +1,121 @@
+import os
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+from fastapi.testclient import TestClient
+
+from schemas.file import SharePermission
+from services import storage
+from services.share import sign_share_token
+from utils.file_response import content_disposition
+from utils.storage_backend import LocalStorageBackend, S3StorageBackend, create_storage_backend
+
+moto = pytest.importorskip("moto")
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def s3(monkeypatch, tmp_path):
+    for name, value in {"AWS_ACCESS_KEY_ID": "test", "AWS_SECRET_ACCESS_KEY": "test",
+                        "AWS_DEFAULT_REGION": "us-east-1"}.items():
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        backend = S3StorageBackend(
+            "s3://files/stored", region="us-east-1", multipart_threshold=5 * MB, multipart_chunk_size=5 * MB
+        )
+        backend._client.create_bucket(Bucket="files")
+        yield backend
+
+
+def _staged(tmp_path, content: bytes) -> str:
+    location = tmp_path / f"{os.urandom(8).hex()}.part"
+    location.write_bytes(content)
+    return str(location)
+
+
+def _etag(s3, key):
+    return s3._client.head_object(Bucket="files", Key=f"stored/{key}")["ETag"].strip('"')
+
+
+def test_urls_choose_the_backend():
+    assert isinstance(create_storage_backend(None), LocalStorageBackend)
+    with pytest.raises(ValueError):
+        create_storage_backend("ftp://files")
+    with pytest.raises(ValueError):
+        S3StorageBackend("s3://")
+
+
+def test_small_files_are_stored_in_one_request(s3, tmp_path):
+    content = os.urandom(MB)
+    source = _staged(tmp_path, content)
+    s3.store(source, "ab/cd/small")
+
+    assert not os.path.exists(source)
+    assert "-" not in _etag(s3, "ab/cd/small")
+    with s3.open("ab/cd/small") as stored:
+        assert stored.read() == content
+
+
+def test_large_files_are_stored_in_parts(s3, tmp_path):
+    content = os.urandom(11 * MB)
+    s3.store(_staged(tmp_path, content), "ab/cd/large")
+
+    assert _etag(s3, "ab/cd/large").endswith("-3")
+    target = str(tmp_path / "download")
+    s3.download("ab/cd/large", target)
+    with open(target, "rb") as downloaded:
+        assert downloaded.read() == content
+
+
+def test_missing_and_deleted_keys(s3, tmp_path):
+    s3.store(_staged(tmp_path, b"content"), "ab/cd/key")
+    assert s3.exists("ab/cd/key")
+    assert s3.local_path("ab/cd/key") is None
+
+    s3.delete("ab/cd/key")
+    s3.delete("ab/cd/key")
+    assert not s3.exists("ab/cd/key")
+    with pytest.raises(FileNotFoundError):
+        s3.open("ab/cd/key")
+    with pytest.raises(FileNotFoundError):
+        s3.download("ab/cd/key", str(tmp_path / "download"))
+
+
+def test_presigned_urls_carry_the_response_headers(s3, tmp_path):
+    s3.store(_staged(tmp_path, b"report"), "ab/cd/report")
+    url = s3.presigned_url("ab/cd/report", content_disposition("report é.pdf"), "application/pdf", 60)
+
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    assert (parsed.netloc, parsed.path) == ("files.s3.amazonaws.com", "/stored/ab/cd/report")
+    assert "X-Amz-Signature" in query
+    assert query["X-Amz-Expires"] == ["60"]
+    assert query["response-content-type"] == ["application/pdf"]
+    assert query["response-content-disposition"] == [content_disposition("report é.pdf")]
+
+    response = requests.get(url)
+    assert response.status_code == 200
+    assert response.content == b"report"
+
+
+def test_downloads_redirect_to_a_presigned_url(s3, tmp_path, monkeypatch):
+    from app.main import app
+
+    monkeypatch.setattr(storage, "storage_backend", s3)
+    s3.store(_staged(tmp_path, b"%PDF-1.4"), "ab/cd/abcd")
+    _, token = sign_share_token(
+        1, "ab/cd/abcd", "report.pdf", "application/pdf", 8, '"abcd"', datetime(2024, 1, 1),
+        datetime.now() + timedelta(minutes=5), [SharePermission.download]
+    )
+
+    client = TestClient(app, follow_redirects=False)
+    response = client.get(f"/file/public/{token}")
+    assert response.status_code == 307
+    assert response.headers["cache-control"] == "no-store"
+    assert requests.get(response.headers["location"]).content == b"%PDF-1.4"
+
+    response = client.get(f"/file/public/{token}", headers={"if-none-match": '"abcd"'})
+    assert response.status_code == 304
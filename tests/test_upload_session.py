@@ -0,0 +1,146 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select
+
+from db.session import AsyncSessionLocal
+from models.upload_session import UploadSession, UploadSessionChunk
+from schemas.upload_session import UploadSessionCreate
+from services import file as file_service
+from services.upload_session import (MIN_CHUNK_SIZE, _session_part_path, abort_upload_session_service,
+                                     complete_upload_session_service, create_upload_session_service,
+                                     purge_stale_upload_sessions, upload_chunk_service)
+
+
+def _content() -> bytes:
+    return os.urandom(2 * MIN_CHUNK_SIZE + 1000)  # three chunks, the last one short
+
+
+async def _stream(data: bytes):
+    for offset in range(0, len(data), 64 * 1024):
+        yield data[offset:offset + 64 * 1024]
+
+
+async def _create(user_id: int, content: bytes) -> str:
+    async with AsyncSessionLocal() as db:
+        session = await create_upload_session_service(user_id, UploadSessionCreate(
+            filename="notes.txt", file_type="text/plain", file_size=len(content), chunk_size=MIN_CHUNK_SIZE
+        ), db)
+    return session.id
+
+
+async def _send(user_id: int, session_id: str, content: bytes, index: int, data: bytes = None):
+    if data is None:
+        data = content[index * MIN_CHUNK_SIZE:(index + 1) * MIN_CHUNK_SIZE]
+    async with AsyncSessionLocal() as db:
+        return await upload_chunk_service(session_id, index, user_id, _stream(data), db)
+
+
+async def _complete(user_id: int, session_id: str):
+    async with AsyncSessionLocal() as db:
+        return await complete_upload_session_service(session_id, user_id, db)
+
+
+async def _rows(session_id: str):
+    async with AsyncSessionLocal() as db:
+        sessions = await db.scalar(select(func.count()).where(UploadSession.id == session_id))
+        chunks = await db.scalar(select(func.count()).where(UploadSessionChunk.session_id == session_id))
+    return sessions, chunks
+
+
+def _status(run, coroutine) -> int:
+    with pytest.raises(HTTPException) as error:
+        run(coroutine)
+    return error.value.status_code
+
+
+def test_chunks_sent_in_any_order_complete_to_the_content(run, user, workdir):
+    content = _content()
+    session_id = run(_create(user.id, content))
+
+    for index in (2, 0, 0, 1):  # out of order, chunk 0 sent twice
+        session = run(_send(user.id, session_id, content, index))
+    assert session.total_chunks == 3
+    assert session.received_chunks == [0, 1, 2]
+
+    db_file = run(_complete(user.id, session_id))
+    assert db_file.file_size == len(content)
+    assert os.path.basename(db_file.file_path) == hashlib.sha256(content).hexdigest()
+    with open(db_file.file_path, "rb") as stored:
+        assert stored.read() == content
+    assert run(_rows(session_id)) == (0, 0)
+    assert not os.path.exists(_session_part_path(session_id))
+
+
+def test_a_session_completes_once(run, user, workdir):
+    content = _content()
+    session_id = run(_create(user.id, content))
+    for index in range(3):
+        run(_send(user.id, session_id, content, index))
+    run(_complete(user.id, session_id))
+
+    assert _status(run, _complete(user.id, session_id)) == 404
+
+
+def test_chunks_of_the_wrong_size_are_rejected(run, user, workdir):
+    content = _content()
+    session_id = run(_create(user.id, content))
+
+    assert _status(run, _send(user.id, session_id, content, 0, content[:MIN_CHUNK_SIZE - 1])) == 400
+    assert _status(run, _send(user.id, session_id, content, 2, content[:MIN_CHUNK_SIZE])) == 400
+    assert _status(run, _send(user.id, session_id, content, 3, b"")) == 400
+    assert run(_rows(session_id)) == (1, 0)
+    assert _status(run, _complete(user.id, session_id)) == 409
+
+
+def test_a_failed_completion_hands_the_session_back(run, user, workdir, monkeypatch):
+    content = _content()
+    session_id = run(_create(user.id, content))
+    for index in range(3):
+        run(_send(user.id, session_id, content, index))
+
+    def unavailable(*args):
+        raise HTTPException(status_code=503, detail="Storage unavailable")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(file_service, "acquire_blob", unavailable)
+        assert _status(run, _complete(user.id, session_id)) == 503
+    assert run(_rows(session_id)) == (1, 3)
+
+    db_file = run(_complete(user.id, session_id))
+    with open(db_file.file_path, "rb") as stored:
+        assert stored.read() == content
+
+
+def test_abort_removes_the_chunks_and_the_part_file(run, user, workdir):
+    content = _content()
+    session_id = run(_create(user.id, content))
+    run(_send(user.id, session_id, content, 1))
+
+    async def abort():
+        async with AsyncSessionLocal() as db:
+            await abort_upload_session_service(session_id, user.id, db)
+
+    run(abort())
+    assert run(_rows(session_id)) == (0, 0)
+    assert not os.path.exists(_session_part_path(session_id))
+    assert _status(run, _send(user.id, session_id, content, 0)) == 404
+
+
+def test_purge_removes_stale_sessions_with_their_part_files(run, db, user, workdir):
+    content = _content()
+    stale_id, fresh_id = run(_create(user.id, content)), run(_create(user.id, content))
+    run(_send(user.id, stale_id, content, 0))
+    db.query(UploadSession).filter(UploadSession.id == stale_id).update(
+        {UploadSession.updated_date: datetime.now() - timedelta(days=2)}
+    )
+    db.commit()
+
+    assert purge_stale_upload_sessions(db) == 1
+    assert run(_rows(stale_id)) == (0, 0)
+    assert not os.path.exists(_session_part_path(stale_id))
+    assert run(_rows(fresh_id)) == (1, 0)
+    assert os.path.exists(_session_part_path(fresh_id))
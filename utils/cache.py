@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional
+
+
+class TTLCache:
+    """
+    A thread-safe in-process cache with least-recently-used eviction and per-entry expiry.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else min(ttl, self.ttl))
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskLRUCache:
+    """
+    Files in a directory, bounded in total size by evicting the least recently used ones.
+    Recency is kept in memory and in the files' modification times, so it survives restarts.
+    Each process only accounts for the files it has seen, so with several workers sharing
+    the directory the bound holds per worker.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._size += size
+        self._remove(self._evict())
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    # A location in the cache directory to write a new entry to before adding it
+    def temp_path(self, name: str) -> str:
+        return os.path.join(self.directory, f".{uuid.uuid4().hex}.{name}")
+
+    # Returns the path of a cached file, marking it as recently used, or None
+    def get(self, name: str) -> Optional[str]:
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another process sharing the directory
+            self._forget(name)
+            return None
+        return path
+
+    # Moves the file at temp_location into the cache as `name` and returns its path
+    def add(self, name: str, temp_location: str) -> str:
+        path = self.path(name)
+        os.replace(temp_location, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._size += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            evicted = self._evict()
+        self._remove(evicted)
+        return path
+
+    def _forget(self, name: str) -> None:
+        with self._lock:
+            self._size -= self._entries.pop(name, 0)
+
+    # Drops the least recently used entries, never the newest, until the total fits
+    def _evict(self) -> List[str]:
+        evicted = []
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            evicted.append(name)
+        return evicted
+
+    def _remove(self, names: List[str]) -> None:
+        for name in names:
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CacheBackend:
+    """
+    A cache shared between worker processes. Values are bytes; keys are strings. Calls are
+    coroutines, as a shared cache is a network round trip away.
+    """
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Stand-in for a shared backend within a single process, for development and tests.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self._cache = TTLCache(max_entries, ttl=float("inf"))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        self._cache.set(key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        self._cache.delete(key)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Shared backend on a Redis server, through the asyncio client of the `redis` package.
+    Connections are opened on first use, on the event loop of the process.
+    """
+
+    def __init__(self, url: str):
+        from redis.asyncio import Redis
+
+        self._client = Redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        await self._client.set(key, value, ex=ttl)
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(key)
+
+
+def create_cache_backend(url: Optional[str]) -> Optional[CacheBackend]:
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return MemoryCacheBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCacheBackend(url)
+    raise ValueError(f"Unsupported cache backend URL: {url}")
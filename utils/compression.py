@@ -0,0 +1,83 @@
+import gzip
+import shutil
+from typing import Callable, Dict, NamedTuple, Optional
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class Encoder(NamedTuple):
+    extension: str
+    open_writer: Callable  # binary file -> writable stream that compresses into it
+
+
+def _gzip_writer(target):
+    # No name or time in the header, so the output only depends on the input
+    return gzip.GzipFile(filename="", mode="wb", fileobj=target, compresslevel=9, mtime=0)
+
+
+# Content codings we can produce, in order of preference. gzip is always available;
+# brotli and zstd when the optional `brotli` and `zstandard` packages are installed.
+ENCODERS: Dict[str, Encoder] = {}
+
+try:
+    import zstandard
+except ImportError:
+    pass
+else:
+    ENCODERS["zstd"] = Encoder("zst", lambda target: zstandard.ZstdCompressor(level=12).stream_writer(target))
+
+try:
+    import brotli
+except ImportError:
+    pass
+else:
+    class _BrotliWriter:
+        def __init__(self, target):
+            self._target = target
+            self._compressor = brotli.Compressor(quality=9)
+
+        def write(self, data: bytes) -> None:
+            self._target.write(self._compressor.process(data))
+
+        def close(self) -> None:
+            self._target.write(self._compressor.finish())
+
+    ENCODERS["br"] = Encoder("br", _BrotliWriter)
+
+ENCODERS["gzip"] = Encoder("gz", _gzip_writer)
+
+
+# Picks the coding to send for an Accept-Encoding header: the one the client weighs
+# highest, and among those the one we prefer. None means the content is sent as it is.
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip().lower()] = weight
+    wildcard = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for encoding in ENCODERS:
+        weight = weights.get(encoding, wildcard)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+# Writes `source` compressed with `encoding` to `target`
+def compress_file(source: str, target: str, encoding: str) -> None:
+    with open(source, "rb") as reader, open(target, "wb") as output:
+        writer = ENCODERS[encoding].open_writer(output)
+        try:
+            shutil.copyfileobj(reader, writer, COPY_CHUNK_SIZE)
+        finally:
+            writer.close()
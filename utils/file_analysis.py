@@ -0,0 +1,134 @@
+import hashlib
+import zipfile
+from typing import Optional
+from PIL import Image
+
+# Content checks run on stored files after upload. Like utils.thumbnail this may run in
+# a worker process, so it imports nothing from the app.
+
+READ_CHUNK_SIZE = 1024 * 1024
+SNIFF_BYTES = 64 * 1024
+
+# Stand-in for a malware scanner: signatures searched for anywhere in the content. The
+# EICAR string is the industry-standard harmless test file every scanner detects.
+SIGNATURES = {
+    "EICAR-Test-File": b"X5O!P%@AP[4\\PZX54(P^)7CC)7}$EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*",
+}
+SIGNATURE_OVERLAP = max(len(signature) for signature in SIGNATURES.values()) - 1
+
+OLE_TYPES = {"application/msword", "application/vnd.ms-excel", "application/vnd.ms-powerpoint"}
+TEXT_TYPES = {"text/plain", "text/csv"}
+OOXML_TYPES = {
+    "word/": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "xl/": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "ppt/": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+def _looks_like_text(sample: bytes) -> bool:
+    if b"\x00" in sample:
+        return False
+    control = sum(1 for byte in sample if byte < 32 and byte not in b"\t\n\r\f\b")
+    return control <= len(sample) // 100
+
+
+def _ooxml_type(path: str) -> str:
+    try:
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+    except zipfile.BadZipFile:
+        return "application/octet-stream"
+    for prefix, media_type in OOXML_TYPES.items():
+        if any(name.startswith(prefix) for name in names):
+            return media_type
+    return "application/zip"
+
+
+# Media type from the content's magic numbers. Formats that cannot be told apart from
+# their header alone (CSV from plain text, the legacy Office formats from each other)
+# keep the declared type when it belongs to the detected family.
+def sniff_type(path: str, sample: bytes, declared: str) -> Optional[str]:
+    if not sample:
+        return None
+    if sample.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if sample.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if sample.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if sample.startswith(b"%PDF-"):
+        return "application/pdf"
+    if sample[4:8] == b"ftyp":
+        return "video/mp4"
+    if sample.startswith(b"RIFF") and sample[8:12] == b"AVI ":
+        return "video/x-msvideo"
+    if sample.startswith(b"PK\x03\x04"):
+        return _ooxml_type(path)
+    if sample.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        return declared if declared in OLE_TYPES else "application/x-ole-storage"
+    if sample.startswith(b"MZ"):
+        return "application/x-msdownload"
+    if _looks_like_text(sample):
+        return declared if declared in TEXT_TYPES else "text/plain"
+    return "application/octet-stream"
+
+
+def _extract_metadata(path: str, media_type: Optional[str], sample: bytes, line_count: int) -> dict:
+    metadata = {}
+    if media_type in ("image/jpeg", "image/png", "image/gif"):
+        # Only the header is read
+        with Image.open(path) as image:
+            metadata.update(width=image.width, height=image.height, mode=image.mode)
+            if getattr(image, "n_frames", 1) > 1:
+                metadata["frames"] = image.n_frames
+    elif media_type == "application/pdf":
+        metadata["pdf_version"] = sample[5:8].decode("ascii", "replace")
+    elif media_type in TEXT_TYPES:
+        metadata["lines"] = line_count
+        try:
+            sample.decode("utf-8")
+            metadata["encoding"] = "utf-8"
+        except UnicodeDecodeError as e:
+            # A sample cut in the middle of a character is still UTF-8
+            metadata["encoding"] = "utf-8" if e.start >= len(sample) - 3 else "unknown"
+    return metadata
+
+
+# Reads the file once to verify its digest, count lines and scan it, then sniffs its type
+# and extracts metadata. Raises ChecksumMismatch when the stored bytes are not the ones
+# that were uploaded.
+def analyze_file(path: str, expected_digest: Optional[str], declared_type: str) -> dict:
+    hasher = hashlib.sha256()
+    threat = None
+    line_count = 0
+    size = 0
+    tail = last = b""
+    with open(path, "rb") as source:
+        sample = source.read(SNIFF_BYTES)
+        chunk = sample
+        while chunk:
+            hasher.update(chunk)
+            size += len(chunk)
+            line_count += chunk.count(b"\n")
+            last = chunk[-1:]
+            if threat is None:
+                window = tail + chunk
+                threat = next((name for name, signature in SIGNATURES.items() if signature in window), None)
+                tail = window[-SIGNATURE_OVERLAP:]
+            chunk = source.read(READ_CHUNK_SIZE)
+    digest = hasher.hexdigest()
+    if expected_digest is not None and digest != expected_digest:
+        raise ChecksumMismatch(f"Stored content hashes to {digest}, expected {expected_digest}")
+
+    detected_type = sniff_type(path, sample, declared_type)
+    if last not in (b"", b"\n"):
+        line_count += 1  # an unterminated last line
+    return {
+        "detected_type": detected_type,
+        "threat": threat,
+        "metadata": {"sha256": digest, "size": size, **_extract_metadata(path, detected_type, sample, line_count)},
+    }
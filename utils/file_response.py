@@ -0,0 +1,204 @@
+import os
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import AsyncIterator, List, Optional, Tuple
+from urllib.parse import quote
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, Response, StreamingResponse
+
+READ_CHUNK_SIZE = 64 * 1024
+MAX_RANGES = 16
+
+ByteRange = Tuple[int, int]  # inclusive start and end offsets
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def _parse_http_date(value: str) -> Optional[datetime]:
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _etag_matches(header: str, etag: str, weak: bool) -> bool:
+    if header.strip() == "*":
+        return True
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    if weak:
+        candidates = [candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates]
+    return etag in candidates
+
+
+def not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag, weak=True)
+    if_modified_since = _parse_http_date(request.headers.get("if-modified-since", ""))
+    if if_modified_since is not None:
+        return last_modified.astimezone(timezone.utc).replace(microsecond=0) <= if_modified_since
+    return False
+
+
+def _range_applies(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return _etag_matches(if_range, etag, weak=False)
+    if_range_date = _parse_http_date(if_range)
+    return if_range_date is not None and \
+        last_modified.astimezone(timezone.utc).replace(microsecond=0) == if_range_date
+
+
+# Parses a Range header against a representation of `size` bytes. Returns None when the
+# header should be ignored (malformed, or not worth honouring) and an empty list when none
+# of the ranges can be satisfied.
+def parse_range_header(header: str, size: int) -> Optional[List[ByteRange]]:
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs:
+        return None
+    ranges = []
+    for spec in specs.split(","):
+        start, sep, end = spec.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if start == "":
+                suffix = int(end)
+                if suffix == 0:
+                    continue
+                ranges.append((max(size - suffix, 0), size - 1))
+                continue
+            first = int(start)
+            last = int(end) if end else None
+        except ValueError:
+            return None
+        if last is not None and first > last:
+            return None
+        if first < size:
+            ranges.append((first, size - 1 if last is None else min(last, size - 1)))
+    if not ranges or size == 0:
+        return []
+
+    # Coalesce overlapping and adjacent ranges so a client cannot make us send bytes twice
+    ranges.sort()
+    merged = [ranges[0]]
+    for first, last in ranges[1:]:
+        if first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def _open_at(path: str, offset: int):
+    source = open(path, "rb")
+    source.seek(offset)
+    return source
+
+
+async def _iter_file_range(path: str, start: int, end: int) -> AsyncIterator[bytes]:
+    source = await run_in_threadpool(_open_at, path, start)
+    try:
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await run_in_threadpool(source.read, min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await run_in_threadpool(source.close)
+
+
+async def _iter_multipart_ranges(
+    path: str, ranges: List[ByteRange], parts: List[bytes], closing: bytes
+) -> AsyncIterator[bytes]:
+    for (start, end), part_header in zip(ranges, parts):
+        yield part_header
+        async for chunk in _iter_file_range(path, start, end):
+            yield chunk
+    yield closing
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+# Serves a stored file with ETag/Last-Modified validators, conditional GET and byte ranges
+# (including multipart/byteranges). Conditional requests are answered from the validators
+# alone, before the file is looked up on disk. `extra_headers` go on every response.
+def build_file_response(
+    request: Request,
+    path: str,
+    filename: str,
+    media_type: str,
+    etag: str,
+    last_modified: datetime,
+    extra_headers: Optional[dict] = None
+) -> Response:
+    headers = {
+        "etag": etag,
+        "last-modified": http_date(last_modified),
+        "accept-ranges": "bytes",
+        "cache-control": "private, no-cache",
+        **(extra_headers or {}),
+    }
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    range_header = request.headers.get("range")
+    if range_header is None or not _range_applies(request, etag, last_modified):
+        return FileResponse(path=path, filename=filename, media_type=media_type, headers=headers)
+
+    size = os.path.getsize(path)
+    ranges = parse_range_header(range_header, size)
+    if ranges is None:
+        return FileResponse(path=path, filename=filename, media_type=media_type, headers=headers)
+    if not ranges:
+        headers["content-range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    headers["content-disposition"] = content_disposition(filename)
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["content-range"] = f"bytes {start}-{end}/{size}"
+        headers["content-length"] = str(end - start + 1)
+        return StreamingResponse(
+            _iter_file_range(path, start, end), status_code=206, media_type=media_type, headers=headers
+        )
+
+    boundary = uuid.uuid4().hex
+    parts = [
+        (f"--{boundary}\r\nContent-Type: {media_type}\r\n"
+         f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n").encode("latin-1")
+        for start, end in ranges
+    ]
+    # Every part after the first starts on a new line
+    parts = [parts[0]] + [b"\r\n" + part for part in parts[1:]]
+    closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+    headers["content-length"] = str(
+        sum(len(part) for part in parts) + sum(end - start + 1 for start, end in ranges) + len(closing)
+    )
+    return StreamingResponse(
+        _iter_multipart_ranges(path, ranges, parts, closing),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers
+    )
@@ -0,0 +1,32 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(*values: Any) -> str:
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    encoded = base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode())
+    return encoded.decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, length: int) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != length:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+# Rows strictly after (value, last_id) in (column, id_column) order, written as an OR
+# rather than a row-value comparison so that MySQL can use the composite index range.
+def keyset_condition(column, id_column, value, last_id, descending: bool = False):
+    if descending:
+        return or_(column < value, and_(column == value, id_column < last_id))
+    return or_(column > value, and_(column == value, id_column > last_id))
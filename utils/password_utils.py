@@ -1,9 +1,58 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from fastapi import HTTPException
 from passlib.context import CryptContext
+from core.config import settings
+
+# Hashes at any other cost than PASSWORD_HASH_ROUNDS are flagged for an update, so
+# changing the setting migrates each account on its next successful login.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.PASSWORD_HASH_ROUNDS,
+    bcrypt__min_rounds=settings.PASSWORD_HASH_ROUNDS,
+    bcrypt__max_rounds=settings.PASSWORD_HASH_ROUNDS,
+)
+
+# bcrypt releases the GIL, so a few dedicated threads keep hashing off the event loop
+# without competing with the default threadpool used for file I/O. Work beyond the
+# workers plus PASSWORD_HASH_MAX_QUEUE waiting jobs is refused instead of queued.
+_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_MAX_QUEUE)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+async def _run_hashing(func, *args):
+    if not _slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=503,
+            detail="Too many authentication requests, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        future = _executor.submit(func, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    # The slot is freed when the work is done, even if the waiting request has gone away
+    future.add_done_callback(lambda _: _slots.release())
+    return await asyncio.wrap_future(future)
+
+
+async def hash_password(password: str) -> str:
+    return await _run_hashing(pwd_context.hash, password)
+
+
+# Returns whether the password matches and, when the stored hash was made at another cost,
+# a replacement hash for the caller to store.
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await _run_hashing(pwd_context.verify_and_update, plain_password, hashed_password)
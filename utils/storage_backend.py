@@ -0,0 +1,167 @@
+import os
+from typing import BinaryIO, Optional
+from urllib.parse import urlparse
+
+
+class StorageBackend:
+    """
+    Where stored content lives. Keys are '/'-separated relative paths. Content is staged on
+    local disk before it is stored, and methods raise FileNotFoundError for missing keys.
+    """
+
+    # Moves the local file at `source` to `key`, replacing what is stored there
+    def store(self, source: str, key: str) -> None:
+        raise NotImplementedError
+
+    def open(self, key: str) -> BinaryIO:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    # Deleting a missing key is not an error
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    # Copies the content of `key` to the local file `target`
+    def download(self, key: str, target: str) -> None:
+        raise NotImplementedError
+
+    # Path of the content on local disk, when the backend keeps it there
+    def local_path(self, key: str) -> Optional[str]:
+        return None
+
+    # A URL clients can fetch the content from without going through the server
+    def presigned_url(self, key: str, content_disposition: str, media_type: str, expires_in: int) -> Optional[str]:
+        return None
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Content in files on local disk, under `root`; keys are paths relative to it.
+    """
+
+    def __init__(self, root: str = ""):
+        self.root = root
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def store(self, source: str, key: str) -> None:
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        os.replace(source, path)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.local_path(key), "rb")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.local_path(key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def download(self, key: str, target: str) -> None:
+        with self.open(key) as source, open(target, "wb") as destination:
+            while chunk := source.read(1024 * 1024):
+                destination.write(chunk)
+
+
+class S3StorageBackend(StorageBackend):
+    """
+    Content in a bucket of S3 or an S3-compatible server (MinIO, Ceph, ...), from a URL
+    like s3://bucket/prefix. Large files are uploaded in parts, several at a time.
+    Credentials come from the usual AWS environment variables or files. Needs the
+    optional `boto3` package.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        multipart_threshold: int = 8 * 1024 * 1024,
+        multipart_chunk_size: int = 8 * 1024 * 1024,
+        max_concurrency: int = 8
+    ):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+            from botocore.exceptions import ClientError
+        except ImportError as e:
+            raise RuntimeError("The boto3 package is required for an s3:// storage backend") from e
+        parsed = urlparse(url)
+        if not parsed.netloc:
+            raise ValueError(f"No bucket in storage backend URL: {url}")
+        self.bucket = parsed.netloc
+        self.prefix = parsed.path.strip("/")
+        self._client_error = ClientError
+        # Enough connections for the parts of a few uploads at once
+        self._client = boto3.client(
+            "s3", endpoint_url=endpoint_url, region_name=region,
+            config=Config(signature_version="s3v4", max_pool_connections=max(10, max_concurrency * 4))
+        )
+        self._transfer = TransferConfig(
+            multipart_threshold=multipart_threshold, multipart_chunksize=multipart_chunk_size,
+            max_concurrency=max_concurrency, use_threads=True
+        )
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _missing(self, error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def store(self, source: str, key: str) -> None:
+        self._client.upload_file(source, self.bucket, self._key(key), Config=self._transfer)
+        os.remove(source)
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return self._client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+        except self._client_error as e:
+            if self._missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def exists(self, key: str) -> bool:
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as e:
+            if self._missing(e):
+                return False
+            raise
+        return True
+
+    def delete(self, key: str) -> None:
+        self._client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def download(self, key: str, target: str) -> None:
+        try:
+            self._client.download_file(self.bucket, self._key(key), target, Config=self._transfer)
+        except self._client_error as e:
+            if self._missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def presigned_url(self, key: str, content_disposition: str, media_type: str, expires_in: int) -> str:
+        # Signed locally, without a request to the server
+        return self._client.generate_presigned_url("get_object", ExpiresIn=expires_in, Params={
+            "Bucket": self.bucket,
+            "Key": self._key(key),
+            "ResponseContentDisposition": content_disposition,
+            "ResponseContentType": media_type,
+        })
+
+
+# Options are passed to the S3 backend
+def create_storage_backend(url: Optional[str], **options) -> StorageBackend:
+    if not url:
+        return LocalStorageBackend()
+    if url.startswith("s3://"):
+        return S3StorageBackend(url, **options)
+    raise ValueError(f"Unsupported storage backend URL: {url}")
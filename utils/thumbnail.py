@@ -0,0 +1,20 @@
+from PIL import Image, ImageOps
+
+# Runs in the rendition worker processes, so this module imports nothing from the app.
+
+JPEG_QUALITY = 85
+
+
+# Writes a copy of the image at `source`, scaled down to fit in size x size, to `target`
+def render_thumbnail(source: str, target: str, size: int, image_format: str) -> None:
+    with Image.open(source) as image:
+        # JPEGs are decoded at the smallest scale that still covers the thumbnail
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        if image_format == "JPEG":
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image.save(target, image_format, quality=JPEG_QUALITY, optimize=True)
+        else:
+            image.save(target, image_format, optimize=True)
@@ -0,0 +1,91 @@
+import io
+import zipfile
+from datetime import datetime
+from typing import AsyncIterator, BinaryIO, Callable, Iterable, NamedTuple, Tuple
+from starlette.concurrency import run_in_threadpool
+from logger.logger import logger
+
+READ_CHUNK_SIZE = 256 * 1024
+DOS_EPOCH = datetime(1980, 1, 1)  # the earliest time a ZIP entry can carry
+
+
+class ZipEntry(NamedTuple):
+    name: str  # path inside the archive
+    path: str  # file on disk, or the key passed to the opener
+    size: int
+    modified: datetime
+    compress: bool
+
+
+class _Sink(io.RawIOBase):
+    # Write-only target for ZipFile that cannot seek, so ZipFile writes each entry's CRC
+    # and sizes in a data descriptor after its data instead of patching the local header.
+    # What has been written is taken out after every chunk, so it never holds more than
+    # one chunk of the archive.
+    def __init__(self):
+        super().__init__()
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _date_time(value: datetime) -> Tuple[int, ...]:
+    return max(value, DOS_EPOCH).timetuple()[:6]
+
+
+def _open_local(path: str) -> BinaryIO:
+    return open(path, "rb")
+
+
+def _copy_chunk(source, target) -> bool:
+    chunk = source.read(READ_CHUNK_SIZE)
+    if chunk:
+        target.write(chunk)
+    return bool(chunk)
+
+
+# Builds a ZIP archive of `entries` while it is being sent. Reading and compressing run in
+# the threadpool one chunk at a time and each chunk is yielded as soon as it is ready.
+# Entries over 4 GB get ZIP64 extra fields, decided from their recorded size, and ZipFile
+# switches to ZIP64 end records on its own once the archive itself outgrows 4 GB.
+# Files are opened with `open_file`, and missing ones are left out, since the response has
+# already started.
+async def stream_zip(
+    entries: Iterable[ZipEntry], open_file: Callable[[str], BinaryIO] = _open_local
+) -> AsyncIterator[bytes]:
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, mode="w", allowZip64=True)
+    for entry in entries:
+        try:
+            source = await run_in_threadpool(open_file, entry.path)
+        except FileNotFoundError:
+            logger.warning(f"Left {entry.name} out of an archive: {entry.path} is missing")
+            continue
+        info = zipfile.ZipInfo(entry.name, date_time=_date_time(entry.modified))
+        info.compress_type = zipfile.ZIP_DEFLATED if entry.compress else zipfile.ZIP_STORED
+        info.file_size = entry.size
+        try:
+            with archive.open(info, mode="w") as target:
+                while await run_in_threadpool(_copy_chunk, source, target):
+                    if data := sink.take():
+                        yield data
+        finally:
+            await run_in_threadpool(source.close)
+        yield sink.take()
+    archive.close()
+    yield sink.take()